@@ -0,0 +1,261 @@
+"""
+Variante asincrona (ASGI) dell'API dei CV.
+
+Espone le stesse route e le stesse risposte di main.py per /api/cvs,
+/api/cvs/user/<email>, /api/cvs/suggest, /api/cvs/batch e /api/cache/stats:
+la logica è quella di cv_api.py, eseguita con run_async (vedi storage.py), e
+questo modulo esegue solo le letture, con aioboto3. Mentre una richiesta
+attende DynamoDB l'event loop serve le altre, così poche centinaia di
+ricerche concorrenti condividono pochi processi invece di occupare un thread
+ciascuna. Le letture indipendenti (blocchi di BatchGetItem, segmenti della
+Scan parallela) vengono eseguite come coroutine concorrenti.
+
+Avvio: hypercorn --bind 0.0.0.0:80 async_app:app (SERVER_MODE=async nel
+container). Con DYNAMODB_ENDPOINT_URL l'app punta a DynamoDB Local o a un
+server moto, senza accesso alla rete.
+"""
+
+import asyncio
+import os
+import time
+from contextlib import AsyncExitStack
+
+import aioboto3
+from aiobotocore.config import AioConfig
+from quart import Quart, Response, jsonify, request
+
+from aws_config import AWS_REGION, client_settings
+from cv_api import Stream, create_api
+from cv_text import expand_text, expand_texts
+from parallel_scan import segment_count, segment_timing
+from search_index import BATCH_GET_ATTEMPTS, BATCH_GET_SIZE, backoff_delay, chunked
+from static_assets import StaticSite, static_response
+from storage import (
+    BatchGet,
+    CacheGet,
+    CacheSet,
+    ExpandTexts,
+    GetItem,
+    ParallelScan,
+    ReadAll,
+    ReadPage,
+    run_async,
+)
+
+FRONTEND_BUILD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "out")
+
+app = Quart(__name__, static_folder=FRONTEND_BUILD_PATH)
+static_site = StaticSite(FRONTEND_BUILD_PATH)
+
+session = aioboto3.Session()
+resources = AsyncExitStack()
+
+# Versione dei dati, cache dei risultati e vocabolario dei suggerimenti,
+# configurati come in main.py
+api = create_api()
+
+
+@app.before_serving
+async def open_dynamodb():
+    """
+    Apre il resource DynamoDB asincrono, condiviso da tutte le richieste. Le
+    letture usano il suo client, che come in main.py converte i tipi Python.
+    """
+    dynamodb = await resources.enter_async_context(
+        session.resource(
+            "dynamodb",
+            region_name=AWS_REGION,
+            endpoint_url=os.environ.get("DYNAMODB_ENDPOINT_URL"),
+            # Stessi pool, retry e timeout del backend sincrono
+            config=AioConfig(**client_settings()),
+        )
+    )
+    app.client = dynamodb.meta.client
+
+
+@app.after_serving
+async def close_dynamodb():
+    await resources.aclose()
+
+
+async def batch_get(table_name, keys, **request_args):
+    """
+    BatchGetItem a blocchi di 100, con i blocchi letti in parallelo e le
+    UnprocessedKeys ripetute con backoff (vedi search_index.batch_get_chunk).
+    """
+
+    async def fetch(chunk):
+        items = []
+        request_items = {table_name: {"Keys": chunk, **request_args}}
+        for attempt in range(BATCH_GET_ATTEMPTS):
+            response = await app.client.batch_get_item(RequestItems=request_items)
+            items.extend(response["Responses"].get(table_name, []))
+            request_items = response.get("UnprocessedKeys")
+            if not request_items:
+                return items
+            await asyncio.sleep(backoff_delay(attempt))
+        raise RuntimeError(
+            f"BatchGetItem su {table_name}: chiavi non elaborate dopo "
+            f"{BATCH_GET_ATTEMPTS} tentativi"
+        )
+
+    chunks = await asyncio.gather(
+        *(fetch(chunk) for chunk in chunked(keys, BATCH_GET_SIZE))
+    )
+    return [item for chunk in chunks for item in chunk]
+
+
+async def iter_items(operation, first_page=None, **query_args):
+    """Itera sugli item di una Query o Scan, una pagina DynamoDB alla volta."""
+    operation = getattr(app.client, operation)
+    response = first_page or await operation(**query_args)
+    for item in response["Items"]:
+        yield item
+    while "LastEvaluatedKey" in response:
+        response = await operation(
+            ExclusiveStartKey=response["LastEvaluatedKey"], **query_args
+        )
+        for item in response["Items"]:
+            yield item
+
+
+async def parallel_scan(table_name, segments, **scan_args):
+    """Come parallel_scan.parallel_scan, con i segmenti letti come coroutine."""
+    segments = segment_count(segments)
+
+    async def scan_segment(segment):
+        started = time.perf_counter()
+        pages = 0
+        items = []
+        args = dict(scan_args, TableName=table_name)
+        args.update(Segment=segment, TotalSegments=segments)
+        while True:
+            response = await app.client.scan(**args)
+            items.extend(response["Items"])
+            pages += 1
+            if "LastEvaluatedKey" not in response:
+                break
+            args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        return items, segment_timing(segment, pages, len(items), started)
+
+    results = await asyncio.gather(*(scan_segment(s) for s in range(segments)))
+    items = [item for segment_items, _ in results for item in segment_items]
+    return items, [timing for _, timing in results]
+
+
+async def expand_texts_async(items):
+    """
+    Ricostruisce il campo "text" degli item (vedi cv_text.py). I testi su S3
+    sono letti dal client sincrono di cv_text.py in thread dell'executor, in
+    parallelo, così le letture da S3 non bloccano l'event loop; i testi
+    compressi nell'item sono solo decompressi.
+    """
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(
+        *(
+            loop.run_in_executor(None, expand_text, item)
+            for item in items
+            if "text_s3_uri" in item
+        )
+    )
+    return expand_texts(items)
+
+
+async def cache_call(method, *args):
+    """Le cache con I/O bloccante (Redis) sono usate da un thread."""
+    if api.result_cache.blocking:
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+    return method(*args)
+
+
+async def perform(operation):
+    """Esegue con aioboto3 un'operazione di storage.py (vedi storage.run_async)."""
+    if isinstance(operation, ReadPage):
+        return await getattr(app.client, operation.operation)(**operation.args)
+    if isinstance(operation, ReadAll):
+        return [
+            item async for item in iter_items(operation.operation, **operation.args)
+        ]
+    if isinstance(operation, GetItem):
+        return (await app.client.get_item(**operation.args)).get("Item", {})
+    if isinstance(operation, BatchGet):
+        return await batch_get(operation.table, operation.keys, **operation.args)
+    if isinstance(operation, ParallelScan):
+        return await parallel_scan(
+            operation.table, operation.segments, **operation.args
+        )
+    if isinstance(operation, ExpandTexts):
+        return await expand_texts_async(operation.items)
+    if isinstance(operation, CacheGet):
+        return await cache_call(api.result_cache.get, operation.key, operation.version)
+    if isinstance(operation, CacheSet):
+        return await cache_call(
+            api.result_cache.set, operation.key, operation.value, operation.version
+        )
+    raise TypeError(f"Operazione non supportata: {operation!r}")
+
+
+def ndjson_response(stream):
+    """Risposta in streaming NDJSON: un CV per riga, pagina dopo pagina."""
+
+    async def generate():
+        try:
+            items = iter_items(stream.operation, stream.first_page, **stream.args)
+            async for item in items:
+                await expand_texts_async([item])
+                yield app.json.dumps(item) + "\n"
+        except Exception as e:
+            # Gli header sono già stati inviati: si può solo troncare lo stream
+            print(f"Errore durante lo streaming dei CV: {str(e)}")
+
+    return Response(generate(), mimetype="application/x-ndjson", headers=stream.headers)
+
+
+async def respond(steps):
+    """Esegue un handler di cv_api.py e ne converte il risultato per Quart."""
+    reply = await run_async(steps, perform)
+    if isinstance(reply, Stream):
+        return ndjson_response(reply)
+    if reply.body is None:
+        return Response("", status=reply.status, headers=reply.headers)
+    return jsonify(reply.body), reply.status, reply.headers
+
+
+@app.route("/api/cvs", methods=["GET"])
+async def get_cvs():
+    """Stessi parametri e stessa risposta di main.get_cvs."""
+    return await respond(api.list_cvs(request))
+
+
+@app.route("/api/cvs/batch", methods=["POST"])
+async def get_cvs_batch():
+    """Stessi parametri e stessa risposta di main.get_cvs_batch."""
+    payload = await request.get_json(silent=True)
+    return await respond(api.batch_cvs(request, payload))
+
+
+@app.route("/api/cvs/suggest", methods=["GET"])
+async def suggest_terms():
+    """Stessi parametri e stessa risposta di main.suggest_terms."""
+    return await respond(api.suggest_terms(request))
+
+
+@app.route("/api/cvs/user/<string:email>", methods=["GET"])
+async def get_user_cvs(email):
+    """Stessi parametri e stessa risposta di main.get_user_cvs."""
+    return await respond(api.user_cvs(request, email))
+
+
+@app.route("/api/cache/stats", methods=["GET"])
+async def get_cache_stats():
+    """Statistiche della cache dei risultati (hit, miss, evizioni)."""
+    return jsonify({"results": api.result_cache.stats()}), 200
+
+
+@app.route("/", defaults={"path": ""})
+@app.route("/<path:path>")
+async def serve_frontend(path):
+    """Serve il frontend statico dal manifest condiviso con main.py."""
+    if path.startswith("api/"):
+        return {"error": "Not Found"}, 404
+    return static_response(static_site, path, request, Response)
@@ -0,0 +1,79 @@
+"""
+Configurazione condivisa dei client AWS del backend.
+
+Tutti i client e i resource sono creati da un'unica sessione boto3 con la
+stessa configurazione di botocore, regolabile con variabili d'ambiente:
+- AWS_MAX_POOL_CONNECTIONS: connessioni HTTP per client. Il default di
+  botocore (10) è minore dei thread di gunicorn moltiplicati per le letture
+  parallele di una richiesta (SCAN_MAX_WORKERS segmenti della Scan,
+  BATCH_GET_WORKERS blocchi di BatchGetItem), e le richieste oltre il limite
+  aprono e chiudono connessioni a ogni chiamata;
+- AWS_RETRY_MODE, AWS_MAX_ATTEMPTS: retry "adaptive", che oltre al backoff
+  limita lato client la frequenza delle chiamate quando DynamoDB risponde con
+  throttling; il limitatore è per client, quindi è efficace perché tutti i
+  thread condividono lo stesso client;
+- AWS_CONNECT_TIMEOUT, AWS_READ_TIMEOUT: timeout in secondi, molto più brevi
+  dei 60 s di default, così una connessione bloccata viene ritentata invece
+  di occupare un thread fino al timeout di gunicorn;
+- AWS_TCP_KEEPALIVE: keep-alive TCP sulle connessioni del pool.
+
+I client di basso livello di botocore sono thread-safe e vengono condivisi
+tra i thread; i resource non lo sono, e il backend usa il client del
+resource DynamoDB (dynamodb.meta.client), che converte già i tipi Python.
+
+Il modulo è incluso nello zip della Lambda di ingestione perché cv_text.py lo
+importa (vedi deploy_lambda.py), ma la Lambda non ne usa i client: il pool e
+i timeout sono dimensionati per gunicorn, e la Lambda passa a cv_text.py il
+proprio client S3.
+
+La regione è quella di AWS_REGION, impostata dal runtime della Lambda, o
+altrimenti REGION (il file .env degli script e del backend).
+"""
+
+import os
+
+import boto3
+from botocore.config import Config
+
+AWS_REGION = os.environ.get("AWS_REGION") or os.environ.get("REGION", "eu-west-2")
+
+# Thread della Scan parallela e dei blocchi di BatchGetItem di una richiesta
+SCAN_MAX_WORKERS = int(os.environ.get("SCAN_MAX_WORKERS", 8))
+BATCH_GET_WORKERS = int(os.environ.get("BATCH_GET_WORKERS", 8))
+
+# Letture parallele che una singola richiesta può avere in corso
+REQUEST_FAN_OUT = max(SCAN_MAX_WORKERS, BATCH_GET_WORKERS)
+
+
+def client_settings():
+    """Parametri di botocore.config.Config (usati anche per l'AioConfig)."""
+    threads = int(os.environ.get("GUNICORN_THREADS", 8))
+    return {
+        "region_name": AWS_REGION,
+        "max_pool_connections": int(
+            os.environ.get("AWS_MAX_POOL_CONNECTIONS", threads * REQUEST_FAN_OUT)
+        ),
+        "retries": {
+            "mode": os.environ.get("AWS_RETRY_MODE", "adaptive"),
+            "max_attempts": int(os.environ.get("AWS_MAX_ATTEMPTS", 5)),
+        },
+        "connect_timeout": float(os.environ.get("AWS_CONNECT_TIMEOUT", 2)),
+        "read_timeout": float(os.environ.get("AWS_READ_TIMEOUT", 10)),
+        "tcp_keepalive": os.environ.get("AWS_TCP_KEEPALIVE", "1") == "1",
+    }
+
+
+client_config = Config(**client_settings())
+
+# Sessione creata all'import: la creazione di client da una sessione non è
+# thread-safe, il loro uso sì
+session = boto3.session.Session(region_name=AWS_REGION)
+
+
+def dynamodb_resource():
+    return session.resource("dynamodb", config=client_config)
+
+
+def aws_client(service):
+    """Client di basso livello con la configurazione condivisa."""
+    return session.client(service, config=client_config)
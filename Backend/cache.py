@@ -0,0 +1,302 @@
+"""
+Cache dei risultati di ricerca e degli elenchi di CV.
+
+Le voci hanno una durata massima (TTL) e vengono scartate in ordine LRU quando
+la cache è piena. La cache è legata alla versione dei dati: la Lambda di
+ingestione incrementa un contatore in CVStats (stat_id = "version") a ogni CV
+scritto, e quando il backend vede cambiare il contatore le voci precedenti
+non vengono più usate.
+
+Se REDIS_URL è impostata (servizio redis dello stack Swarm) la cache è
+condivisa tra le repliche del backend e sopravvive ai rolling update; senza
+Redis, o se Redis non risponde, si usa la cache in-process.
+
+La lettura delle versioni è un generatore che produce la GetItem da eseguire
+(vedi storage.py), così vale sia per il backend sincrono sia per quello
+asincrono; le cache ricevono la versione da chi le usa.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # dipendenza opzionale
+    redis = None
+
+from storage import GetItem
+
+STATS_TABLE = "CVStats"
+VERSION_STAT_ID = "version"
+# Contatore per utente (stat_id = "user#<email>"), incrementato dalla Lambda
+# a ogni CV scritto per quell'utente
+USER_VERSION_PREFIX = "user#"
+
+
+def read_version(stat_id):
+    """Legge il contatore data_version di un item di CVStats."""
+    item = yield GetItem(
+        {
+            "TableName": STATS_TABLE,
+            "Key": {"stat_id": stat_id},
+            "ProjectionExpression": "data_version",
+        }
+    )
+    return int(item.get("data_version", 0))
+
+
+class DataVersion:
+    """
+    Legge il contatore di versione dei dati da CVStats, al più una volta
+    ogni `interval` secondi, così il controllo costa al massimo una GetItem
+    per intervallo indipendentemente dal numero di richieste. Mentre una
+    richiesta aggiorna il valore, le altre usano quello precedente.
+    """
+
+    def __init__(self, interval=1.0):
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._value = None
+        self._checked_at = 0.0
+        self._refreshing = False
+
+    def current(self):
+        with self._lock:
+            if self._value is not None and (
+                self._refreshing or time.monotonic() - self._checked_at < self._interval
+            ):
+                return self._value
+            self._refreshing = True
+        try:
+            value = yield from read_version(VERSION_STAT_ID)
+            with self._lock:
+                self._value = value
+                self._checked_at = time.monotonic()
+            return value
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+
+def read_user_version(email):
+    """Versione dei CV di un utente: una GetItem su CVStats, nessun CV letto."""
+    return (yield from read_version(f"{USER_VERSION_PREFIX}{email}"))
+
+
+def list_etag(path, version, args, ndjson=False):
+    """
+    ETag di un elenco di CV: cambia solo se cambia la versione dei dati o un
+    parametro della richiesta, quindi si calcola senza leggere i CV.
+    """
+    params = sorted(args.items(multi=True))
+    digest = hashlib.sha1(repr((path, version, params, ndjson)).encode())
+    return f'"{digest.hexdigest()[:20]}"'
+
+
+class ResultCache:
+    """
+    Cache LRU thread-safe con TTL e contatori di hit/miss. Le voci salvate
+    con una versione dei dati precedente a quella passata a get e set
+    vengono invalidate.
+    """
+
+    # Le operazioni non attendono I/O: il backend asincrono le esegue
+    # direttamente nell'event loop
+    blocking = False
+
+    def __init__(self, max_entries=1024, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._data_version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _apply_version(self, version):
+        if version != self._data_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._data_version = version
+
+    def get(self, key, version=None):
+        """Restituisce il valore in cache, o None se assente o scaduto."""
+        with self._lock:
+            self._apply_version(version)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, version=None):
+        with self._lock:
+            self._apply_version(version)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "data_version": self._data_version,
+            }
+
+
+def user_cache_key(email, args, user_version=None):
+    """Chiave di cache dell'elenco dei CV di un utente."""
+    params = ("limit", "cursor", "fields")
+    return (
+        "user",
+        email,
+        user_version,
+        tuple((p, args.get(p)) for p in params if p in args),
+    )
+
+
+# Parametri che, oltre ai termini, cambiano la risposta di una ricerca
+SEARCH_PARAMS = ("rank", "limit", "cursor", "fields", "snippets", "fuzzy")
+
+
+def search_cache_key(terms, args):
+    """
+    Chiave di cache di una ricerca: l'insieme normalizzato (ordinato, senza
+    duplicati) dei termini più i parametri che cambiano la risposta.
+    """
+    return (
+        tuple(sorted(set(terms))),
+        tuple((p, args.get(p)) for p in SEARCH_PARAMS if p in args),
+    )
+
+
+def query_cache_key(query, args):
+    """
+    Chiave di cache di una ricerca con 'q': la query compilata, quindi query
+    che differiscono solo per spazi o stopword condividono la voce.
+    """
+    return (
+        ("q", repr(query)),
+        tuple((p, args.get(p)) for p in SEARCH_PARAMS if p in args),
+    )
+
+
+class RedisResultCache:
+    """
+    Cache condivisa su Redis con la stessa interfaccia di ResultCache.
+    La versione dei dati fa parte della chiave, quindi un nuovo CV rende
+    invisibili le voci precedenti su tutte le repliche, che poi scadono per
+    TTL; l'evizione LRU è delegata a Redis (maxmemory-policy allkeys-lru).
+    Gli errori di Redis vengono assorbiti ripiegando sulla cache in-process.
+    """
+
+    # Chiamate di rete sincrone: il backend asincrono le esegue in un thread
+    blocking = True
+
+    def __init__(self, client, ttl=60.0, fallback=None, prefix="cvgram"):
+        self._client = client
+        self.ttl = ttl
+        self._fallback = fallback or ResultCache(ttl=ttl)
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _redis_key(self, key, version):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return f"{self._prefix}:v{version}:{digest}"
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key, version=None):
+        try:
+            raw = self._client.get(self._redis_key(key, version))
+        except redis.RedisError as e:
+            print(f"Cache Redis non disponibile, uso la cache locale: {e}")
+            self._count("errors")
+            return self._fallback.get(key, version)
+        if raw is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return json.loads(raw)
+
+    def set(self, key, value, version=None):
+        # Decimal (numeri di DynamoDB) serializzati come stringhe, come jsonify
+        raw = json.dumps(value, default=str)
+        try:
+            self._client.set(
+                self._redis_key(key, version), raw, ex=max(int(self.ttl), 1)
+            )
+        except redis.RedisError as e:
+            print(f"Cache Redis non disponibile, uso la cache locale: {e}")
+            self._count("errors")
+            self._fallback.set(key, value, version)
+
+    def clear(self):
+        self._fallback.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "redis",
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "errors": self.errors,
+                "fallback": self._fallback.stats(),
+            }
+
+
+def create_result_cache(redis_url=None, max_entries=1024, ttl=60.0):
+    """
+    Crea la cache dei risultati: condivisa su Redis se redis_url è impostato,
+    il pacchetto redis è installato e il server risponde, altrimenti
+    in-process.
+    """
+    local = ResultCache(max_entries=max_entries, ttl=ttl)
+    if not redis_url:
+        return local
+    if redis is None:
+        print("REDIS_URL impostata ma il pacchetto redis non è installato")
+        return local
+    try:
+        client = redis.Redis.from_url(
+            redis_url, socket_timeout=0.2, socket_connect_timeout=0.5
+        )
+        client.ping()
+    except redis.RedisError as e:
+        print(f"Redis non raggiungibile ({redis_url}), uso la cache locale: {e}")
+        return local
+    print(f"Cache condivisa su Redis: {redis_url}")
+    return RedisResultCache(client, ttl=ttl, fallback=local)
@@ -0,0 +1,507 @@
+"""
+Logica degli endpoint di elenco e ricerca dei CV, condivisa da main.py
+(Flask) e async_app.py (Quart).
+
+Ogni handler riceve la richiesta (args, path, headers e accept_mimetypes sono
+gli stessi oggetti di werkzeug nei due framework) ed è un generatore che
+produce le letture da eseguire (vedi storage.py); il valore restituito è una
+Reply (corpo JSON, stato e header; corpo None per il 304) oppure uno Stream
+(risposta NDJSON, di cui l'handler ha già letto la prima pagina così gli
+errori di DynamoDB diventano una risposta 500). I due server convertono il
+risultato nella risposta del proprio framework.
+"""
+
+import os
+from bisect import bisect_right
+from collections import namedtuple
+
+from boto3.dynamodb.conditions import Key
+
+from cache import (
+    DataVersion,
+    create_result_cache,
+    list_etag,
+    query_cache_key,
+    read_user_version,
+    search_cache_key,
+    user_cache_key,
+)
+from pagination import (
+    InvalidCursor,
+    cvs_body,
+    decode_cursor,
+    encode_cursor,
+    is_paginated,
+    page_limit,
+)
+from parallel_scan import server_timing
+from projection import InvalidFields, parse_fields, projection_args, snippet_fields
+from search_index import (
+    CV_TABLE,
+    InvalidCvIds,
+    find_matching_cv_ids,
+    get_cvs_by_ids,
+    parse_cv_ids,
+    rank_cv_ids,
+    top_k_bm25,
+)
+from search_query import (
+    And,
+    InvalidQuery,
+    Or,
+    Term,
+    combine,
+    execute_query,
+    parse_query,
+    query_tokens,
+)
+from static_assets import etag_matches
+from storage import CacheGet, CacheSet, ExpandTexts, ParallelScan, ReadAll, ReadPage
+from suggest import SuggestIndex, normalize_prefix, suggest_limit
+from text_processing import make_snippets, query_terms
+
+
+class Reply(namedtuple("Reply", "body status headers")):
+    """Risposta JSON di un handler; ogni risposta ha il suo dizionario di header."""
+
+    __slots__ = ()
+
+    def __new__(cls, body, status=200, headers=None):
+        return super().__new__(cls, body, status, headers or {})
+
+
+class Stream(namedtuple("Stream", "first_page operation args headers")):
+    """Risposta NDJSON: prima pagina della Query/Scan e argomenti per le altre."""
+
+    __slots__ = ()
+
+    def __new__(cls, first_page, operation, args, headers=None):
+        return super().__new__(cls, first_page, operation, args, headers or {})
+
+
+CVS_ERROR = "Si è verificato un errore durante il recupero dei CV"
+
+# Attributi della chiave di CVs e di EmailIndex, ripresi dal cursore
+CV_KEY_NAMES = {"cv_id"}
+EMAIL_INDEX_KEY_NAMES = {"cv_id", "email"}
+
+
+def wants_ndjson(request):
+    """
+    Il client chiede lo streaming con ?format=ndjson o con l'header
+    Accept: application/x-ndjson.
+    """
+    if request.args.get("format") == "ndjson":
+        return True
+    return request.accept_mimetypes.best == "application/x-ndjson"
+
+
+def bad_request(error):
+    """Risposta 400 per parametri di query non validi (cursore, campi)."""
+    return Reply(
+        {
+            "error": str(error),
+            "message": "I parametri della richiesta non sono validi",
+        },
+        400,
+    )
+
+
+def server_error(error, message=CVS_ERROR):
+    return Reply({"error": str(error), "message": message}, 500)
+
+
+def hydrate_cvs(cv_ids, fields, terms=None):
+    """
+    Legge i CV indicati proiettando solo i campi richiesti. Se vengono
+    passati i termini cercati, aggiunge a ogni CV il campo 'snippets' con i
+    frammenti di testo attorno alle occorrenze; il testo completo viene letto
+    per generarli ma restituito solo se richiesto esplicitamente.
+    """
+    read_fields = snippet_fields(fields) if terms else fields
+    results = yield from get_cvs_by_ids(cv_ids, **projection_args(read_fields))
+    yield ExpandTexts(results)
+    if terms:
+        for cv in results:
+            cv["snippets"] = make_snippets(cv.get("text", ""), terms)
+            if read_fields is not fields:
+                cv.pop("text", None)
+    return results
+
+
+def ranked_cv_ids(terms, query, limit):
+    """Migliori `limit` CV per BM25, da parole chiave o da una query 'q'."""
+    if query is None:
+        return (yield from rank_cv_ids(terms, limit))
+    corpus, dfs, matches = yield from execute_query(query)
+    return top_k_bm25(matches, dfs, corpus, limit)
+
+
+def matching_cv_ids(terms, query):
+    """cv_id ordinati dei CV trovati, da parole chiave o da una query 'q'."""
+    if query is None:
+        return (yield from find_matching_cv_ids(terms))
+    _, _, matches = yield from execute_query(query)
+    return sorted(matches)
+
+
+def search_cvs(args, terms, cursor, limit, fields, paginated, query=None):
+    """
+    Esegue una ricerca sull'indice invertito, per parole chiave (tutti i
+    termini obbligatori) o con una query compilata ('q'), e restituisce il
+    corpo della risposta (ordinato per rilevanza con 'rank=bm25').
+    """
+    snippet_terms = terms if args.get("snippets") == "1" else None
+
+    if args.get("rank") == "bm25":
+        # Il cursore della classifica è la posizione raggiunta
+        offset = cursor.get("offset", 0)
+        ranked, total = yield from ranked_cv_ids(terms, query, offset + limit)
+        ranked = ranked[offset:]
+        scores = dict(ranked)
+        results = yield from hydrate_cvs(
+            [cv_id for cv_id, _ in ranked], fields, snippet_terms
+        )
+        for cv in results:
+            cv["score"] = round(scores[cv["cv_id"]], 4)
+        next_cursor = None
+        if total > offset + limit:
+            next_cursor = encode_cursor({"offset": offset + limit})
+        return cvs_body("CV ordinati per rilevanza", results, paginated, next_cursor)
+
+    # Interseca le posting list dell'indice invertito e legge
+    # solo i CV trovati
+    cv_ids = yield from matching_cv_ids(terms, query)
+    next_cursor = None
+    if paginated:
+        # I cv_id sono ordinati: il cursore è l'ultimo restituito
+        start = bisect_right(cv_ids, cursor.get("after", ""))
+        if start + limit < len(cv_ids):
+            next_cursor = encode_cursor({"after": cv_ids[start + limit - 1]})
+        cv_ids = cv_ids[start : start + limit]
+    results = yield from hydrate_cvs(cv_ids, fields, snippet_terms)
+    return cvs_body(
+        "CVs filtrati recuperati con successo", results, paginated, next_cursor
+    )
+
+
+def page_body(message, operation, query_args, cursor, limit):
+    """Una sola pagina di Scan/Query, ripresa dalla chiave del cursore."""
+    query_args = dict(query_args, Limit=limit)
+    if cursor.get("key"):
+        query_args["ExclusiveStartKey"] = cursor["key"]
+    response = yield ReadPage(operation, query_args)
+    results = yield ExpandTexts(response["Items"])
+    return cvs_body(
+        message,
+        results,
+        True,
+        encode_cursor(
+            {"key": response["LastEvaluatedKey"]}
+            if "LastEvaluatedKey" in response
+            else None
+        ),
+    )
+
+
+def stream(operation, query_args):
+    """Legge la prima pagina di una risposta NDJSON."""
+    first_page = yield ReadPage(operation, query_args)
+    return Stream(first_page, operation, query_args)
+
+
+class CvApi:
+    """
+    Stato condiviso dalle richieste di un processo: versione dei dati, cache
+    dei risultati e vocabolario dei suggerimenti.
+    """
+
+    def __init__(self, data_version, result_cache, suggest_index, scan_segments=4):
+        self.data_version = data_version
+        self.result_cache = result_cache
+        self.suggest_index = suggest_index
+        self.scan_segments = scan_segments
+
+    def conditional(self, request, read_version, view):
+        """
+        GET condizionale per gli endpoint di elenco: l'ETag deriva dalla
+        versione dei dati letta da `read_version` e dai parametri della
+        richiesta. Se il client ha già la versione corrente risponde 304
+        senza leggere i CV né produrre il corpo. `view` riceve la versione.
+        """
+        try:
+            version = yield from read_version
+        except Exception as e:
+            # Senza versione la risposta viene servita senza ETag
+            print(f"Versione dei dati non disponibile: {str(e)}")
+            return (yield from view(None))
+        etag = list_etag(request.path, version, request.args, wants_ndjson(request))
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return Reply(None, 304, headers)
+        response = yield from view(version)
+        if isinstance(response, Stream) or response.status == 200:
+            response = response._replace(headers={**response.headers, **headers})
+        return response
+
+    def cached(self, key, version, compute):
+        """
+        Corpo in cache per la versione dei dati, altrimenti calcolato con il
+        generatore `compute` e salvato. Senza versione la cache non si usa.
+        """
+        if version is None:
+            return (yield from compute)
+        body = yield CacheGet(key, version)
+        if body is None:
+            body = yield from compute
+            yield CacheSet(key, body, version)
+        return body
+
+    def list_cvs(self, request):
+        """GET /api/cvs (vedi main.get_cvs)."""
+        return (
+            yield from self.conditional(
+                request,
+                self.data_version.current(),
+                lambda version: self.cvs(request, version),
+            )
+        )
+
+    def cvs(self, request, version):
+        args = request.args
+        try:
+            paginated = is_paginated(args)
+            cursor = decode_cursor(args.get("cursor"), CV_KEY_NAMES) or {}
+            limit = page_limit(args)
+            fields = parse_fields(args.get("fields"))
+
+            # Query con operatori, frasi e filtri (vedi search_query.py)
+            q = args.get("q", "").strip()
+            if q:
+                query = parse_query(q)
+                terms, _ = query_tokens(query)
+                body = yield from self.cached(
+                    query_cache_key(query, args),
+                    version,
+                    search_cvs(args, terms, cursor, limit, fields, paginated, query),
+                )
+                return Reply(body)
+
+            keywords = args.get("keywords", "")
+            if keywords:
+                # Dividi le parole chiave per virgola
+                keyword_list = keywords.lower().split(",")
+                keyword_list = [k.strip() for k in keyword_list if k.strip()]
+
+                if keyword_list:
+                    terms = query_terms(keyword_list)
+                    cache_version = version
+                    if args.get("fuzzy") == "1":
+                        vocabulary = yield from self.suggest_index.vocabulary(version)
+                        search = self.fuzzy_search_cvs(
+                            args, terms, vocabulary, cursor, limit, fields, paginated
+                        )
+                        # Le alternative di un vocabolario non ancora ricostruito
+                        # non restano in cache per tutta la nuova versione
+                        if vocabulary.version != version:
+                            cache_version = None
+                    else:
+                        search = search_cvs(
+                            args, terms, cursor, limit, fields, paginated
+                        )
+                    # Le ricerche ripetute (stessi termini, in qualsiasi
+                    # ordine) sono servite dalla cache finché i dati non cambiano
+                    body = yield from self.cached(
+                        search_cache_key(terms, args), cache_version, search
+                    )
+                    return Reply(body)
+
+                return Reply(
+                    cvs_body("CVs filtrati recuperati con successo", [], paginated)
+                )
+
+            scan_args = {"TableName": CV_TABLE, **projection_args(fields)}
+            if paginated:
+                body = yield from page_body(
+                    "CV recuperati con successo", "scan", scan_args, cursor, limit
+                )
+                return Reply(body)
+
+            if wants_ndjson(request):
+                return (yield from stream("scan", scan_args))
+
+            # Scan parallela a segmenti, con i tempi per segmento in Server-Timing
+            segments = args.get("segments", self.scan_segments, type=int)
+            results, timings = yield ParallelScan(
+                CV_TABLE, segments, projection_args(fields)
+            )
+            yield ExpandTexts(results)
+            return Reply(
+                cvs_body("Tutti i CV recuperati con successo", results),
+                200,
+                {"Server-Timing": server_timing(timings)},
+            )
+
+        except (InvalidCursor, InvalidFields, InvalidQuery) as e:
+            return bad_request(e)
+        except Exception as e:
+            return server_error(e)
+
+    def fuzzy_search_cvs(
+        self, args, terms, vocabulary, cursor, limit, fields, paginated
+    ):
+        """
+        Ricerca tollerante agli errori di battitura: ogni termine è sostituito
+        dai termini di `vocabulary` a distanza di edit limitata (trovati con
+        l'indice dei trigrammi, vedi suggest.py) e la ricerca diventa un AND
+        di OR eseguito sull'indice invertito. Il campo 'fuzzy_terms' riporta
+        le alternative usate per ogni termine.
+        """
+        expansions = {term: vocabulary.similar(term) for term in terms}
+        if all(expansions.values()):
+            query = combine(
+                And,
+                [combine(Or, [Term(t) for t in alts]) for alts in expansions.values()],
+            )
+            expanded = [t for alts in expansions.values() for t in alts]
+            body = yield from search_cvs(
+                args, expanded, cursor, limit, fields, paginated, query
+            )
+        else:
+            # Un termine senza alternative: nessun CV può soddisfare l'AND
+            body = cvs_body("CVs filtrati recuperati con successo", [], paginated)
+        body["fuzzy_terms"] = expansions
+        return body
+
+    def user_cvs(self, request, email):
+        """GET /api/cvs/user/<email> (vedi main.get_user_cvs)."""
+        return (
+            yield from self.conditional(
+                request,
+                read_user_version(email),
+                lambda user_version: self.user_list(request, email, user_version),
+            )
+        )
+
+    def user_list(self, request, email, user_version):
+        args = request.args
+        try:
+            paginated = is_paginated(args)
+            cursor = decode_cursor(args.get("cursor"), EMAIL_INDEX_KEY_NAMES) or {}
+            query_args = {
+                "TableName": CV_TABLE,
+                "IndexName": "EmailIndex",
+                "KeyConditionExpression": Key("email").eq(email),
+                **projection_args(parse_fields(args.get("fields"))),
+            }
+
+            if wants_ndjson(request) and not paginated:
+                return (yield from stream("query", query_args))
+
+            # La versione dell'utente nella chiave: il corpo in cache non può
+            # essere più vecchio dell'ETag con cui viene servito
+            try:
+                version = yield from self.data_version.current()
+            except Exception as e:
+                # Senza versione dei dati la risposta viene servita senza cache
+                print(f"Versione dei dati non disponibile: {str(e)}")
+                version = None
+            body = yield from self.cached(
+                user_cache_key(email, args, user_version),
+                version,
+                self.user_body(email, query_args, cursor, paginated, args),
+            )
+            return Reply(body)
+
+        except (InvalidCursor, InvalidFields) as e:
+            return bad_request(e)
+        except Exception as e:
+            print(f"Errore durante il recupero dei CV per l'utente {email}: {str(e)}")
+            return server_error(
+                e, "Si è verificato un errore durante il recupero dei CV dell'utente"
+            )
+
+    def user_body(self, email, query_args, cursor, paginated, args):
+        """Legge i CV dell'utente e restituisce il corpo della risposta."""
+        if paginated:
+            return (
+                yield from page_body(
+                    f"CV dell'utente {email} recuperati con successo",
+                    "query",
+                    query_args,
+                    cursor,
+                    page_limit(args),
+                )
+            )
+
+        # Query sull'indice secondario globale EmailIndex
+        results = yield ReadAll("query", query_args)
+        yield ExpandTexts(results)
+        if results:
+            return cvs_body(f"CV dell'utente {email} recuperati con successo", results)
+        return cvs_body(f"Nessun CV trovato per l'utente {email}", [])
+
+    def batch_cvs(self, request, payload):
+        """POST /api/cvs/batch (vedi main.get_cvs_batch)."""
+        try:
+            cv_ids = parse_cv_ids(payload)
+            fields = parse_fields(request.args.get("fields"))
+            results = yield from get_cvs_by_ids(cv_ids, **projection_args(fields))
+            yield ExpandTexts(results)
+            body = cvs_body("CV recuperati con successo", results)
+            found = {cv["cv_id"] for cv in results}
+            body["missing"] = [cv_id for cv_id in cv_ids if cv_id not in found]
+            return Reply(body)
+        except (InvalidCvIds, InvalidFields) as e:
+            return bad_request(e)
+        except Exception as e:
+            return server_error(e)
+
+    def suggest_terms(self, request):
+        """GET /api/cvs/suggest (vedi main.suggest_terms)."""
+        return (
+            yield from self.conditional(
+                request,
+                self.data_version.current(),
+                lambda version: self.suggestions(request, version),
+            )
+        )
+
+    def suggestions(self, request, version):
+        try:
+            prefix = normalize_prefix(request.args.get("prefix", ""))
+            vocabulary = yield from self.suggest_index.vocabulary(version)
+            suggestions = vocabulary.complete(prefix, suggest_limit(request.args))
+            return Reply(
+                {
+                    "message": "Suggerimenti recuperati con successo",
+                    "prefix": prefix,
+                    "count": len(suggestions),
+                    "suggestions": suggestions,
+                }
+            )
+        except Exception as e:
+            return server_error(
+                e, "Si è verificato un errore durante il recupero dei suggerimenti"
+            )
+
+
+def create_api():
+    """
+    CvApi configurata con le variabili d'ambiente, uguale per i due server.
+    La cache è condivisa tra le repliche se è configurato REDIS_URL.
+    """
+    return CvApi(
+        # Versione dei dati della tabella CVs, incrementata dalla Lambda a ogni CV
+        DataVersion(interval=float(os.environ.get("CACHE_VERSION_INTERVAL", 1))),
+        create_result_cache(
+            redis_url=os.environ.get("REDIS_URL"),
+            max_entries=int(os.environ.get("SEARCH_CACHE_SIZE", 1024)),
+            ttl=float(os.environ.get("SEARCH_CACHE_TTL", 60)),
+        ),
+        SuggestIndex(
+            refresh_interval=float(os.environ.get("SUGGEST_REFRESH_INTERVAL", 30))
+        ),
+        # Segmenti della Scan parallela per gli elenchi completi
+        scan_segments=int(os.environ.get("SCAN_SEGMENTS", 4)),
+    )
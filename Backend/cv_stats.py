@@ -0,0 +1,56 @@
+"""
+Contatori dell'indice invertito in CVStats, divisi in shard.
+
+La Lambda di ingestione aggiorna la document frequency di un termine
+("term#<token>": df) nella stessa transazione che scrive o rimuove la
+posting, e gli aggregati del corpus ("corpus": doc_count, total_len) in
+quella che segna il CV come indicizzato: così ripetere un evento non altera i
+contatori. Con un solo item per contatore, però, le ingestioni concorrenti
+(un import in blocco) si annullano a vicenda sui termini comuni e sul corpus
+(TransactionConflict). Ogni contatore è quindi diviso in STAT_SHARDS item: un
+CV aggiorna sempre lo shard scelto dal suo cv_id e chi legge somma gli shard.
+
+Lo shard 0 è l'item senza suffisso, quindi i contatori scritti prima della
+divisione restano validi. Il modulo è incluso nello zip della Lambda (vedi
+deploy_lambda.SHARED_MODULES), così backend e Lambda usano gli stessi shard.
+"""
+
+import zlib
+
+# Cambiarlo richiede di rieseguire scripts/reindex_cvs.py
+STAT_SHARDS = 8
+
+TERM_PREFIX = "term#"
+CORPUS_STAT_ID = "corpus"
+# Separatore dello shard: non compare nei token (vedi text_processing.py),
+# che possono invece terminare con "#" (c#, f#)
+SHARD_SEPARATOR = "~"
+
+
+def stat_shard(cv_id):
+    """Shard dei contatori aggiornati dal CV."""
+    return zlib.crc32(cv_id.encode()) % STAT_SHARDS
+
+
+def shard_stat_id(stat_id, shard):
+    """stat_id di uno shard del contatore; lo shard 0 è l'item senza suffisso."""
+    return stat_id if shard == 0 else f"{stat_id}{SHARD_SEPARATOR}{shard}"
+
+
+def shard_stat_ids(stat_id):
+    """stat_id di tutti gli shard del contatore."""
+    return [shard_stat_id(stat_id, shard) for shard in range(STAT_SHARDS)]
+
+
+def unsharded_stat_id(stat_id):
+    """stat_id del contatore a cui appartiene lo shard."""
+    return stat_id.partition(SHARD_SEPARATOR)[0]
+
+
+def term_stat_id(term, shard=0):
+    return shard_stat_id(f"{TERM_PREFIX}{term}", shard)
+
+
+def stat_term(stat_id):
+    """Termine di un item "term#<token>" o di un suo shard."""
+    return unsharded_stat_id(stat_id)[len(TERM_PREFIX) :]
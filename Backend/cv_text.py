@@ -0,0 +1,88 @@
+"""
+Memorizzazione compressa del testo estratto dai CV.
+
+La Lambda salva il testo compresso con zlib nell'attributo binario text_z;
+se anche compresso supera TEXT_INLINE_LIMIT il testo viene scritto su S3 e
+l'item conserva solo il riferimento (text_s3_uri). Gli item più piccoli
+riducono le unità di capacità consumate da ogni Scan e Query.
+
+Il backend ricostruisce il campo "text" solo quando il client lo richiede
+(direttamente o per generare gli snippet). Gli item scritti prima della
+compressione, con l'attributo text in chiaro, restano validi.
+
+Il modulo è condiviso con la Lambda di ingestione (vedi deploy_lambda.py).
+"""
+
+import threading
+import zlib
+
+from aws_config import aws_client
+
+# Attributi che compongono il campo "text" delle risposte
+TEXT_ATTRIBUTES = ("text", "text_z", "text_s3_uri")
+
+# Oltre questa dimensione (compressa) il testo va su S3: il limite di un
+# item DynamoDB è 400 KB, attributi e nomi compresi
+TEXT_INLINE_LIMIT = 300 * 1024
+TEXT_S3_PREFIX = "extracted/"
+
+_s3 = None
+_s3_lock = threading.Lock()
+
+
+def s3_client():
+    """
+    Client S3 creato al primo testo letto da S3, con la configurazione di
+    aws_config.py. La creazione di un client non è thread-safe e avviene
+    sotto lock; il client poi è condiviso.
+    """
+    global _s3
+    with _s3_lock:
+        if _s3 is None:
+            _s3 = aws_client("s3")
+        return _s3
+
+
+def compress_text(text):
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def decompress_text(data):
+    # Binary di boto3 (resource) o bytes (client di basso livello)
+    return zlib.decompress(getattr(data, "value", data)).decode("utf-8")
+
+
+def split_s3_uri(uri):
+    bucket, _, key = uri.removeprefix("s3://").partition("/")
+    return bucket, key
+
+
+def text_attributes(bucket, cv_id, text, s3=None):
+    """
+    Attributi da scrivere nell'item del CV per il testo: text_z, oppure
+    text_s3_uri dopo aver caricato il testo compresso su S3 con il client `s3`
+    (quello della Lambda), o in sua assenza con s3_client().
+    """
+    data = compress_text(text)
+    if len(data) <= TEXT_INLINE_LIMIT:
+        return {"text_z": data}
+    key = f"{TEXT_S3_PREFIX}{cv_id}.txt.z"
+    (s3 or s3_client()).put_object(Bucket=bucket, Key=key, Body=data)
+    return {"text_s3_uri": f"s3://{bucket}/{key}"}
+
+
+def expand_text(item):
+    """Sostituisce in un item text_z o text_s3_uri con il campo text."""
+    if "text_z" in item:
+        item["text"] = decompress_text(item.pop("text_z"))
+    elif "text_s3_uri" in item:
+        bucket, key = split_s3_uri(item.pop("text_s3_uri"))
+        body = s3_client().get_object(Bucket=bucket, Key=key)["Body"].read()
+        item["text"] = decompress_text(body)
+    return item
+
+
+def expand_texts(items):
+    for item in items:
+        expand_text(item)
+    return items
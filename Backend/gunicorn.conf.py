@@ -0,0 +1,38 @@
+"""
+Configurazione di gunicorn per il backend in produzione.
+
+Ogni parametro si può regolare con una variabile d'ambiente del servizio
+Swarm (docker service update --env-add ...), senza ricostruire l'immagine.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 80)}"
+
+# Processi worker con thread: le richieste passano la maggior parte del tempo
+# in attesa di DynamoDB, quindi più thread per processo sfruttano meglio la CPU
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+# Keep-alive delle connessioni HTTP tra una richiesta e l'altra
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+backlog = int(os.environ.get("GUNICORN_BACKLOG", 2048))
+
+# Timeout di una richiesta e tempo concesso alle richieste in corso quando
+# Swarm invia SIGTERM durante un rolling update (deve restare sotto lo
+# --stop-grace-period del servizio)
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 25))
+
+# Riciclo periodico dei worker, sfalsato per non riavviarli tutti insieme
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 5000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 500))
+
+# Heartbeat dei worker in memoria invece che sul filesystem del container
+worker_tmp_dir = "/dev/shm"
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
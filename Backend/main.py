@@ -1,9 +1,31 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import (
+    Flask,
+    Response,
+    request,
+    jsonify,
+    stream_with_context,
+)
 from flask_cors import CORS
-import boto3
-from boto3.dynamodb.conditions import Attr, Key
 import os
 
+from aws_config import SCAN_MAX_WORKERS, dynamodb_resource
+from cv_api import Stream, create_api
+from cv_text import expand_text, expand_texts
+from parallel_scan import parallel_scan
+from search_index import batch_get
+from static_assets import StaticSite, static_response
+from storage import (
+    BatchGet,
+    CacheGet,
+    CacheSet,
+    ExpandTexts,
+    GetItem,
+    ParallelScan,
+    ReadAll,
+    ReadPage,
+    run,
+)
+
 # Definisci il percorso della build del frontend
 FRONTEND_BUILD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "out")
 
@@ -13,9 +35,19 @@ app = Flask(__name__, static_folder=FRONTEND_BUILD_PATH)
 # Abilita CORS per tutte le route con supporto per credenziali
 CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 
-# Inizializza il client DynamoDB
-dynamodb = boto3.resource("dynamodb", region_name="eu-west-2")
-cv_table = dynamodb.Table("CVs")
+# Manifest dei file statici, costruito una sola volta all'avvio
+static_site = StaticSite(FRONTEND_BUILD_PATH)
+
+# Inizializza il client DynamoDB, con pool, retry e timeout di aws_config.py.
+# I thread condividono il client del resource, thread-safe a differenza delle
+# Table del resource
+dynamodb = dynamodb_resource()
+client = dynamodb.meta.client
+
+# Logica degli endpoint (cv_api.py), condivisa con async_app.py: versione dei
+# dati, cache dei risultati (su Redis se è configurato REDIS_URL) e
+# vocabolario dei suggerimenti
+api = create_api()
 
 
 # Endpoint per servire l'app frontend
@@ -23,182 +55,189 @@ cv_table = dynamodb.Table("CVs")
 @app.route("/<path:path>")
 def serve_frontend(path):
     """
-    Serve i file statici del frontend costruito con Next.js.
+    Serve i file statici del frontend costruito con Next.js, dal manifest
+    costruito all'avvio (varianti compresse, ETag e Cache-Control).
     """
-    print(f"Path richiesto: {path}")  # Log per debug
-
     # Se è una richiesta API, lascia che vengano gestite dagli altri endpoint
     if path.startswith("api/"):
-        print(f"Richiesta API, ignorata dal serve_frontend: {path}")  # Log per debug
         return {"error": "Not Found"}, 404
+    return static_response(static_site, path, request, Response)
+
 
-    # Controlla se il percorso esiste direttamente come file
-    file_path = os.path.join(app.static_folder, path)
-    if os.path.isfile(file_path):
-        print(f"Servendo file diretto: {file_path}")  # Log per debug
-        return send_from_directory(app.static_folder, path)
-
-    # Controlla se il percorso è una directory contenente un index.html
-    dir_index = os.path.join(app.static_folder, path, "index.html")
-    if os.path.isfile(dir_index):
-        print(f"Servendo index.html dalla directory: {dir_index}")  # Log per debug
-        # Questo gestirà percorsi come /dashboard che puntano a /dashboard/index.html
-        return send_from_directory(os.path.join(app.static_folder, path), "index.html")
-
-    # Gestisci percorsi che terminano con /
-    if path.endswith("/"):
-        adjusted_path = path[:-1]  # Rimuovi lo slash finale
-        dir_index = os.path.join(app.static_folder, adjusted_path, "index.html")
-        if os.path.isfile(dir_index):
-            print(
-                f"Servendo index.html dopo aver rimosso lo slash finale: {dir_index}"
-            )  # Log per debug
-            return send_from_directory(
-                os.path.join(app.static_folder, adjusted_path), "index.html"
+def iter_items(operation, first_page=None, **kwargs):
+    """
+    Itera sugli item di una Scan/Query seguendo LastEvaluatedKey.
+    La prima pagina viene letta subito (o è già stata letta, first_page),
+    così gli errori di DynamoDB emergono prima che la risposta inizi; le
+    successive vengono lette durante l'iterazione.
+    """
+    response = first_page or operation(**kwargs)
+
+    def items(response):
+        yield from response["Items"]
+        while "LastEvaluatedKey" in response:
+            response = operation(
+                ExclusiveStartKey=response["LastEvaluatedKey"], **kwargs
             )
+            yield from response["Items"]
+
+    return items(response)
+
+
+def perform(operation):
+    """Esegue con boto3 un'operazione di storage.py (vedi storage.run)."""
+    if isinstance(operation, ReadPage):
+        return getattr(client, operation.operation)(**operation.args)
+    if isinstance(operation, ReadAll):
+        return list(iter_items(getattr(client, operation.operation), **operation.args))
+    if isinstance(operation, GetItem):
+        return client.get_item(**operation.args).get("Item", {})
+    if isinstance(operation, BatchGet):
+        return batch_get(client, operation.table, operation.keys, **operation.args)
+    if isinstance(operation, ParallelScan):
+        return parallel_scan(
+            client,
+            operation.table,
+            operation.segments,
+            max_workers=SCAN_MAX_WORKERS,
+            **operation.args,
+        )
+    if isinstance(operation, ExpandTexts):
+        return expand_texts(operation.items)
+    if isinstance(operation, CacheGet):
+        return api.result_cache.get(operation.key, operation.version)
+    if isinstance(operation, CacheSet):
+        return api.result_cache.set(operation.key, operation.value, operation.version)
+    raise TypeError(f"Operazione non supportata: {operation!r}")
 
-    # Per SPA, servi index.html dalla radice per tutte le altre richieste
-    # Next.js gestirà il routing lato client
-    print(
-        f"Fallback: servendo index.html dalla root per il percorso: {path}"
-    )  # Log per debug
-    return send_from_directory(app.static_folder, "index.html")
+
+def ndjson_response(stream):
+    """
+    Risposta in streaming NDJSON: un CV per riga, inviato appena la pagina
+    DynamoDB che lo contiene è stata letta.
+    """
+    items = iter_items(
+        getattr(client, stream.operation), stream.first_page, **stream.args
+    )
+
+    def generate():
+        try:
+            for item in items:
+                yield app.json.dumps(expand_text(item)) + "\n"
+        except Exception as e:
+            # Gli header sono già stati inviati: si può solo troncare lo stream
+            print(f"Errore durante lo streaming dei CV: {str(e)}")  # Log per debug
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers=stream.headers,
+    )
+
+
+def respond(steps):
+    """Esegue un handler di cv_api.py e ne converte il risultato per Flask."""
+    reply = run(steps, perform)
+    if isinstance(reply, Stream):
+        return ndjson_response(reply)
+    if reply.body is None:
+        return Response(status=reply.status, headers=reply.headers)
+    return jsonify(reply.body), reply.status, reply.headers
 
 
 @app.route("/api/cvs", methods=["GET"])
 def get_cvs():
     """
     Recupera i CV dal database.
-    Supporta il filtraggio tramite query parameter 'keywords'.
+    Supporta il filtraggio tramite query parameter 'keywords', risolto
+    sull'indice invertito scritto dalla Lambda di ingestione.
     Esempio: /api/cvs?keywords=python,aws,react
-    """
-    try:
-        # Controlla se sono state fornite parole chiave
-        keywords = request.args.get("keywords", "")
-
-        if keywords:
-            # Dividi le parole chiave per virgola
-            keyword_list = keywords.lower().split(",")
-            keyword_list = [k.strip() for k in keyword_list if k.strip()]
-
-            # Inizializza una lista vuota per i risultati
-            results = []
-            if keyword_list:
-                from functools import reduce
-                from operator import and_
-
-                filters = [Attr("text").contains(k) for k in keyword_list]
-                keyword_filter = reduce(and_, filters)
-                response = cv_table.scan(FilterExpression=keyword_filter)
-                results = response["Items"]
-                # Gestione della paginazione per grandi set di dati
-                while "LastEvaluatedKey" in response:
-                    response = cv_table.scan(
-                        FilterExpression=keyword_filter,
-                        ExclusiveStartKey=response["LastEvaluatedKey"],
-                    )
-                    results.extend(response["Items"])
-                return (
-                    jsonify(
-                        {
-                            "message": "CVs filtrati recuperati con successo",
-                            "count": len(results),
-                            "cvs": results,
-                        }
-                    ),
-                    200,
-                )
-
-        # Se non ci sono parole chiave, recupera tutti i CV
-        response = cv_table.scan()
-        results = response["Items"]
-
-        # Gestione della paginazione per grandi set di dati
-        while "LastEvaluatedKey" in response:
-            response = cv_table.scan(ExclusiveStartKey=response["LastEvaluatedKey"])
-            results.extend(response["Items"])
-
-        return (
-            jsonify(
-                {
-                    "message": "Tutti i CV recuperati con successo",
-                    "count": len(results),
-                    "cvs": results,
-                }
-            ),
-            200,
-        )
 
-    except Exception as e:
-        return (
-            jsonify(
-                {
-                    "error": str(e),
-                    "message": "Si è verificato un errore durante il recupero dei CV",
-                }
-            ),
-            500,
-        )
+    Con 'q' accetta una query con AND, OR, NOT, "frasi" e filtri sui campi
+    (email:, uploaded_after:, uploaded_before:), eseguita sull'indice.
+    Esempio: /api/cvs?q=python AND (aws OR gcp) -php "machine learning"
+
+    Con 'fuzzy=1' ogni parola chiave trova anche i termini simili (errori di
+    battitura), elencati nel campo 'fuzzy_terms'.
+    Esempio: /api/cvs?keywords=pyhton,kubernets&fuzzy=1
+
+    Con 'rank=bm25' restituisce solo i migliori 'limit' CV (default 20),
+    ordinati per punteggio BM25 e con il campo 'score'.
+    Esempio: /api/cvs?keywords=python,aws&rank=bm25&limit=20
+
+    Con 'limit' e/o 'cursor' restituisce una sola pagina di risultati e il
+    campo 'next_cursor' da passare alla richiesta successiva (null a fine
+    elenco).
+    Esempio: /api/cvs?limit=20&cursor=eyJrZXkiOnsi...
+
+    Senza parole chiave né paginazione, con 'format=ndjson' (o
+    Accept: application/x-ndjson) l'elenco completo viene inviato in
+    streaming, un CV per riga, man mano che le pagine della Scan arrivano.
+    Esempio: /api/cvs?format=ndjson
+
+    Con 'fields' vengono letti e restituiti solo i campi indicati; con
+    'snippets=1' la ricerca per parole chiave aggiunge a ogni CV brevi
+    frammenti di testo attorno ai termini trovati.
+    Esempio: /api/cvs?keywords=python&fields=original_filename,s3_key&snippets=1
+
+    L'elenco completo viene letto con una Scan parallela a 'segments'
+    segmenti (default SCAN_SEGMENTS); i tempi di ogni segmento sono riportati
+    nell'header Server-Timing.
+
+    Le risposte hanno un ETag legato alla versione dei dati: con
+    If-None-Match aggiornato la risposta è 304, senza leggere i CV.
+    """
+    return respond(api.list_cvs(request))
 
 
 @app.route("/api/cvs/user/<string:email>", methods=["GET"])
 def get_user_cvs(email):
     """
     Recupera tutti i CV di un utente specifico dal database utilizzando l'indice secondario globale.
+    Con 'limit' e/o 'cursor' restituisce una sola pagina e il campo 'next_cursor'.
+    Con 'format=ndjson' l'elenco completo viene inviato in streaming.
+    Con 'fields' vengono letti e restituiti solo i campi indicati.
+    L'ETag segue la versione dei CV dell'utente (304 se non sono cambiati).
     """
-    try:
-        # Esegui una query sull'indice secondario globale EmailIndex
-        response = cv_table.query(
-            IndexName="EmailIndex", KeyConditionExpression=Key("email").eq(email)
-        )
-        results = response["Items"]
+    return respond(api.user_cvs(request, email))
 
-        # Gestione della paginazione per grandi set di dati
-        while "LastEvaluatedKey" in response:
-            response = cv_table.query(
-                IndexName="EmailIndex",
-                KeyConditionExpression=Key("email").eq(email),
-                ExclusiveStartKey=response["LastEvaluatedKey"],
-            )
-            results.extend(response["Items"])
-
-        if results:
-            return (
-                jsonify(
-                    {
-                        "message": f"CV dell'utente {email} recuperati con successo",
-                        "count": len(results),
-                        "cvs": results,
-                    }
-                ),
-                200,
-            )
-        else:
-            return (
-                jsonify(
-                    {
-                        "message": f"Nessun CV trovato per l'utente {email}",
-                        "count": 0,
-                        "cvs": [],
-                    }
-                ),
-                200,
-            )
 
-    except Exception as e:
-        print(
-            f"Errore durante il recupero dei CV per l'utente {email}: {str(e)}"
-        )  # Log per debug
-        return (
-            jsonify(
-                {
-                    "error": str(e),
-                    "message": "Si è verificato un errore durante il recupero dei CV dell'utente",
-                }
-            ),
-            500,
-        )
+@app.route("/api/cvs/batch", methods=["POST"])
+def get_cvs_batch():
+    """
+    Recupera i CV indicati nel corpo JSON {"cv_ids": [...]} (al più
+    MAX_BATCH_CV_IDS), nello stesso ordine, con BatchGetItem a blocchi di 100
+    letti in parallelo. Con 'fields' vengono letti solo i campi indicati; i
+    cv_id inesistenti sono elencati nel campo 'missing'.
+    Esempio: POST /api/cvs/batch?fields=original_filename,email
+             {"cv_ids": ["cv1.pdf", "cv2.pdf"]}
+    """
+    return respond(api.batch_cvs(request, request.get_json(silent=True)))
+
+
+@app.route("/api/cvs/suggest", methods=["GET"])
+def suggest_terms():
+    """
+    Completamenti di una parola parziale per la casella di ricerca: i termini
+    indicizzati che iniziano con 'prefix', ordinati per numero di CV che li
+    contengono (campo 'count'). Non legge la tabella CVs.
+    Esempio: /api/cvs/suggest?prefix=pyt&limit=10
+    """
+    return respond(api.suggest_terms(request))
+
+
+@app.route("/api/cache/stats", methods=["GET"])
+def get_cache_stats():
+    """Statistiche della cache dei risultati (hit, miss, evizioni)."""
+    return jsonify({"results": api.result_cache.stats()}), 200
 
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=int(os.environ.get("PORT", 80)))
+    # Server di sviluppo Flask, solo per uso locale: in produzione l'app è
+    # servita da gunicorn (vedi gunicorn.conf.py). Il debug va abilitato
+    # esplicitamente con FLASK_DEBUG=1.
+    app.run(
+        debug=os.environ.get("FLASK_DEBUG") == "1",
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", 80)),
+    )
@@ -0,0 +1,86 @@
+"""
+Paginazione a cursore per gli endpoint di elenco dei CV.
+
+Il cursore restituito al client è opaco: codifica in base64 url-safe lo stato
+necessario a riprendere la lettura (la LastEvaluatedKey di DynamoDB, l'ultimo
+cv_id restituito o l'offset nella classifica), così ogni richiesta esegue una
+sola pagina di lavoro.
+"""
+
+import base64
+import binascii
+import json
+
+DEFAULT_PAGE_LIMIT = 20
+MAX_PAGE_LIMIT = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(state):
+    if state is None:
+        return None
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, key_names=None):
+    """
+    Decodifica il cursore del client. `key_names` sono gli attributi della
+    chiave della tabella o dell'indice paginato, gli unici ammessi in "key".
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor(f"Cursore non valido: {cursor}") from e
+    if not isinstance(state, dict) or not valid_state(state, key_names):
+        raise InvalidCursor(f"Cursore non valido: {cursor}")
+    return state
+
+
+def valid_state(state, key_names=None):
+    """
+    Il cursore arriva dal client: oltre al formato si controllano i tipi dei
+    campi e i nomi degli attributi della chiave, che altrimenti farebbero
+    fallire la richiesta con un errore 500 (ExclusiveStartKey non valida).
+    """
+    offset = state.get("offset", 0)
+    if type(offset) is not int or offset < 0:
+        return False
+    if not isinstance(state.get("after", ""), str):
+        return False
+    key = state.get("key")
+    if key is None:
+        return True
+    if not (
+        isinstance(key, dict) and all(isinstance(value, str) for value in key.values())
+    ):
+        return False
+    return key_names is None or set(key) == set(key_names)
+
+
+def cvs_body(message, results, paginated=False, next_cursor=None):
+    """
+    Corpo standard delle risposte degli endpoint di elenco dei CV. Il testo
+    dei CV, se letto, deve essere già stato ricostruito (storage.ExpandTexts).
+    """
+    body = {"message": message, "count": len(results), "cvs": results}
+    if paginated:
+        body["next_cursor"] = next_cursor
+    return body
+
+
+def page_limit(args, default=DEFAULT_PAGE_LIMIT):
+    """Legge il parametro 'limit' dalla query string, limitandolo a [1, 100]."""
+    limit = args.get("limit", default, type=int)
+    return min(max(limit, 1), MAX_PAGE_LIMIT)
+
+
+def is_paginated(args):
+    """La paginazione è attiva quando il client passa 'limit' o 'cursor'."""
+    return "limit" in args or "cursor" in args
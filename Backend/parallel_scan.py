@@ -0,0 +1,73 @@
+"""
+Scan parallela a segmenti della tabella CVs.
+
+Per gli elenchi che richiedono comunque un passaggio completo sulla tabella,
+la Scan viene divisa in TotalSegments segmenti letti in parallelo da un pool
+di thread limitato. Ogni thread usa il client di basso livello del resource
+DynamoDB, che a differenza del resource è thread-safe. Il backend asincrono
+legge i segmenti come coroutine concorrenti, con gli stessi limiti e tempi.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_SEGMENTS = 16
+
+
+def segment_count(segments):
+    """Numero di segmenti richiesto, limitato a [1, MAX_SEGMENTS]."""
+    return min(max(segments, 1), MAX_SEGMENTS)
+
+
+def segment_timing(segment, pages, items, started):
+    """Tempi di un segmento letto a partire da `started` (perf_counter)."""
+    return {
+        "segment": segment,
+        "pages": pages,
+        "items": items,
+        "ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def scan_segment(client, table_name, segment, total_segments, **scan_args):
+    """Legge tutte le pagine di un segmento; restituisce (item, tempi)."""
+    started = time.perf_counter()
+    items = []
+    pages = 0
+    args = dict(scan_args, TableName=table_name)
+    args.update(Segment=segment, TotalSegments=total_segments)
+    while True:
+        response = client.scan(**args)
+        items.extend(response["Items"])
+        pages += 1
+        if "LastEvaluatedKey" not in response:
+            break
+        args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return items, segment_timing(segment, pages, len(items), started)
+
+
+def parallel_scan(client, table_name, segments, max_workers=None, **scan_args):
+    """
+    Esegue una Scan completa divisa in `segments` segmenti paralleli.
+    Restituisce gli item di tutti i segmenti (in ordine di segmento) e la
+    lista dei tempi per segmento.
+    """
+    segments = segment_count(segments)
+    with ThreadPoolExecutor(max_workers=max_workers or segments) as pool:
+        futures = [
+            pool.submit(
+                scan_segment, client, table_name, segment, segments, **scan_args
+            )
+            for segment in range(segments)
+        ]
+        results = [future.result() for future in futures]
+    items = [item for segment_items, _ in results for item in segment_items]
+    return items, [timing for _, timing in results]
+
+
+def server_timing(timings):
+    """Formatta i tempi per segmento come header Server-Timing."""
+    return ", ".join(
+        f'scan-seg{t["segment"]};dur={t["ms"]};desc="{t["items"]} items"'
+        for t in timings
+    )
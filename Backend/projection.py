@@ -0,0 +1,83 @@
+"""
+Proiezione dei campi restituiti dagli endpoint di elenco dei CV.
+
+Il parametro 'fields' viene tradotto in una ProjectionExpression di DynamoDB,
+così gli attributi non richiesti (in particolare il testo completo del CV) non
+vengono né letti né serializzati. Senza 'fields' vengono letti i campi
+pubblici (DEFAULT_FIELDS): gli attributi interni scritti dalla Lambda per
+l'indice e la deduplicazione restano fuori dalle risposte.
+"""
+
+from cv_text import TEXT_ATTRIBUTES
+
+# Attributi degli item della tabella CVs che il client può richiedere
+CV_FIELDS = (
+    "cv_id",
+    "email",
+    "original_filename",
+    "uploaded_at",
+    "s3_key",
+    "text",
+    "tokens",
+)
+
+
+# Attributi interni degli item, restituiti solo se richiesti con 'fields'
+# (tokens) o mai (content_hash, indexed_hash, indexed_len)
+INTERNAL_ATTRIBUTES = ("tokens", "content_hash", "indexed_hash", "indexed_len")
+
+# Campi restituiti quando il client non passa 'fields'
+DEFAULT_FIELDS = [field for field in CV_FIELDS if field not in INTERNAL_ATTRIBUTES]
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def parse_fields(value):
+    """
+    Converte il parametro 'fields' (lista separata da virgole) nella lista
+    dei campi richiesti; None se il parametro è assente (tutti i campi).
+    cv_id è sempre incluso perché serve come chiave e per i cursori.
+    """
+    if not value:
+        return None
+    fields = ["cv_id"]
+    for field in value.split(","):
+        field = field.strip()
+        if not field:
+            continue
+        if field not in CV_FIELDS:
+            raise InvalidFields(f"Campo non supportato: {field}")
+        if field not in fields:
+            fields.append(field)
+    return fields
+
+
+def snippet_fields(fields):
+    """
+    Campi da leggere per generare gli snippet: servono anche al testo, che
+    poi viene rimosso dalla risposta se non era stato richiesto.
+    """
+    if fields and "text" not in fields:
+        return fields + ["text"]
+    return fields
+
+
+def projection_args(fields):
+    """
+    Restituisce gli argomenti ProjectionExpression/ExpressionAttributeNames
+    per leggere solo i campi indicati (DEFAULT_FIELDS se fields è None).
+    I nomi sono sempre sostituiti da placeholder: "text" è una parola
+    riservata di DynamoDB.
+    """
+    fields = fields or DEFAULT_FIELDS
+    # Il campo "text" è memorizzato compresso o su S3 (vedi cv_text.py)
+    attributes = []
+    for field in fields:
+        attributes.extend(TEXT_ATTRIBUTES if field == "text" else (field,))
+    names = {f"#f{i}": attribute for i, attribute in enumerate(attributes)}
+    return {
+        "ProjectionExpression": ", ".join(names),
+        "ExpressionAttributeNames": names,
+    }
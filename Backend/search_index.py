@@ -0,0 +1,314 @@
+"""
+Accesso all'indice invertito dei CV.
+
+L'indice è scritto dalla Lambda di ingestione in due tabelle:
+- CVTerms: una posting (term, cv_id) per ogni token distinto di ogni CV, con
+  la term frequency (tf) e la lunghezza del CV in token (doc_len);
+- CVStats: aggregati precalcolati, cioè la document frequency di ogni
+  termine (stat_id = "term#<token>") e le statistiche del corpus
+  (stat_id = "corpus": doc_count, total_len), divise in shard da sommare
+  (vedi cv_stats.py).
+
+Una ricerca con più parole chiave legge prima le document frequency, parte dal
+termine più raro e interseca le posting list, così il costo dipende dal numero
+di risultati e non dalla dimensione della tabella CVs.
+
+Le funzioni di ricerca sono generatori che producono le letture da eseguire
+(vedi storage.py): si usano con yield from dalla logica delle richieste.
+"""
+
+import heapq
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.dynamodb.conditions import Key
+
+from aws_config import BATCH_GET_WORKERS
+from cv_stats import (
+    CORPUS_STAT_ID,
+    shard_stat_ids,
+    stat_term,
+    term_stat_id,
+    unsharded_stat_id,
+)
+from storage import BatchGet, ReadAll
+
+CV_TABLE = "CVs"
+TERMS_TABLE = "CVTerms"
+STATS_TABLE = "CVStats"
+
+# Attributi delle posting necessari al ranking
+RANK_PROJECTION = "cv_id, tf, doc_len"
+
+# Parametri BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Limite di chiavi per singola chiamata BatchGetItem
+BATCH_GET_SIZE = 100
+# Tentativi per le UnprocessedKeys (throttling), con backoff esponenziale
+BATCH_GET_ATTEMPTS = 6
+BATCH_GET_BASE_DELAY = 0.05
+BATCH_GET_MAX_DELAY = 2.0
+
+# cv_id accettati da una singola richiesta di /api/cvs/batch
+MAX_BATCH_CV_IDS = 500
+
+# Rapporto tra posting list e candidati oltre il quale si verificano i
+# candidati con BatchGetItem invece di leggere tutta la lista (should_probe)
+PROBE_RATIO = 4
+
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+class InvalidCvIds(ValueError):
+    pass
+
+
+def backoff_delay(attempt):
+    """Attesa prima del tentativo `attempt` (backoff esponenziale, full jitter)."""
+    return random.uniform(
+        0, min(BATCH_GET_MAX_DELAY, BATCH_GET_BASE_DELAY * 2**attempt)
+    )
+
+
+def batch_get_chunk(client, table_name, request):
+    """
+    Legge un blocco di al più 100 chiavi, ripetendo le UnprocessedKeys
+    (restituite da DynamoDB quando la tabella è in throttling) con backoff.
+    """
+    items = []
+    request_items = {table_name: request}
+    for attempt in range(BATCH_GET_ATTEMPTS):
+        response = client.batch_get_item(RequestItems=request_items)
+        items.extend(response["Responses"].get(table_name, []))
+        request_items = response.get("UnprocessedKeys")
+        if not request_items:
+            return items
+        time.sleep(backoff_delay(attempt))
+    raise RuntimeError(
+        f"BatchGetItem su {table_name}: chiavi non elaborate dopo "
+        f"{BATCH_GET_ATTEMPTS} tentativi"
+    )
+
+
+def batch_get(client, table_name, keys, **request_args):
+    """
+    Legge un insieme di chiavi con BatchGetItem, a blocchi di 100 letti in
+    parallelo, ripetendo le eventuali UnprocessedKeys. Gli argomenti
+    aggiuntivi (ProjectionExpression, ExpressionAttributeNames) valgono per
+    ogni blocco. I thread usano il client di basso livello del resource, che
+    è thread-safe. È l'esecuzione sincrona dell'operazione storage.BatchGet.
+    """
+    requests = [
+        {"Keys": chunk, **request_args} for chunk in chunked(keys, BATCH_GET_SIZE)
+    ]
+    if not requests:
+        return []
+    if len(requests) == 1:
+        return batch_get_chunk(client, table_name, requests[0])
+    workers = min(len(requests), BATCH_GET_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        chunks = pool.map(
+            lambda request: batch_get_chunk(client, table_name, request), requests
+        )
+        return [item for chunk in chunks for item in chunk]
+
+
+def stats_keys(terms):
+    """
+    Chiavi di CVStats da leggere per una ricerca: tutti gli shard del corpus
+    e delle df dei termini.
+    """
+    stat_ids = [CORPUS_STAT_ID] + [term_stat_id(t) for t in terms]
+    return [
+        {"stat_id": shard_id}
+        for stat_id in stat_ids
+        for shard_id in shard_stat_ids(stat_id)
+    ]
+
+
+def parse_stats(items, terms):
+    """Somma gli shard degli item di CVStats in (corpus, {termine: df})."""
+    corpus = {"doc_count": 0, "total_len": 0}
+    dfs = {t: 0 for t in terms}
+    for item in items:
+        if unsharded_stat_id(item["stat_id"]) == CORPUS_STAT_ID:
+            corpus["doc_count"] += int(item.get("doc_count", 0))
+            corpus["total_len"] += int(item.get("total_len", 0))
+        else:
+            dfs[stat_term(item["stat_id"])] += int(item.get("df", 0))
+    return corpus, dfs
+
+
+def read_stats(terms):
+    """
+    Legge in un'unica BatchGetItem gli aggregati del corpus e le document
+    frequency dei termini. Restituisce (corpus, {termine: df}).
+    """
+    items = yield BatchGet(STATS_TABLE, stats_keys(terms), {})
+    return parse_stats(items, terms)
+
+
+def posting_list(term, projection):
+    """Restituisce {cv_id: posting} per tutti i CV che contengono il termine."""
+    items = yield ReadAll(
+        "query",
+        {
+            "TableName": TERMS_TABLE,
+            "KeyConditionExpression": Key("term").eq(term),
+            "ProjectionExpression": projection,
+        },
+    )
+    return {item["cv_id"]: item for item in items}
+
+
+def probe_postings(term, cv_ids, projection):
+    """Restituisce {cv_id: posting} per i soli cv_id che contengono il termine."""
+    keys = [{"term": term, "cv_id": cv_id} for cv_id in cv_ids]
+    items = yield BatchGet(TERMS_TABLE, keys, {"ProjectionExpression": projection})
+    return {item["cv_id"]: item for item in items}
+
+
+def should_probe(matches, df):
+    """
+    Se i candidati rimasti sono molti meno della posting list del termine,
+    conviene verificarli puntualmente invece di leggere tutta la lista.
+    """
+    return len(matches) * PROBE_RATIO < df
+
+
+def join_postings(matches, term, postings):
+    """
+    Aggiunge alle corrispondenze {cv_id: {termine: posting}} le posting di un
+    nuovo termine, tenendo solo i CV che lo contengono (matches None indica
+    il primo termine).
+    """
+    if matches is None:
+        return {cv_id: {term: posting} for cv_id, posting in postings.items()}
+    return {
+        cv_id: {**found, term: postings[cv_id]}
+        for cv_id, found in matches.items()
+        if cv_id in postings
+    }
+
+
+def intersect_postings(terms, dfs, projection="cv_id"):
+    """
+    Restituisce {cv_id: {termine: posting}} per i CV che contengono tutti i
+    termini, partendo dalla posting list più corta.
+    """
+    ordered = sorted(terms, key=lambda t: dfs[t])
+    matches = None
+    for term in ordered:
+        if matches is not None and should_probe(matches, dfs[term]):
+            postings = yield from probe_postings(term, matches, projection)
+        else:
+            postings = yield from posting_list(term, projection)
+        matches = join_postings(matches, term, postings)
+        if not matches:
+            break
+    return matches
+
+
+def find_matching_cv_ids(terms):
+    """
+    Restituisce, ordinati, i cv_id dei CV che contengono tutti i termini.
+    """
+    if not terms:
+        return []
+
+    _, dfs = yield from read_stats(terms)
+    if any(dfs[t] == 0 for t in terms):
+        return []
+    return sorted((yield from intersect_postings(terms, dfs)))
+
+
+def bm25(tf, df, doc_len, doc_count, avg_doc_len):
+    """Contributo BM25 di un termine al punteggio di un documento."""
+    idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len / avg_doc_len)
+    return idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+
+def rank_cv_ids(terms, limit):
+    """
+    Restituisce i migliori `limit` CV che contengono tutti i termini, come
+    lista di (cv_id, punteggio BM25) in ordine di rilevanza decrescente,
+    insieme al numero totale di CV trovati.
+    tf e lunghezza del documento sono letti dalle posting, df e statistiche
+    del corpus dagli aggregati precalcolati: i CV vengono letti solo per i
+    risultati restituiti.
+    """
+    if not terms:
+        return [], 0
+
+    corpus, dfs = yield from read_stats(terms)
+    if any(dfs[t] == 0 for t in terms):
+        return [], 0
+
+    matches = yield from intersect_postings(terms, dfs, projection=RANK_PROJECTION)
+    return top_k_bm25(matches, dfs, corpus, limit)
+
+
+def top_k_bm25(matches, dfs, corpus, limit):
+    """
+    Calcola il punteggio BM25 delle corrispondenze {cv_id: {termine: posting}}
+    e restituisce ([(cv_id, punteggio)] dei migliori `limit`, totale).
+    """
+    doc_count = max(int(corpus.get("doc_count", 0)), len(matches), 1)
+    avg_doc_len = float(corpus.get("total_len", 0)) / doc_count or 1.0
+
+    def score(postings):
+        return sum(
+            bm25(
+                int(posting.get("tf", 1)),
+                dfs[term],
+                int(posting.get("doc_len", avg_doc_len)),
+                doc_count,
+                avg_doc_len,
+            )
+            for term, posting in postings.items()
+        )
+
+    scored = ((score(postings), cv_id) for cv_id, postings in matches.items())
+    # Selezione top-k con un heap: O(n log k) invece dell'ordinamento completo
+    top = heapq.nlargest(limit, scored)
+    return [(cv_id, value) for value, cv_id in top], len(matches)
+
+
+def get_cvs_by_ids(cv_ids, **request_args):
+    """
+    Recupera i CV indicati mantenendo l'ordine di cv_ids. Gli argomenti
+    aggiuntivi (es. la proiezione dei campi) sono passati a BatchGetItem.
+    """
+    keys = [{"cv_id": cv_id} for cv_id in cv_ids]
+    items = yield BatchGet(CV_TABLE, keys, request_args)
+    return order_by_ids(items, cv_ids)
+
+
+def parse_cv_ids(payload):
+    """
+    Estrae i cv_id dal corpo di /api/cvs/batch ({"cv_ids": [...]}),
+    rimuovendo i duplicati (non ammessi da BatchGetItem) e mantenendo l'ordine.
+    """
+    cv_ids = payload.get("cv_ids") if isinstance(payload, dict) else None
+    if not isinstance(cv_ids, list) or not cv_ids:
+        raise InvalidCvIds("Il corpo deve contenere una lista 'cv_ids' non vuota")
+    if not all(isinstance(cv_id, str) and cv_id for cv_id in cv_ids):
+        raise InvalidCvIds("Ogni cv_id deve essere una stringa non vuota")
+    cv_ids = list(dict.fromkeys(cv_ids))
+    if len(cv_ids) > MAX_BATCH_CV_IDS:
+        raise InvalidCvIds(f"Al massimo {MAX_BATCH_CV_IDS} cv_id per richiesta")
+    return cv_ids
+
+
+def order_by_ids(items, cv_ids):
+    """Riordina gli item secondo cv_ids (BatchGetItem non garantisce l'ordine)."""
+    by_id = {item["cv_id"]: item for item in items}
+    return [by_id[cv_id] for cv_id in cv_ids if cv_id in by_id]
@@ -0,0 +1,462 @@
+"""
+Linguaggio di ricerca dei CV (parametro 'q' di /api/cvs).
+
+Sintassi:
+- parole separate da spazi, tutte obbligatorie (AND implicito);
+- AND, OR, NOT (maiuscoli) e parentesi; "-parola" equivale a NOT parola;
+- "frasi tra virgolette", cercate come parole consecutive;
+- filtri sui campi: email:<indirizzo>, uploaded_after:<data>,
+  uploaded_before:<data> (date ISO, es. 2024-01-31); i filtri sulle date
+  restringono i risultati degli altri termini e non si usano da soli.
+
+Esempio: python AND (aws OR gcp) -php "machine learning" uploaded_after:2024-01-01
+
+La query viene compilata in un albero di nodi ed eseguita sull'indice
+invertito (vedi search_index.py): i figli di un AND vengono valutati dal più
+selettivo (document frequency minore) e ognuno restringe i candidati del
+successivo, con la stessa scelta tra lettura della posting list e verifica
+puntuale dei candidati delle ricerche per parole chiave; una NOT verifica solo
+i candidati rimasti e un OR smette di controllare un CV appena un ramo lo
+trova. Le frasi sono verificate sulle posizioni dei token salvate nelle
+posting in fase di ingestione. Come in search_index.py, l'esecuzione è un
+generatore che produce le letture da eseguire (vedi storage.py).
+"""
+
+import datetime
+import re
+from collections import namedtuple
+
+from boto3.dynamodb.conditions import Key
+
+from search_index import (
+    CV_TABLE,
+    RANK_PROJECTION,
+    join_postings,
+    posting_list,
+    probe_postings,
+    read_stats,
+    should_probe,
+)
+from storage import BatchGet, ReadAll
+from text_processing import phrase_terms, tokenize
+
+Term = namedtuple("Term", "token")
+Phrase = namedtuple("Phrase", "words")  # ((offset, token), ...)
+And = namedtuple("And", "children")
+Or = namedtuple("Or", "children")
+Not = namedtuple("Not", "child")
+Field = namedtuple("Field", "name value")
+
+FIELDS = ("email", "uploaded_after", "uploaded_before")
+
+OPERATORS = ("AND", "OR", "NOT")
+
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# Le posting delle frasi includono le posizioni dei token
+PHRASE_PROJECTION = RANK_PROJECTION + ", pos"
+
+# Costo stimato del filtro sull'email, in CV da leggere (indice EmailIndex).
+# I filtri sulle date non hanno un indice: si applicano solo ai candidati
+# trovati dagli altri figli di un AND, per ultimi
+EMAIL_FILTER_COST = 10
+
+LEXER = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"?|(-)(?=[("\w])|([^\s()"]+))')
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+def lex(query):
+    """Divide la query in (tipo, valore): (, ), PHRASE, NOT, AND, OR, WORD."""
+    tokens = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        match = LEXER.match(query, position)
+        open_paren, close_paren, phrase, minus, word = match.groups()
+        position = match.end()
+        if open_paren:
+            tokens.append(("(", None))
+        elif close_paren:
+            tokens.append((")", None))
+        elif phrase is not None:
+            tokens.append(("PHRASE", phrase))
+        elif minus:
+            tokens.append(("NOT", None))
+        else:
+            tokens.append((word, None) if word in OPERATORS else ("WORD", word))
+    return tokens
+
+
+class Parser:
+    """
+    Parser a discesa ricorsiva:
+        or   := and ("OR" and)*
+        and  := not ("AND"? not)*
+        not  := "NOT" not | atom
+        atom := "(" or ")" | PHRASE | WORD
+    Le parole che si riducono a sole stopword scompaiono dall'albero.
+    """
+
+    def __init__(self, query):
+        self.tokens = lex(query)
+        self.index = 0
+
+    def peek(self):
+        if self.index < len(self.tokens):
+            return self.tokens[self.index][0]
+        return None
+
+    def next(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def parse(self):
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise InvalidQuery(f"Elemento inatteso nella query: {self.peek()}")
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == "OR":
+            self.next()
+            children.append(self.parse_and())
+        return combine(Or, children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek() not in (None, "OR", ")"):
+            if self.peek() == "AND":
+                self.next()
+            children.append(self.parse_not())
+        return combine(And, children)
+
+    def parse_not(self):
+        if self.peek() == "NOT":
+            self.next()
+            child = self.parse_not()
+            return Not(child) if child is not None else None
+        return self.parse_atom()
+
+    def parse_atom(self):
+        if self.peek() is None:
+            raise InvalidQuery("La query termina in modo inatteso")
+        kind, value = self.next()
+        if kind == "(":
+            node = self.parse_or()
+            if self.peek() != ")":
+                raise InvalidQuery("Parentesi non chiusa")
+            self.next()
+            return node
+        if kind == "PHRASE":
+            return phrase_node(value)
+        if kind == "WORD":
+            return word_node(value)
+        raise InvalidQuery(f"Elemento inatteso nella query: {kind}")
+
+
+def combine(node_type, children):
+    children = tuple(child for child in children if child is not None)
+    if not children:
+        return None
+    if len(children) == 1:
+        return children[0]
+    return node_type(children)
+
+
+def phrase_node(phrase):
+    words = phrase_terms(phrase)
+    if len(words) <= 1:
+        return Term(words[0][1]) if words else None
+    return Phrase(tuple(words))
+
+
+def word_node(word):
+    name, separator, value = word.partition(":")
+    if separator and name.lower() in FIELDS:
+        return field_node(name.lower(), value)
+    # Una parola composta (es. "front-end") richiede tutti i suoi token
+    return combine(And, [Term(token) for token in tokenize(word)])
+
+
+def field_node(name, value):
+    if not value:
+        raise InvalidQuery(f"Valore mancante per il filtro {name}")
+    if name != "email" and not valid_date(value):
+        raise InvalidQuery(f"Data non valida per il filtro {name}: {value}")
+    return Field(name, value)
+
+
+def valid_date(value):
+    """
+    Data ISO nella forma AAAA-MM-GG (confrontata come stringa con uploaded_at)
+    ed esistente nel calendario.
+    """
+    if not DATE_PATTERN.fullmatch(value):
+        return False
+    try:
+        datetime.date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def is_date_filter(node):
+    return isinstance(node, Field) and node.name != "email"
+
+
+def check_positive(node):
+    """
+    Ogni AND deve avere almeno un figlio positivo che non sia un filtro sulle
+    date e ogni ramo di un OR deve essere positivo: una NOT o un filtro sulle
+    date da soli richiederebbero di leggere tutti i CV.
+    """
+    if isinstance(node, Not):
+        raise InvalidQuery("NOT deve accompagnare almeno un termine positivo")
+    if is_date_filter(node):
+        raise InvalidQuery(f"Il filtro {node.name} deve accompagnare almeno un termine")
+    if isinstance(node, Or):
+        for child in node.children:
+            check_positive(child)
+    if isinstance(node, And):
+        positive = [c for c in node.children if not isinstance(c, Not)]
+        if not positive:
+            raise InvalidQuery("NOT deve accompagnare almeno un termine positivo")
+        dates = [c for c in positive if is_date_filter(c)]
+        if len(dates) == len(positive):
+            raise InvalidQuery(
+                f"Il filtro {dates[0].name} deve accompagnare almeno un termine"
+            )
+        for child in positive:
+            if not is_date_filter(child):
+                check_positive(child)
+
+
+def parse_query(query):
+    """
+    Compila la query in un albero di nodi (Term, Phrase, And, Or, Not,
+    Field); None se contiene solo stopword. Solleva InvalidQuery se la
+    sintassi non è valida.
+    """
+    node = Parser(query).parse()
+    if node is not None:
+        check_positive(node)
+    return node
+
+
+def query_tokens(node):
+    """Restituisce (termini positivi, tutti i termini) dell'albero."""
+    positive, every = [], []
+
+    def visit(node, negated):
+        if isinstance(node, Term):
+            tokens = [node.token]
+        elif isinstance(node, Phrase):
+            tokens = [token for _, token in node.words]
+        elif isinstance(node, (And, Or)):
+            for child in node.children:
+                visit(child, negated)
+            return
+        elif isinstance(node, Not):
+            visit(node.child, not negated)
+            return
+        else:
+            return
+        for token in tokens:
+            if token not in every:
+                every.append(token)
+            if not negated and token not in positive:
+                positive.append(token)
+
+    visit(node, False)
+    return positive, every
+
+
+def phrase_matches(postings, words):
+    """
+    Verifica sulle posizioni se i token della frase compaiono consecutivi
+    (alla distanza indicata dagli offset). Le posting scritte prima delle
+    posizioni non permettono la verifica e vengono accettate.
+    """
+    if any("pos" not in postings[token] for _, token in words):
+        return True
+    positions = {token: set(postings[token]["pos"]) for _, token in words}
+    first_offset, first = words[0]
+    return any(
+        all(
+            start - first_offset + offset in positions[token] for offset, token in words
+        )
+        for start in positions[first]
+    )
+
+
+class QueryPlan:
+    """
+    Esecuzione di una query compilata. Restituisce, come le ricerche per
+    parole chiave, {cv_id: {termine: posting}} con le posting dei termini
+    positivi trovati, utilizzabili per il ranking BM25.
+    """
+
+    def __init__(self, dfs, doc_count):
+        self.dfs = dfs
+        self.doc_count = doc_count
+        # Attributi dei CV letti per i filtri sui campi, per cv_id
+        self.attributes = {}
+
+    def cost(self, node):
+        """Stima del numero di CV che il nodo può restituire."""
+        if isinstance(node, Term):
+            return self.dfs.get(node.token, 0)
+        if isinstance(node, Phrase):
+            return min(self.dfs.get(token, 0) for _, token in node.words)
+        if isinstance(node, And):
+            return min(
+                (self.cost(c) for c in node.children if not isinstance(c, Not)),
+                default=self.doc_count,
+            )
+        if isinstance(node, Or):
+            return sum(self.cost(c) for c in node.children)
+        if isinstance(node, Field) and node.name == "email":
+            return EMAIL_FILTER_COST
+        return self.doc_count
+
+    def evaluate(self, node, candidates=None):
+        """
+        Valuta il nodo; con `candidates` ({cv_id: posting già trovate})
+        restituisce solo i candidati che lo soddisfano. Una NOT si valuta
+        solo sui candidati (vedi check_positive).
+        """
+        if isinstance(node, Term):
+            return (yield from self.term(node.token, candidates, RANK_PROJECTION))
+        if isinstance(node, Phrase):
+            return (yield from self.phrase(node, candidates))
+        if isinstance(node, And):
+            return (yield from self.conjunction(node, candidates))
+        if isinstance(node, Or):
+            return (yield from self.disjunction(node, candidates))
+        if isinstance(node, Not):
+            return (yield from self.exclude(node.child, candidates))
+        return (yield from self.field(node, candidates))
+
+    def term(self, token, candidates, projection):
+        df = self.dfs.get(token, 0)
+        if df == 0:
+            return {}
+        if candidates is not None and should_probe(candidates, df):
+            postings = yield from probe_postings(token, candidates, projection)
+        else:
+            postings = yield from posting_list(token, projection)
+        return join_postings(candidates, token, postings)
+
+    def phrase(self, node, candidates):
+        matches = candidates
+        tokens = sorted({token for _, token in node.words}, key=self.dfs.get)
+        for token in tokens:
+            matches = yield from self.term(token, matches, PHRASE_PROJECTION)
+            if not matches:
+                return {}
+        return {
+            cv_id: postings
+            for cv_id, postings in matches.items()
+            if phrase_matches(postings, node.words)
+        }
+
+    def conjunction(self, node, candidates):
+        positive = [c for c in node.children if not isinstance(c, Not)]
+        negative = [c.child for c in node.children if isinstance(c, Not)]
+        matches = candidates
+        # Dal figlio più selettivo: ogni passo riduce i candidati del
+        # successivo; i filtri sulle date solo sui candidati già trovati
+        for child in sorted(positive, key=lambda c: (is_date_filter(c), self.cost(c))):
+            matches = yield from self.evaluate(child, matches)
+            if not matches:
+                return {}
+        for child in sorted(negative, key=self.cost):
+            matches = yield from self.exclude(child, matches)
+            if not matches:
+                return {}
+        return matches
+
+    def exclude(self, node, candidates):
+        """Candidati che non soddisfano il nodo."""
+        excluded = yield from self.evaluate(node, {cv_id: {} for cv_id in candidates})
+        return {k: v for k, v in candidates.items() if k not in excluded}
+
+    def disjunction(self, node, candidates):
+        matches = {}
+        for child in sorted(node.children, key=self.cost):
+            if candidates is None:
+                found = yield from self.evaluate(child)
+            else:
+                # Un CV già trovato da un ramo non viene più verificato
+                pending = {k: v for k, v in candidates.items() if k not in matches}
+                if not pending:
+                    break
+                found = yield from self.evaluate(child, pending)
+            for cv_id, postings in found.items():
+                matches.setdefault(cv_id, {}).update(postings)
+        return matches
+
+    def field(self, node, candidates):
+        if candidates is None:
+            cv_ids = yield from self.field_cv_ids(node)
+            return {cv_id: {} for cv_id in cv_ids}
+        missing = [cv_id for cv_id in candidates if cv_id not in self.attributes]
+        if missing:
+            keys = [{"cv_id": cv_id} for cv_id in missing]
+            items = yield BatchGet(
+                CV_TABLE, keys, {"ProjectionExpression": "cv_id, email, uploaded_at"}
+            )
+            self.attributes.update((item["cv_id"], item) for item in items)
+        return {
+            cv_id: postings
+            for cv_id, postings in candidates.items()
+            if field_matches(node, self.attributes.get(cv_id, {}))
+        }
+
+    def field_cv_ids(self, node):
+        """
+        cv_id con l'email del filtro, senza altri candidati. check_positive
+        garantisce che i filtri sulle date abbiano sempre dei candidati.
+        """
+        items = yield ReadAll(
+            "query",
+            {
+                "TableName": CV_TABLE,
+                "IndexName": "EmailIndex",
+                "KeyConditionExpression": Key("email").eq(node.value),
+                "ProjectionExpression": "cv_id",
+            },
+        )
+        return [item["cv_id"] for item in items]
+
+
+def field_matches(node, item):
+    """uploaded_after è inclusivo, uploaded_before esclusivo (date ISO)."""
+    if node.name == "email":
+        return item.get("email") == node.value
+    uploaded_at = item.get("uploaded_at")
+    if not uploaded_at:
+        return False
+    if node.name == "uploaded_after":
+        return uploaded_at >= node.value
+    return uploaded_at < node.value
+
+
+def execute_query(node):
+    """
+    Esegue una query compilata e restituisce (corpus, {termine: df},
+    {cv_id: {termine: posting}}). Document frequency e statistiche del
+    corpus sono lette con una sola BatchGetItem e guidano l'ordine di
+    valutazione.
+    """
+    if node is None:
+        return {}, {}, {}
+    _, tokens = query_tokens(node)
+    corpus, dfs = yield from read_stats(tokens)
+    plan = QueryPlan(dfs, int(corpus.get("doc_count", 0)))
+    return corpus, dfs, (yield from plan.evaluate(node))
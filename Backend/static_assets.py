@@ -0,0 +1,215 @@
+"""
+Servizio dei file statici del frontend (export di Next.js in out/).
+
+All'avvio viene costruito un manifest che associa ogni route a un file della
+build, comprese le route di pagina (/dashboard -> dashboard/index.html), così
+ogni richiesta si risolve con una sola lookup in un dizionario, senza
+accessi al filesystem. Per i file testuali il manifest tiene in memoria anche
+le varianti gzip e brotli, scelte in base ad Accept-Encoding, con un ETag per
+variante. Gli asset con hash nel nome (_next/static) sono serviti con
+Cache-Control immutable, le pagine HTML vengono sempre rivalidate.
+
+Le varianti compresse possono essere generate in fase di build
+(python static_assets.py out, come nel Dockerfile): in quel caso i file .gz e
+.br accanto agli originali vengono letti invece di comprimere all'avvio.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import sys
+
+try:
+    import brotli
+except ImportError:  # dipendenza opzionale: senza, solo gzip
+    brotli = None
+
+# Asset con hash nel nome: il contenuto di un URL non cambia mai
+IMMUTABLE_PREFIX = "_next/static/"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Sotto questa dimensione la compressione non ripaga
+MIN_COMPRESS_SIZE = 1024
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+)
+# Estensioni delle varianti precompresse, in ordine di preferenza
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class StaticAsset:
+    """Un file della build con le sue varianti compresse e i relativi ETag."""
+
+    def __init__(self, rel_path, body, content_type, cache_control):
+        self.rel_path = rel_path
+        self.content_type = content_type
+        self.cache_control = cache_control
+        digest = hashlib.sha1(body).hexdigest()[:20]
+        # encoding -> (corpo, ETag); None è la variante non compressa
+        self.variants = {None: (body, f'"{digest}"')}
+        self._digest = digest
+
+    def add_variant(self, encoding, body):
+        if len(body) < len(self.variants[None][0]):
+            self.variants[encoding] = (body, f'"{self._digest}-{encoding}"')
+
+    def select(self, accept_encodings):
+        """Sceglie la variante migliore accettata dal client."""
+        for encoding, _ in ENCODINGS:
+            if encoding in self.variants and accept_encodings.quality(encoding) > 0:
+                return encoding
+        return None
+
+    def headers(self, encoding):
+        _, etag = self.variants[encoding]
+        headers = {
+            "Content-Type": self.content_type,
+            "Cache-Control": self.cache_control,
+            "ETag": etag,
+        }
+        if len(self.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return headers
+
+
+def is_compressible(content_type):
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(encoding, body):
+    if encoding == "br":
+        return brotli.compress(body, quality=11) if brotli is not None else None
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def content_type_for(rel_path):
+    content_type = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+    if content_type.startswith("text/") or content_type == "application/javascript":
+        content_type += "; charset=utf-8"
+    return content_type
+
+
+def iter_build_files(root):
+    """Percorsi relativi (con '/') dei file della build, esclusi .gz e .br."""
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(tuple(ext for _, ext in ENCODINGS)):
+                continue
+            full_path = os.path.join(dirpath, filename)
+            yield os.path.relpath(full_path, root).replace(os.sep, "/")
+
+
+def load_asset(root, rel_path):
+    full_path = os.path.join(root, rel_path)
+    with open(full_path, "rb") as f:
+        body = f.read()
+    content_type = content_type_for(rel_path)
+    if rel_path.startswith(IMMUTABLE_PREFIX):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = REVALIDATE_CACHE_CONTROL
+    asset = StaticAsset(rel_path, body, content_type, cache_control)
+    if is_compressible(content_type) and len(body) >= MIN_COMPRESS_SIZE:
+        for encoding, ext in ENCODINGS:
+            if os.path.isfile(full_path + ext):
+                with open(full_path + ext, "rb") as f:
+                    compressed = f.read()
+            else:
+                compressed = compress(encoding, body)
+            if compressed is not None:
+                asset.add_variant(encoding, compressed)
+    return asset
+
+
+def route_for(rel_path):
+    """Route servita da un file: dashboard/index.html -> dashboard."""
+    if rel_path == "index.html":
+        return ""
+    if rel_path.endswith("/index.html"):
+        return rel_path[: -len("/index.html")]
+    return rel_path
+
+
+class StaticSite:
+    """Manifest route -> StaticAsset della build del frontend."""
+
+    def __init__(self, root):
+        self.root = root
+        self.routes = {}
+        if not os.path.isdir(root):
+            print(f"Build del frontend non trovata in {root}")
+            return
+        for rel_path in iter_build_files(root):
+            asset = load_asset(root, rel_path)
+            self.routes[rel_path] = asset
+            self.routes.setdefault(route_for(rel_path), asset)
+        print(f"Manifest statico: {len(self.routes)} route da {root}")
+
+    def lookup(self, path):
+        """
+        Asset per il percorso richiesto; per le route sconosciute index.html,
+        così il routing lato client di Next.js gestisce il resto.
+        """
+        asset = self.routes.get(path.strip("/"))
+        if asset is None:
+            asset = self.routes.get("")
+        return asset
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def static_response(site, path, request, response_class):
+    """
+    Risposta per un file statico, valida per Flask e Quart: la variante
+    scelta da Accept-Encoding, oppure 304 se l'ETag del client è aggiornato.
+    """
+    asset = site.lookup(path)
+    if asset is None:
+        return response_class(
+            '{"error": "Not Found"}', 404, mimetype="application/json"
+        )
+    encoding = asset.select(request.accept_encodings)
+    headers = asset.headers(encoding)
+    if etag_matches(request.headers.get("If-None-Match"), headers["ETag"]):
+        del headers["Content-Type"]
+        return response_class(b"", 304, headers)
+    return response_class(asset.variants[encoding][0], 200, headers)
+
+
+def precompress(root):
+    """Scrive accanto ai file della build le varianti .gz e .br."""
+    written = 0
+    for rel_path in iter_build_files(root):
+        full_path = os.path.join(root, rel_path)
+        if not is_compressible(content_type_for(rel_path)):
+            continue
+        with open(full_path, "rb") as f:
+            body = f.read()
+        if len(body) < MIN_COMPRESS_SIZE:
+            continue
+        for encoding, ext in ENCODINGS:
+            compressed = compress(encoding, body)
+            if compressed is not None and len(compressed) < len(body):
+                with open(full_path + ext, "wb") as f:
+                    f.write(compressed)
+                written += 1
+    print(f"Varianti compresse scritte: {written}")
+
+
+if __name__ == "__main__":
+    precompress(sys.argv[1] if len(sys.argv) > 1 else "out")
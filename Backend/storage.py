@@ -0,0 +1,61 @@
+"""
+Operazioni di lettura condivise dal backend sincrono e da quello asincrono.
+
+La logica delle richieste (ricerche, elenchi, cache, vedi cv_api.py) è scritta
+come generatori che non eseguono I/O: quando serve un dato producono
+un'operazione (yield ReadPage(...), yield BatchGet(...)) e ricevono il
+risultato come valore dell'espressione yield. Un driver esegue le operazioni:
+run con boto3 e i pool di thread (main.py), run_async con aioboto3 e
+asyncio.gather (async_app.py). I due server eseguono così esattamente la
+stessa logica e differiscono solo per come leggono DynamoDB, S3 e la cache.
+
+Un'eccezione dell'operazione viene rilanciata dentro il generatore nel punto
+dello yield, quindi i try/except della logica funzionano come con chiamate
+dirette.
+"""
+
+from collections import namedtuple
+
+# Una pagina di Query o Scan (operation: "query" o "scan"): la risposta
+ReadPage = namedtuple("ReadPage", "operation args")
+# Tutte le pagine di una Query o Scan: la lista degli item
+ReadAll = namedtuple("ReadAll", "operation args")
+# GetItem: l'item, {} se non esiste
+GetItem = namedtuple("GetItem", "args")
+# BatchGetItem a blocchi paralleli, con le UnprocessedKeys ripetute: gli item
+BatchGet = namedtuple("BatchGet", "table keys args")
+# Scan completa a segmenti paralleli: (item, tempi per segmento)
+ParallelScan = namedtuple("ParallelScan", "table segments args")
+# Ricostruzione del campo "text" degli item (vedi cv_text.py): gli item
+ExpandTexts = namedtuple("ExpandTexts", "items")
+# Lettura e scrittura della cache dei risultati (vedi cache.py)
+CacheGet = namedtuple("CacheGet", "key version")
+CacheSet = namedtuple("CacheSet", "key value version")
+
+
+def run(steps, perform):
+    """Esegue il generatore `steps` con la funzione sincrona `perform`."""
+    value, error = None, None
+    while True:
+        try:
+            operation = steps.throw(error) if error else steps.send(value)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            value, error = perform(operation), None
+        except Exception as e:
+            value, error = None, e
+
+
+async def run_async(steps, perform):
+    """Come run, con la coroutine `perform`."""
+    value, error = None, None
+    while True:
+        try:
+            operation = steps.throw(error) if error else steps.send(value)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            value, error = await perform(operation), None
+        except Exception as e:
+            value, error = None, e
@@ -0,0 +1,235 @@
+"""
+Suggerimenti di completamento per la casella di ricerca.
+
+Il vocabolario è ricavato dagli aggregati dell'indice invertito: ogni item
+"term#<token>" di CVStats contiene la document frequency del termine (o di
+uno dei suoi shard, vedi cv_stats.py), quindi basta una Scan di CVStats
+(qualche migliaio di item piccoli) per conoscere tutti i termini indicizzati,
+senza leggere la tabella CVs.
+
+I termini sono tenuti in memoria in una lista ordinata: i completamenti di un
+prefisso sono un intervallo contiguo della lista, trovato con due ricerche
+binarie, e tra questi vengono restituiti i più frequenti. Il vocabolario viene
+ricostruito quando cambia la versione dei dati (vedi cache.DataVersion), al
+più una volta ogni `refresh_interval` secondi; nel frattempo le richieste
+usano quello precedente.
+
+Con lo stemming (TEXT_STEMMING) i termini sono radici come "engin": la Lambda
+salva negli item dei termini anche una parola del testo che vi si riduce
+(surface, es. "engine"), mostrata nei suggerimenti al posto della radice.
+
+Lo stesso vocabolario serve la ricerca tollerante agli errori di battitura
+(fuzzy=1): un indice dei trigrammi di caratteri dei termini trova i candidati
+che condividono abbastanza trigrammi con la parola cercata, e solo su questi
+si calcola la distanza di edit, senza confrontare la parola con ogni termine.
+"""
+
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from boto3.dynamodb.conditions import Attr
+
+from cv_stats import TERM_PREFIX, stat_term
+from search_index import STATS_TABLE
+from storage import ReadAll
+from text_processing import fold
+
+DEFAULT_SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+
+# Alternative al massimo per ogni parola della ricerca fuzzy
+FUZZY_MAX_EXPANSIONS = 5
+
+# Argomenti della Scan di CVStats che legge i soli item dei termini
+VOCABULARY_SCAN_ARGS = {
+    "TableName": STATS_TABLE,
+    "FilterExpression": Attr("stat_id").begins_with(TERM_PREFIX),
+    "ProjectionExpression": "stat_id, df, surface",
+}
+
+
+def suggest_limit(args):
+    """Numero di completamenti richiesto con 'limit', entro MAX_SUGGEST_LIMIT."""
+    limit = args.get("limit", DEFAULT_SUGGEST_LIMIT, type=int)
+    return min(max(limit, 1), MAX_SUGGEST_LIMIT)
+
+
+def max_edits(term):
+    """Errori tollerati: nessuno fino a 3 caratteri, 1 fino a 7, poi 2."""
+    if len(term) <= 3:
+        return 0
+    return 1 if len(term) <= 7 else 2
+
+
+def trigrams(term):
+    """Trigrammi distinti del termine, con due caratteri di bordo per lato."""
+    padded = f"\0\0{term}\0\0"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    """
+    Distanza di edit tra a e b (inserimenti, cancellazioni, sostituzioni e
+    scambi di due caratteri adiacenti, l'errore di battitura più comune),
+    interrotta appena supera `limit`: in quel caso restituisce limit + 1.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i]
+        for j in range(1, len(b) + 1):
+            cost = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (a[i - 1] != b[j - 1]),
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def normalize_prefix(prefix):
+    """
+    Il prefisso viene solo ripiegato come i token indicizzati (minuscole,
+    senza accenti): stopword e stemming valgono per parole intere.
+    """
+    return fold(prefix.strip())
+
+
+class Vocabulary:
+    """
+    Termini indicizzati in ordine alfabetico, con la loro document frequency,
+    letti da CVStats alla versione dei dati `version`.
+    """
+
+    def __init__(self, stats_items=(), version=None):
+        self.version = version
+        dfs = Counter()
+        # Una forma per radice, la stessa qualunque sia l'ordine degli shard
+        self._surfaces = {}
+        for item in stats_items:
+            term = stat_term(item["stat_id"])
+            dfs[term] += int(item.get("df", 0))
+            if "surface" in item:
+                surface = self._surfaces.get(term, item["surface"])
+                self._surfaces[term] = min(
+                    surface, item["surface"], key=lambda w: (len(w), w)
+                )
+        # I termini non più presenti in alcun CV restano in CVStats con df 0
+        entries = sorted((term, df) for term, df in dfs.items() if df > 0)
+        self._terms = [term for term, _ in entries]
+        self._dfs = [df for _, df in entries]
+        self._positions = {term: i for i, term in enumerate(self._terms)}
+        # Indice dei trigrammi: trigramma -> posizioni dei termini che lo contengono
+        self._trigrams = {}
+        for i, term in enumerate(self._terms):
+            for gram in trigrams(term):
+                self._trigrams.setdefault(gram, []).append(i)
+
+    def __len__(self):
+        return len(self._terms)
+
+    def complete(self, prefix, limit=DEFAULT_SUGGEST_LIMIT):
+        """
+        Restituisce i `limit` termini che iniziano con `prefix` presenti nel
+        maggior numero di CV, come lista di {"term", "count"}; un termine
+        ridotto dallo stemming è mostrato nella sua forma intera.
+        """
+        if not prefix:
+            return []
+        start = bisect_left(self._terms, prefix)
+        # Il carattere massimo segue ogni carattere dei token: fine dell'intervallo
+        end = bisect_left(self._terms, prefix + "\U0010ffff", lo=start)
+        best = heapq.nsmallest(
+            limit, range(start, end), key=lambda i: (-self._dfs[i], self._terms[i])
+        )
+        return [
+            {
+                "term": self._surfaces.get(self._terms[i], self._terms[i]),
+                "count": self._dfs[i],
+            }
+            for i in best
+        ]
+
+    def similar(self, term, limit=FUZZY_MAX_EXPANSIONS):
+        """
+        Termini del vocabolario entro max_edits(term) modifiche dal termine
+        (compreso il termine stesso, se presente), dal più vicino e a parità
+        dal più frequente. Un errore altera al più 4 trigrammi (lo scambio di
+        due lettere adiacenti), quindi i candidati devono condividerne almeno
+        len(trigrammi) - 4 * errori.
+        """
+        edits = max_edits(term)
+        if edits == 0:
+            return [term] if term in self._positions else []
+        grams = trigrams(term)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._trigrams.get(gram, ()))
+        threshold = max(len(grams) - 4 * edits, 1)
+        found = []
+        for i, count in shared.items():
+            if count < threshold:
+                continue
+            distance = edit_distance(term, self._terms[i], edits)
+            if distance <= edits:
+                found.append((distance, -self._dfs[i], self._terms[i]))
+        return [candidate for _, _, candidate in sorted(found)[:limit]]
+
+
+class SuggestIndex:
+    """
+    Vocabolario condiviso dalle richieste del processo, ricostruito dagli
+    item "term#" di CVStats quando la versione dei dati cambia.
+    """
+
+    def __init__(self, refresh_interval=30.0):
+        self._refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self.current = None
+        self._built_at = 0.0
+
+    def is_current(self, version):
+        """Il vocabolario è valido per `version` o è stato costruito da poco."""
+        return self.current is not None and (
+            version == self.current.version
+            or time.monotonic() - self._built_at < self._refresh_interval
+        )
+
+    def update(self, vocabulary):
+        self.current = vocabulary
+        self._built_at = time.monotonic()
+
+    def vocabulary(self, version):
+        """
+        Generatore che produce la Scan di CVStats quando serve (storage.py).
+        Il vocabolario restituito può essere di una versione precedente
+        (Vocabulary.version): chi ne mette in cache i risultati deve
+        controllarla.
+        """
+        vocabulary = self.current
+        if self.is_current(version):
+            return vocabulary
+        # Una sola ricostruzione alla volta: le altre richieste usano il
+        # vocabolario precedente; senza vocabolario (all'avvio) lo leggono
+        # anche loro invece di attendere, che bloccherebbe l'event loop
+        claimed = self._lock.acquire(blocking=False)
+        if not claimed and vocabulary is not None:
+            return vocabulary
+        try:
+            if not self.is_current(version):
+                items = yield ReadAll("scan", VOCABULARY_SCAN_ARGS)
+                self.update(Vocabulary(items, version))
+            return self.current
+        finally:
+            if claimed:
+                self._lock.release()
@@ -0,0 +1,102 @@
+"""
+Configurazione comune dei test del backend.
+
+I test non usano AWS: un server moto locale, avviato una volta per la
+sessione, sostituisce DynamoDB e S3 per il backend sincrono, per quello
+asincrono (aioboto3 non passa dai mock in-process di moto) e per la Lambda di
+ingestione, che scrive i CV, l'indice e le statistiche letti dalle API.
+L'endpoint va impostato prima di importare i moduli, che creano i client
+all'import.
+"""
+
+import hashlib
+import os
+import socket
+import sys
+
+import pytest
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "scripts")
+sys.path[:0] = [BACKEND_DIR, SCRIPTS_DIR]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+MOTO_PORT = free_port()
+ENDPOINT_URL = f"http://127.0.0.1:{MOTO_PORT}"
+
+os.environ.update(
+    AWS_ACCESS_KEY_ID="testing",
+    AWS_SECRET_ACCESS_KEY="testing",
+    AWS_DEFAULT_REGION="eu-west-2",
+    AWS_REGION="eu-west-2",
+    REGION="eu-west-2",
+    AWS_ENDPOINT_URL=ENDPOINT_URL,
+    DYNAMODB_ENDPOINT_URL=ENDPOINT_URL,
+    # Versione dei dati e vocabolario riletti a ogni richiesta
+    CACHE_VERSION_INTERVAL="0",
+    SUGGEST_REFRESH_INTERVAL="0",
+)
+os.environ.pop("REDIS_URL", None)
+os.environ.pop("TEXT_STEMMING", None)
+
+BUCKET = "cv-bucket"
+
+
+@pytest.fixture(scope="session")
+def moto_server():
+    from moto.server import ThreadedMotoServer
+
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=MOTO_PORT, verbose=False)
+    server.start()
+    yield ENDPOINT_URL
+    server.stop()
+
+
+@pytest.fixture
+def aws(moto_server):
+    """Tabelle e bucket vuoti per ogni test."""
+    import boto3
+    import deploy_dynamodb
+
+    requests.post(f"{moto_server}/moto-api/reset", timeout=10)
+    deploy_dynamodb.create_cv_table()
+    deploy_dynamodb.create_terms_table()
+    deploy_dynamodb.create_stats_table()
+    deploy_dynamodb.create_contents_table()
+    boto3.client("s3").create_bucket(
+        Bucket=BUCKET,
+        CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+    )
+    return moto_server
+
+
+def object_head(key, text, email, uploaded_at):
+    """
+    Risposta di HeadObject di un CV caricato dal frontend; l'ETag, come in S3,
+    dipende solo dal contenuto.
+    """
+    etag = hashlib.md5(text.encode()).hexdigest()
+    return {
+        "ETag": f'"{etag}"',
+        "Metadata": {"email": email, "uploaddate": uploaded_at, "originalname": key},
+    }
+
+
+@pytest.fixture
+def add_cv(aws):
+    """Scrive e indicizza un CV come la Lambda dopo l'estrazione del testo."""
+    import lambda_function
+
+    def add(key, text, email="anna@example.com", uploaded_at="2025-01-01"):
+        head = object_head(key, text, email, uploaded_at)
+        lambda_function.store_cv(BUCKET, key, head, text)
+        return head
+
+    return add
@@ -0,0 +1,305 @@
+"""
+Endpoint dei CV su moto, eseguiti sia dall'app Flask (main.py) sia
+dall'app asincrona (async_app.py): i due server condividono la logica di
+cv_api.py e devono dare le stesse risposte.
+"""
+
+import asyncio
+import json
+from collections import namedtuple
+
+import pytest
+
+import async_app
+import main
+from cv_api import Reply, Stream, create_api
+from pagination import encode_cursor
+from projection import INTERNAL_ATTRIBUTES
+
+Response = namedtuple("Response", "status headers text")
+
+
+def body(response):
+    return json.loads(response.text)
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+class FlaskServer:
+    def __init__(self):
+        self.client = main.app.test_client()
+
+    def request(self, method, path, headers=None, payload=None):
+        response = self.client.open(path, method=method, headers=headers, json=payload)
+        return Response(
+            response.status_code, response.headers, response.get_data(as_text=True)
+        )
+
+
+class AsyncServer:
+    """Ogni richiesta avvia l'app (before_serving apre il client aioboto3)."""
+
+    def request(self, method, path, headers=None, payload=None):
+        async def send():
+            async with async_app.app.test_app() as test_app:
+                response = await test_app.test_client().open(
+                    path, method=method, headers=headers, json=payload
+                )
+                text = await response.get_data(as_text=True)
+                return Response(response.status_code, response.headers, text)
+
+        return asyncio.run(send())
+
+
+SERVERS = {"flask": FlaskServer, "async": AsyncServer}
+
+
+@pytest.fixture
+def fresh_api(monkeypatch):
+    """Cache e vocabolario nuovi per ogni test (moto viene azzerato)."""
+    monkeypatch.setattr(main, "api", create_api())
+    monkeypatch.setattr(async_app, "api", create_api())
+
+
+@pytest.fixture
+def corpus(add_cv):
+    add_cv("a.pdf", "Python AWS machine learning", uploaded_at="2024-03-01")
+    add_cv("b.pdf", "Python PHP learning machine", uploaded_at="2024-06-01")
+    add_cv("c.pdf", "Java GCP", email="bruno@example.com", uploaded_at="2024-09-01")
+    add_cv("d.pdf", "Python GCP Kubernetes", email="bruno@example.com")
+
+
+@pytest.fixture(params=SERVERS)
+def server(request, corpus, fresh_api):
+    return SERVERS[request.param]()
+
+
+def get(server, path, headers=None):
+    return server.request("GET", path, headers)
+
+
+def cv_ids(response):
+    return sorted(cv["cv_id"] for cv in body(response)["cvs"])
+
+
+def test_list_all_cvs(server):
+    response = get(server, "/api/cvs?segments=2")
+    assert response.status == 200
+    assert cv_ids(response) == ["a.pdf", "b.pdf", "c.pdf", "d.pdf"]
+    assert response.headers["Server-Timing"].count("scan-seg") == 2
+    # Gli attributi interni della Lambda non sono esposti
+    for cv in body(response)["cvs"]:
+        assert not set(INTERNAL_ATTRIBUTES) & cv.keys()
+        assert cv["email"] in ("anna@example.com", "bruno@example.com")
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("keywords=python,gcp", ["d.pdf"]),
+        ("keywords=pyhton&fuzzy=1", ["a.pdf", "b.pdf", "d.pdf"]),
+        ("q=python -php", ["a.pdf", "d.pdf"]),
+        ('q="machine learning"', ["a.pdf"]),
+        ("q=gcp email:bruno@example.com", ["c.pdf", "d.pdf"]),
+        ("q=python uploaded_after:2024-05-01", ["b.pdf", "d.pdf"]),
+    ],
+)
+def test_search(server, query, expected):
+    response = get(server, f"/api/cvs?{query}")
+    assert response.status == 200
+    assert cv_ids(response) == expected
+
+
+def test_fuzzy_terms(server):
+    response = get(server, "/api/cvs?keywords=pyhton,kubernets&fuzzy=1")
+    assert body(response)["fuzzy_terms"] == {
+        "pyhton": ["python"],
+        "kubernets": ["kubernetes"],
+    }
+    assert cv_ids(response) == ["d.pdf"]
+
+
+def refresh_vocabulary_every(seconds):
+    for app in (main, async_app):
+        app.api.suggest_index._refresh_interval = seconds
+
+
+def test_fuzzy_results_of_a_stale_vocabulary_are_not_cached(server, add_cv):
+    path = "/api/cvs?keywords=rustt&fuzzy=1"
+    refresh_vocabulary_every(60)
+    assert body(get(server, path))["fuzzy_terms"] == {"rustt": []}
+
+    # Il vocabolario costruito da poco resta in uso dopo il nuovo CV
+    add_cv("e.pdf", "Rust Python")
+    assert body(get(server, path))["fuzzy_terms"] == {"rustt": []}
+    assert body(get(server, path))["fuzzy_terms"] == {"rustt": []}
+    assert body(get(server, "/api/cache/stats"))["results"]["hits"] == 0
+
+    refresh_vocabulary_every(0)
+    for _ in range(2):
+        response = get(server, path)
+        assert body(response)["fuzzy_terms"] == {"rustt": ["rust"]}
+        assert cv_ids(response) == ["e.pdf"]
+    assert body(get(server, "/api/cache/stats"))["results"]["hits"] == 1
+
+
+def test_bm25_ranking(server):
+    # Tre CV contengono python: d.pdf, il più breve, ha il punteggio migliore
+    response = get(server, "/api/cvs?keywords=python&rank=bm25&limit=2")
+    cvs = body(response)["cvs"]
+    assert len(cvs) == 2
+    assert cvs[0]["cv_id"] == "d.pdf"
+    assert cvs[0]["score"] > cvs[1]["score"]
+
+
+@pytest.mark.parametrize(
+    "path",
+    ["/api/cvs?limit=3", "/api/cvs?keywords=python&limit=2", "/api/cvs?q=gcp&limit=1"],
+)
+def test_cursor_pages(server, path):
+    seen = []
+    response = get(server, path)
+    while True:
+        page = body(response)
+        seen += [cv["cv_id"] for cv in page["cvs"]]
+        if page["next_cursor"] is None:
+            break
+        response = get(server, f"{path}&cursor={page['next_cursor']}")
+    everything = body(get(server, path.split("limit")[0].rstrip("&?")))["cvs"]
+    assert sorted(seen) == sorted(cv["cv_id"] for cv in everything)
+    assert len(seen) == len(set(seen))
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/api/cvs?cursor=%21%21",
+        # Chiave che non corrisponde allo schema della tabella o dell'indice
+        "/api/cvs?cursor=" + encode_cursor({"key": {"foo": "bar"}}),
+        "/api/cvs/user/anna@example.com?cursor="
+        + encode_cursor({"key": {"cv_id": "a.pdf"}}),
+        "/api/cvs?fields=password",
+        "/api/cvs?q=(python",
+        "/api/cvs?q=uploaded_after:2024-01-01",
+        "/api/cvs?q=python%20uploaded_after:2024-13-99",
+    ],
+)
+def test_bad_requests(server, path):
+    response = get(server, path)
+    assert response.status == 400
+    assert "error" in body(response)
+
+
+def test_ndjson_stream(server):
+    response = get(server, "/api/cvs?format=ndjson")
+    assert response.status == 200
+    assert response.headers["Content-Type"].startswith("application/x-ndjson")
+    assert sorted(cv["cv_id"] for cv in ndjson(response)) == [
+        "a.pdf",
+        "b.pdf",
+        "c.pdf",
+        "d.pdf",
+    ]
+
+
+def test_not_modified_until_data_changes(server, add_cv):
+    response = get(server, "/api/cvs?keywords=python")
+    etag = response.headers["ETag"]
+
+    response = get(server, "/api/cvs?keywords=python", {"If-None-Match": etag})
+    assert response.status == 304
+    assert response.text == ""
+
+    add_cv("e.pdf", "Python Rust")
+    response = get(server, "/api/cvs?keywords=python", {"If-None-Match": etag})
+    assert response.status == 200
+    assert "e.pdf" in cv_ids(response)
+
+
+def test_user_cvs(server):
+    response = get(server, "/api/cvs/user/bruno@example.com?fields=cv_id,email")
+    assert cv_ids(response) == ["c.pdf", "d.pdf"]
+    assert all(cv.keys() == {"cv_id", "email"} for cv in body(response)["cvs"])
+
+    etag = response.headers["ETag"]
+    response = get(
+        server,
+        "/api/cvs/user/bruno@example.com?fields=cv_id,email",
+        {"If-None-Match": etag},
+    )
+    assert response.status == 304
+
+    response = get(server, "/api/cvs/user/nobody@example.com")
+    assert body(response)["count"] == 0
+
+
+def test_user_cvs_without_data_version(server, monkeypatch):
+    """Se la versione dei dati non si legge, la risposta è servita senza cache."""
+
+    def unavailable():
+        raise RuntimeError("CVStats non raggiungibile")
+        yield
+
+    for app in (main, async_app):
+        monkeypatch.setattr(app.api.data_version, "current", unavailable)
+    response = get(server, "/api/cvs/user/bruno@example.com")
+    assert response.status == 200
+    assert cv_ids(response) == ["c.pdf", "d.pdf"]
+
+
+def test_replies_do_not_share_headers():
+    first, second = Reply({}), Reply({})
+    first.headers["ETag"] = '"v1"'
+    assert second.headers == {}
+    assert Stream(None, "scan", {}).headers == {}
+
+
+def test_batch(server):
+    response = server.request(
+        "POST",
+        "/api/cvs/batch?fields=cv_id",
+        payload={"cv_ids": ["c.pdf", "zzz.pdf", "a.pdf"]},
+    )
+    assert response.status == 200
+    assert [cv["cv_id"] for cv in body(response)["cvs"]] == ["c.pdf", "a.pdf"]
+    assert body(response)["missing"] == ["zzz.pdf"]
+
+    response = server.request("POST", "/api/cvs/batch", payload={"cv_ids": "a.pdf"})
+    assert response.status == 400
+
+
+def test_suggest(server):
+    response = get(server, "/api/cvs/suggest?prefix=P")
+    assert body(response)["suggestions"] == [
+        {"term": "python", "count": 3},
+        {"term": "php", "count": 1},
+    ]
+
+
+def test_search_results_are_cached(server):
+    get(server, "/api/cvs?keywords=python,aws")
+    get(server, "/api/cvs?keywords=aws,python")
+    stats = body(get(server, "/api/cache/stats"))["results"]
+    assert stats["hits"] == 1
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/api/cvs",
+        "/api/cvs?keywords=python,machine&snippets=1",
+        "/api/cvs?q=python OR java&limit=2",
+        "/api/cvs?keywords=python,gcp&rank=bm25",
+        "/api/cvs/user/anna@example.com?limit=1",
+        "/api/cvs/suggest?prefix=ja",
+    ],
+)
+def test_servers_give_the_same_response(corpus, fresh_api, path):
+    flask, asynchronous = FlaskServer(), AsyncServer()
+    expected = get(flask, path)
+    response = get(asynchronous, path)
+    assert response.status == expected.status
+    assert response.headers.get("ETag") == expected.headers.get("ETag")
+    assert body(response) == body(expected)
@@ -0,0 +1,107 @@
+import base64
+import json
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from pagination import (
+    InvalidCursor,
+    decode_cursor,
+    encode_cursor,
+    is_paginated,
+    page_limit,
+)
+
+
+def raw_cursor(state):
+    """Cursore costruito a mano, come potrebbe farlo un client."""
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize(
+    "state",
+    [
+        {"offset": 40},
+        {"after": "cv-0042.pdf"},
+        {"key": {"cv_id": "cv-0042.pdf"}},
+        {"key": {"cv_id": "cv-0042.pdf", "email": "anna@example.com"}},
+    ],
+)
+def test_cursor_round_trip(state):
+    cursor = encode_cursor(state)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == state
+
+
+def test_missing_cursor():
+    assert encode_cursor(None) is None
+    assert decode_cursor(None) is None
+    assert decode_cursor("") is None
+
+
+@pytest.mark.parametrize("cursor", ["!!", "bm90IGpzb24", raw_cursor([1, 2])])
+def test_malformed_cursor(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize(
+    "state",
+    [
+        # Offset della classifica (rank=bm25)
+        {"offset": -1},
+        {"offset": "10"},
+        {"offset": 1.5},
+        {"offset": True},
+        # Ultimo cv_id restituito
+        {"after": 42},
+        {"after": None},
+        {"after": ["cv.pdf"]},
+        # LastEvaluatedKey di DynamoDB
+        {"key": "cv.pdf"},
+        {"key": {"cv_id": 42}},
+        {"key": {"cv_id": {"S": "cv.pdf"}}},
+    ],
+)
+def test_cursor_with_invalid_state(state):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(raw_cursor(state))
+
+
+@pytest.mark.parametrize(
+    "key, key_names",
+    [
+        ({"cv_id": "cv.pdf"}, {"cv_id"}),
+        ({"cv_id": "cv.pdf", "email": "anna@example.com"}, {"cv_id", "email"}),
+    ],
+)
+def test_cursor_key_matching_schema(key, key_names):
+    assert decode_cursor(raw_cursor({"key": key}), key_names) == {"key": key}
+
+
+@pytest.mark.parametrize(
+    "key, key_names",
+    [
+        ({"foo": "bar"}, {"cv_id"}),
+        ({"cv_id": "cv.pdf", "email": "anna@example.com"}, {"cv_id"}),
+        ({"cv_id": "cv.pdf"}, {"cv_id", "email"}),
+        ({}, {"cv_id"}),
+    ],
+)
+def test_cursor_key_not_matching_schema(key, key_names):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(raw_cursor({"key": key}), key_names)
+
+
+def test_page_limit():
+    assert page_limit(MultiDict()) == 20
+    assert page_limit(MultiDict({"limit": "5"})) == 5
+    assert page_limit(MultiDict({"limit": "0"})) == 1
+    assert page_limit(MultiDict({"limit": "1000"})) == 100
+    assert page_limit(MultiDict({"limit": "abc"})) == 20
+
+
+def test_is_paginated():
+    assert not is_paginated(MultiDict())
+    assert is_paginated(MultiDict({"limit": "5"}))
+    assert is_paginated(MultiDict({"cursor": "abc"}))
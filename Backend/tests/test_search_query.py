@@ -0,0 +1,150 @@
+import pytest
+
+from search_query import (
+    And,
+    Field,
+    InvalidQuery,
+    Not,
+    Or,
+    Phrase,
+    Term,
+    execute_query,
+    lex,
+    parse_query,
+    query_tokens,
+)
+from storage import ReadAll, ReadPage, run
+
+
+def test_lex():
+    assert lex('python -php "machine learning" (aws OR gcp)') == [
+        ("WORD", "python"),
+        ("NOT", None),
+        ("WORD", "php"),
+        ("PHRASE", "machine learning"),
+        ("(", None),
+        ("WORD", "aws"),
+        ("OR", None),
+        ("WORD", "gcp"),
+        (")", None),
+    ]
+
+
+def test_implicit_and_and_precedence():
+    assert parse_query("python aws OR gcp") == Or(
+        (And((Term("python"), Term("aws"))), Term("gcp"))
+    )
+    assert parse_query("python AND (aws OR gcp)") == And(
+        (Term("python"), Or((Term("aws"), Term("gcp"))))
+    )
+
+
+def test_negation():
+    assert parse_query("python -php") == And((Term("python"), Not(Term("php"))))
+    assert parse_query("python NOT php") == parse_query("python -php")
+
+
+def test_phrase_keeps_word_offsets():
+    assert parse_query('"machine learning"') == Phrase(
+        ((0, "machine"), (1, "learning"))
+    )
+
+
+def test_stopwords_and_folding():
+    assert parse_query("il Pythón") == Term("python")
+    assert parse_query("il la") is None
+
+
+def test_compound_word_requires_every_token():
+    assert parse_query("front-end") == And((Term("front"), Term("end")))
+
+
+def test_field_filters():
+    assert parse_query("python email:anna@example.com") == And(
+        (Term("python"), Field("email", "anna@example.com"))
+    )
+    assert parse_query("python uploaded_after:2024-01-31") == And(
+        (Term("python"), Field("uploaded_after", "2024-01-31"))
+    )
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "(python",
+        "python)",
+        "python AND",
+        "NOT python",
+        "-python -java",
+        "python OR -java",
+        "uploaded_after:2024-01-01",
+        "uploaded_after:2024-01-01 uploaded_before:2025-01-01",
+        "uploaded_after:2024-01-01 -java",
+        "python OR uploaded_after:2024-01-01",
+        "python uploaded_after:ieri",
+        "python uploaded_after:2024-13-99",
+        "python uploaded_before:2023-02-29",
+        "python uploaded_after:2024-01-01T10:00",
+        "python email:",
+    ],
+)
+def test_invalid_queries(query):
+    with pytest.raises(InvalidQuery):
+        parse_query(query)
+
+
+def test_query_tokens():
+    node = parse_query('python -php "machine learning"')
+    positive, every = query_tokens(node)
+    assert positive == ["python", "machine", "learning"]
+    assert every == ["python", "php", "machine", "learning"]
+
+
+@pytest.fixture
+def corpus(add_cv):
+    add_cv("a.pdf", "Python AWS machine learning", uploaded_at="2024-03-01")
+    add_cv("b.pdf", "Python PHP learning machine", uploaded_at="2024-06-01")
+    add_cv("c.pdf", "Java GCP", email="bruno@example.com", uploaded_at="2024-09-01")
+    add_cv("d.pdf", "Python GCP", email="bruno@example.com", uploaded_at="2025-02-01")
+
+
+def execute(query):
+    """Esegue la query su moto, restituendo i cv_id e le letture fatte."""
+    import main
+
+    operations = []
+
+    def perform(operation):
+        operations.append(operation)
+        return main.perform(operation)
+
+    _, _, matches = run(execute_query(parse_query(query)), perform)
+    return sorted(matches), operations
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("python", ["a.pdf", "b.pdf", "d.pdf"]),
+        ("python -php", ["a.pdf", "d.pdf"]),
+        ("python AND (aws OR gcp)", ["a.pdf", "d.pdf"]),
+        ("gcp OR aws", ["a.pdf", "c.pdf", "d.pdf"]),
+        ('"machine learning"', ["a.pdf"]),
+        ('"learning machine"', ["b.pdf"]),
+        ("email:bruno@example.com", ["c.pdf", "d.pdf"]),
+        ("python email:bruno@example.com", ["d.pdf"]),
+        ("python uploaded_after:2024-06-01", ["b.pdf", "d.pdf"]),
+        ("python uploaded_before:2024-06-01", ["a.pdf"]),
+        ("gcp OR python uploaded_before:2024-06-01", ["a.pdf", "c.pdf", "d.pdf"]),
+        ("rust", []),
+    ],
+)
+def test_execute_query(corpus, query, expected):
+    assert execute(query)[0] == expected
+
+
+def test_queries_never_scan_the_cv_table(corpus):
+    _, operations = execute("python uploaded_after:2024-01-01 -php")
+    reads = [op for op in operations if isinstance(op, (ReadAll, ReadPage))]
+    assert reads
+    assert all(op.operation == "query" for op in reads)
@@ -0,0 +1,154 @@
+import pytest
+
+from storage import ReadAll
+from suggest import (
+    SuggestIndex,
+    Vocabulary,
+    edit_distance,
+    max_edits,
+    normalize_prefix,
+    trigrams,
+)
+
+
+@pytest.mark.parametrize(
+    "a, b, distance",
+    [
+        ("python", "python", 0),
+        ("python", "pyton", 1),  # cancellazione
+        ("pyton", "python", 1),  # inserimento
+        ("python", "pythin", 1),  # sostituzione
+        ("python", "pyhton", 1),  # scambio di lettere adiacenti
+        ("kubernetes", "kuberentes", 1),
+        ("ab", "ba", 1),
+        ("ca", "abc", 3),  # distanza OSA: niente modifiche alla stessa sottostringa
+        ("sql", "mysql", 2),
+    ],
+)
+def test_edit_distance(a, b, distance):
+    assert edit_distance(a, b, 5) == distance
+
+
+def test_edit_distance_stops_at_limit():
+    assert edit_distance("python", "java", 1) == 2
+    assert edit_distance("python", "pyhtno", 1) == 2
+    assert edit_distance("a", "abcdef", 2) == 3
+
+
+def test_max_edits():
+    assert [max_edits(t) for t in ("go", "aws", "java", "python", "kubernetes")] == [
+        0,
+        0,
+        1,
+        1,
+        2,
+    ]
+
+
+def test_trigrams():
+    assert trigrams("go") == {"\0\0g", "\0go", "go\0", "o\0\0"}
+    assert len(trigrams("python")) == 8
+
+
+def stats(**dfs):
+    return [{"stat_id": f"term#{term}", "df": df} for term, df in dfs.items()]
+
+
+@pytest.fixture
+def vocabulary():
+    return Vocabulary(
+        stats(python=12, pythonic=2, pytorch=3, pytest=3, php=7, java=9, kotlin=0)
+    )
+
+
+def test_terms_without_cvs_are_dropped(vocabulary):
+    assert len(vocabulary) == 6
+    assert vocabulary.similar("kotlin") == []
+
+
+def test_counter_shards_are_summed():
+    vocabulary = Vocabulary(
+        stats(python=2, java=1)
+        + [{"stat_id": "term#python~3", "df": 1}, {"stat_id": "term#c#~5", "df": 4}]
+    )
+    assert vocabulary.complete("p") == [{"term": "python", "count": 3}]
+    assert vocabulary.complete("c") == [{"term": "c#", "count": 4}]
+
+
+def test_stems_are_completed_with_their_surface_form():
+    vocabulary = Vocabulary(
+        [
+            {"stat_id": "term#engin", "df": 2, "surface": "engineering"},
+            {"stat_id": "term#engin~4", "df": 1, "surface": "engine"},
+            {"stat_id": "term#english", "df": 1},
+        ]
+    )
+    assert vocabulary.complete("eng") == [
+        {"term": "engine", "count": 3},
+        {"term": "english", "count": 1},
+    ]
+    # La ricerca fuzzy continua a usare le radici indicizzate
+    assert vocabulary.similar("engn") == ["engin"]
+
+
+def test_complete_by_frequency(vocabulary):
+    assert vocabulary.complete("py", limit=3) == [
+        {"term": "python", "count": 12},
+        {"term": "pytest", "count": 3},
+        {"term": "pytorch", "count": 3},
+    ]
+    assert vocabulary.complete("pyth") == [
+        {"term": "python", "count": 12},
+        {"term": "pythonic", "count": 2},
+    ]
+    assert vocabulary.complete("rust") == []
+    assert vocabulary.complete("") == []
+
+
+def test_similar(vocabulary):
+    assert vocabulary.similar("pyhton") == ["python"]
+    assert vocabulary.similar("jvaa") == ["java"]
+    assert vocabulary.similar("python") == ["python"]
+    assert vocabulary.similar("pytohnic") == ["pythonic"]
+    # Fino a 3 caratteri solo corrispondenze esatte
+    assert vocabulary.similar("php") == ["php"]
+    assert vocabulary.similar("phb") == []
+
+
+def test_similar_orders_by_distance_then_frequency():
+    vocabulary = Vocabulary(stats(react=4, reach=9, ready=1))
+    assert vocabulary.similar("reacy") == ["reach", "react", "ready"]
+    assert vocabulary.similar("reacy", limit=1) == ["reach"]
+
+
+def test_normalize_prefix():
+    assert normalize_prefix("  Pythón ") == "python"
+
+
+def test_suggest_index_reads_vocabulary_once_per_version():
+    index = SuggestIndex(refresh_interval=0)
+    steps = index.vocabulary(1)
+    operation = next(steps)
+    assert isinstance(operation, ReadAll) and operation.operation == "scan"
+    with pytest.raises(StopIteration) as stop:
+        steps.send(stats(python=1))
+    assert stop.value.value.complete("py") == [{"term": "python", "count": 1}]
+    assert stop.value.value.version == 1
+
+    # Stessa versione: nessuna lettura
+    with pytest.raises(StopIteration):
+        next(index.vocabulary(1))
+    # Nuova versione: una nuova Scan
+    assert isinstance(next(index.vocabulary(2)), ReadAll)
+
+
+def test_suggest_index_returns_the_previous_vocabulary_while_recent():
+    index = SuggestIndex(refresh_interval=60)
+    steps = index.vocabulary(1)
+    next(steps)
+    with pytest.raises(StopIteration):
+        steps.send(stats(python=1))
+    # Costruito da poco: servito alla nuova versione con la sua
+    with pytest.raises(StopIteration) as stop:
+        next(index.vocabulary(2))
+    assert stop.value.value.version == 1
@@ -0,0 +1,193 @@
+"""
+Normalizzazione e tokenizzazione del testo dei CV.
+
+Il modulo è condiviso tra il backend e la Lambda di ingestione (deploy_lambda.py
+lo include nello zip della funzione), così l'indice scritto in fase di
+ingestione e le query del backend usano esattamente gli stessi token.
+
+Ogni parola viene ripiegata (minuscole, accenti rimossi), le stopword
+italiane e inglesi vengono scartate e, se TEXT_STEMMING indica una lingua
+("italian"/"it" o "english"/"en") e snowballstemmer è installato, ridotta
+alla radice; con una lingua non supportata lo stemming resta disattivato.
+Cambiare TEXT_STEMMING richiede di ricostruire l'indice (reindex_cvs.py) e
+va impostato allo stesso valore su backend e Lambda.
+"""
+
+import logging
+import os
+import re
+import unicodedata
+
+try:
+    import snowballstemmer
+except ImportError:  # dipendenza opzionale: senza, nessuno stemming
+    snowballstemmer = None
+
+# Parole alfanumeriche, con gli eventuali + e # finali (c++, c#, f#)
+TOKEN_PATTERN = re.compile(r"[^\W_]+[+#]*")
+
+# Niente "c" e "it": nei CV sono il linguaggio e l'IT
+STOPWORDS = frozenset(
+    # Italiano
+    "a ad al allo ai agli alla alle anche che chi ci come con contro cui d da "
+    "dal dallo dai dagli dalla dalle degli dei del dell della delle dello di "
+    "dove e ed era erano essere fra gli ha hanno ho i il in io l la le lei lo "
+    "loro lui ma mi ne negli nei nel nella nelle nello noi non o per perche "
+    "piu poi quale quando quella quelle quelli quello questa queste questi "
+    "questo se si sia sono su sua sue sugli sui sul sulla sulle suo suoi tra "
+    "tu un una uno vi voi "
+    # Inglese
+    "about an and are as at be been but by can do does for from had has have "
+    "he her his how if into is its me my no not of on or our s she so such "
+    "t than that the their them then there these they this those to too was "
+    "we were what when where which while who will with would you your".split()
+)
+
+logger = logging.getLogger(__name__)
+
+# Codici ISO 639-1 accettati in TEXT_STEMMING al posto del nome della lingua
+STEMMING_LANGUAGE_CODES = {"it": "italian", "en": "english"}
+
+STEMMING_LANGUAGE = os.environ.get("TEXT_STEMMING", "").strip().lower()
+STEMMING_LANGUAGE = STEMMING_LANGUAGE_CODES.get(STEMMING_LANGUAGE, STEMMING_LANGUAGE)
+
+
+def create_stemmer(language):
+    """
+    Stemmer di snowballstemmer per la lingua, o None se lo stemming non è
+    richiesto o non è disponibile. Un valore sbagliato di TEXT_STEMMING non
+    deve impedire l'avvio del backend e della Lambda.
+    """
+    if not language or snowballstemmer is None:
+        return None
+    try:
+        return snowballstemmer.stemmer(language)
+    except KeyError:
+        logger.warning(f"TEXT_STEMMING={language} non supportato, stemming disattivato")
+        return None
+
+
+stemmer = create_stemmer(STEMMING_LANGUAGE)
+
+
+def fold(word):
+    """Minuscole e lettere senza accenti (è -> e, ñ -> n)."""
+    decomposed = unicodedata.normalize("NFKD", word.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def normalize(word):
+    """Token di una parola, o None se è una stopword."""
+    token = fold(word)
+    if token in STOPWORDS:
+        return None
+    if stemmer is not None:
+        token = stemmer.stemWord(token)
+    return token
+
+
+def tokenize(text):
+    """Restituisce i token normalizzati del testo, nell'ordine originale."""
+    if not text:
+        return []
+    tokens = (normalize(match) for match in TOKEN_PATTERN.findall(text))
+    return [token for token in tokens if token]
+
+
+def token_positions(text):
+    """
+    Restituisce {token: [posizioni]} del testo. Le posizioni contano tutte le
+    parole, stopword comprese, così una frase cercata ("laurea in fisica")
+    corrisponde solo a parole davvero consecutive.
+    """
+    positions = {}
+    for position, word in enumerate(TOKEN_PATTERN.findall(text or "")):
+        token = normalize(word)
+        if token:
+            positions.setdefault(token, []).append(position)
+    return positions
+
+
+def stem_surfaces(text):
+    """
+    Restituisce {token: parola} per i token ridotti dallo stemming, con la
+    parola (ripiegata) più breve del testo che vi si riduce: è la forma
+    mostrata nei suggerimenti al posto della radice ("engin" -> "engine").
+    Senza stemming i token sono già parole intere e il risultato è vuoto.
+    """
+    surfaces = {}
+    if stemmer is None:
+        return surfaces
+    for word in TOKEN_PATTERN.findall(text or ""):
+        token = normalize(word)
+        surface = fold(word)
+        if token and token != surface:
+            current = surfaces.get(token, surface)
+            surfaces[token] = min(current, surface, key=lambda w: (len(w), w))
+    return surfaces
+
+
+def phrase_terms(phrase):
+    """
+    Token di una frase con la loro distanza (in parole) dall'inizio della
+    frase, come lista di (offset, token); le stopword occupano una posizione
+    ma non vengono cercate.
+    """
+    words = (normalize(word) for word in TOKEN_PATTERN.findall(phrase))
+    return [(offset, token) for offset, token in enumerate(words) if token]
+
+
+def token_set(text):
+    """Insieme compatto dei token del testo: ordinato e senza duplicati."""
+    return sorted(set(tokenize(text)))
+
+
+def query_terms(keywords):
+    """
+    Converte una lista di parole chiave nei termini distinti da cercare.
+    Una parola chiave composta (es. "machine learning") produce più termini,
+    tutti obbligatori.
+    """
+    terms = []
+    for keyword in keywords:
+        for token in tokenize(keyword):
+            if token not in terms:
+                terms.append(token)
+    return terms
+
+
+def make_snippets(text, terms, radius=60, max_snippets=3):
+    """
+    Estrae dal testo brevi finestre di circa `radius` caratteri attorno alle
+    occorrenze dei termini cercati, unendo le finestre sovrapposte. Le parole
+    del testo vengono normalizzate come in indicizzazione, quindi un termine
+    trova anche le sue forme accentate o flesse.
+    """
+    if not text or not terms:
+        return []
+    terms = set(terms)
+    windows = []
+    for match in TOKEN_PATTERN.finditer(text):
+        if normalize(match.group()) not in terms:
+            continue
+        start = max(match.start() - radius, 0)
+        end = min(match.end() + radius, len(text))
+        # Allinea la finestra ai confini di parola
+        if start > 0:
+            space = text.find(" ", start, match.start())
+            start = space + 1 if space != -1 else start
+        if end < len(text):
+            space = text.rfind(" ", match.end(), end)
+            end = space if space != -1 else end
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        elif len(windows) < max_snippets:
+            windows.append((start, end))
+        else:
+            break
+    return [
+        ("…" if start > 0 else "")
+        + text[start:end].strip()
+        + ("…" if end < len(text) else "")
+        for start, end in windows
+    ]
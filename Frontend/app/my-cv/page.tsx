@@ -1,6 +1,6 @@
 "use client"
 
-import { useState, useEffect } from "react"
+import { useState, useEffect, useRef, useCallback } from "react"
 import { Skeleton } from "@/components/ui/skeleton"
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from "@/components/ui/card"
 import { Button } from "@/components/ui/button"
@@ -14,13 +14,29 @@ import { Download } from "lucide-react"
 
 configureAmplify()
 
+// Numero di CV caricati per pagina (scroll infinito)
+const PAGE_SIZE = 20
+
+// Campi mostrati nella pagina: il testo completo del CV non viene scaricato
+const CV_FIELDS = "original_filename,uploaded_at,s3_key"
+
 export default function MyCVPage() {
   const [email, setEmail] = useState<string | null>(null)
   const [cvs, setCvs] = useState<any[]>([])
   const [isLoading, setLoading] = useState(true)
   const [error, setError] = useState<string>("")
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [isLoadingMore, setIsLoadingMore] = useState(false)
+  const sentinelRef = useRef<HTMLDivElement | null>(null)
   const router = useRouter()
 
+  // Costruisce l'URL di una pagina dei CV dell'utente
+  const pageUrl = (email: string, cursor: string | null) => {
+    const params = new URLSearchParams({ limit: String(PAGE_SIZE), fields: CV_FIELDS })
+    if (cursor) params.set("cursor", cursor)
+    return `/api/cvs/user/${email}?${params.toString()}`
+  }
+
   useEffect(() => {
     const fetchCVs = async () => {
       try {
@@ -31,10 +47,11 @@ export default function MyCVPage() {
         setEmail(email)
         console.log("User Email:", email)
         // Chiama l'API Flask
-        const res = await fetch(`/api/cvs/user/${email}`)
+        const res = await fetch(pageUrl(email, null))
         if (!res.ok) throw new Error("Errore nella fetch dei CV")
         const data = await res.json()
         setCvs(data.cvs || [])
+        setNextCursor(data.next_cursor || null)
       } catch (err: any) {
         setError(err.message || "Errore generico")
       } finally {
@@ -44,6 +61,33 @@ export default function MyCVPage() {
     fetchCVs()
   }, [])
 
+  // Carica la pagina successiva quando l'utente arriva in fondo alla lista
+  const loadMore = useCallback(async () => {
+    if (!email || !nextCursor || isLoadingMore) return
+    setIsLoadingMore(true)
+    try {
+      const res = await fetch(pageUrl(email, nextCursor))
+      if (!res.ok) throw new Error("Errore nella fetch dei CV")
+      const data = await res.json()
+      setCvs((prev) => [...prev, ...(data.cvs || [])])
+      setNextCursor(data.next_cursor || null)
+    } catch (err: any) {
+      setError(err.message || "Errore generico")
+    } finally {
+      setIsLoadingMore(false)
+    }
+  }, [email, nextCursor, isLoadingMore])
+
+  useEffect(() => {
+    const sentinel = sentinelRef.current
+    if (!sentinel || !nextCursor) return
+    const observer = new IntersectionObserver((entries) => {
+      if (entries[0].isIntersecting) loadMore()
+    })
+    observer.observe(sentinel)
+    return () => observer.disconnect()
+  }, [loadMore, nextCursor])
+
 
   if (isLoading) return (
     <div className="min-h-screen flex items-center justify-center">
@@ -104,6 +148,10 @@ export default function MyCVPage() {
                 </CardHeader>
               </Card>
             ))}
+            {/* Sentinella per lo scroll infinito */}
+            <div ref={sentinelRef} className="h-8 flex justify-center">
+              {isLoadingMore && <Loader2 className="w-6 h-6 text-gray-400 animate-spin" />}
+            </div>
           </div>
         )}
       </main>
@@ -1,6 +1,6 @@
 "use client"
 
-import { useState, useEffect } from "react"
+import { useState, useEffect, useRef, useCallback } from "react"
 import { Button } from "@/components/ui/button"
 import { Input } from "@/components/ui/input"
 import { Label } from "@/components/ui/label"
@@ -15,6 +15,12 @@ import { configureAmplify } from "@/lib/amplify-config"
 // Configurazione di Amplify
 configureAmplify();
 
+// Numero di CV caricati per pagina (scroll infinito)
+const PAGE_SIZE = 20
+
+// Campi mostrati nelle card: il testo completo del CV non viene scaricato
+const CV_FIELDS = "original_filename,uploaded_at,s3_key,email"
+
 export default function SearchPage() {
   const [user, setUser] = useState<any>(null)
   const [email, setEmail] = useState<string>("")
@@ -25,8 +31,25 @@ export default function SearchPage() {
   const [filteredCvs, setFilteredCvs] = useState<any[]>([])
   const [isSearching, setIsSearching] = useState(false)
   const [searchError, setSearchError] = useState("")
+  const [suggestions, setSuggestions] = useState<{ term: string; count: number }[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [isLoadingMore, setIsLoadingMore] = useState(false)
+  const sentinelRef = useRef<HTMLDivElement | null>(null)
   const router = useRouter()
 
+  // Costruisce l'URL di una pagina di risultati
+  const buildUrl = useCallback((cursor: string | null) => {
+    const params = new URLSearchParams({ limit: String(PAGE_SIZE), fields: CV_FIELDS })
+    if (keywords.length > 0) {
+      // Ricerca ordinata per rilevanza, con i frammenti di testo trovati
+      params.set("keywords", keywords.join(","))
+      params.set("rank", "bm25")
+      params.set("snippets", "1")
+    }
+    if (cursor) params.set("cursor", cursor)
+    return `/api/cvs?${params.toString()}`
+  }, [keywords])
+
   useEffect(() => {
     const checkAuth = async () => {
       try {
@@ -41,22 +64,6 @@ export default function SearchPage() {
         } else {
           setEmail(userData.username)
         }
-
-        // Carica tutti i CV all'avvio (solo se non c'è filtro)
-        try {
-          const res = await fetch("/api/cvs")
-          if (res.ok) {
-            const data = await res.json()
-            setCvs(data.cvs || [])
-            setFilteredCvs(data.cvs || [])
-          } else {
-            setCvs([])
-            setFilteredCvs([])
-          }
-        } catch {
-          setCvs([])
-          setFilteredCvs([])
-        }
       } catch (error) {
         // L'utente non è autenticato, redirect alla pagina di login
         router.push("/")
@@ -68,25 +75,57 @@ export default function SearchPage() {
     checkAuth()
   }, [router])
 
+  // Suggerimenti di completamento per la parola che si sta scrivendo
+  useEffect(() => {
+    const prefix = searchTerm.trim()
+    if (!prefix) {
+      setSuggestions([])
+      return
+    }
+    const controller = new AbortController()
+    const timeout = setTimeout(async () => {
+      try {
+        const params = new URLSearchParams({ prefix, limit: "8" })
+        const res = await fetch(`/api/cvs/suggest?${params.toString()}`, { signal: controller.signal })
+        if (!res.ok) return
+        const data = await res.json()
+        setSuggestions(data.suggestions || [])
+      } catch {
+        // Richiesta annullata o server non raggiungibile: nessun suggerimento
+      }
+    }, 150)
+    return () => {
+      clearTimeout(timeout)
+      controller.abort()
+    }
+  }, [searchTerm])
+
+  const addKeyword = (keyword: string) => {
+    const kw = keyword.trim().toLowerCase()
+    if (kw && !keywords.includes(kw)) {
+      setKeywords([...keywords, kw])
+    }
+    setSearchTerm("")
+    setSuggestions([])
+  }
+
   // Effettua la ricerca ogni volta che searchTerm cambia (debounced)
   useEffect(() => {
     const fetchCVs = async () => {
       setIsSearching(true)
       setSearchError("")
       try {
-        let url = "/api/cvs"
-        if (keywords.length > 0) {
-          url += `?keywords=${encodeURIComponent(keywords.join(","))}`
-        }
-        const res = await fetch(url)
+        const res = await fetch(buildUrl(null))
         if (!res.ok) throw new Error("Errore nella ricerca dei CV")
         const data = await res.json()
         setCvs(data.cvs || [])
         setFilteredCvs(data.cvs || [])
+        setNextCursor(data.next_cursor || null)
       } catch (err: any) {
         setSearchError(err.message || "Errore generico nella ricerca")
         setCvs([])
         setFilteredCvs([])
+        setNextCursor(null)
       } finally {
         setIsSearching(false)
       }
@@ -94,7 +133,35 @@ export default function SearchPage() {
     // Debounce: attendi 400ms dopo l'ultimo cambiamento keywords
     const timeout = setTimeout(fetchCVs, 400)
     return () => clearTimeout(timeout)
-  }, [keywords])
+  }, [buildUrl])
+
+  // Carica la pagina successiva quando l'utente arriva in fondo alla lista
+  const loadMore = useCallback(async () => {
+    if (!nextCursor || isLoadingMore) return
+    setIsLoadingMore(true)
+    try {
+      const res = await fetch(buildUrl(nextCursor))
+      if (!res.ok) throw new Error("Errore nel caricamento dei CV")
+      const data = await res.json()
+      setCvs((prev) => [...prev, ...(data.cvs || [])])
+      setFilteredCvs((prev) => [...prev, ...(data.cvs || [])])
+      setNextCursor(data.next_cursor || null)
+    } catch (err: any) {
+      setSearchError(err.message || "Errore generico nella ricerca")
+    } finally {
+      setIsLoadingMore(false)
+    }
+  }, [buildUrl, nextCursor, isLoadingMore])
+
+  useEffect(() => {
+    const sentinel = sentinelRef.current
+    if (!sentinel || !nextCursor) return
+    const observer = new IntersectionObserver((entries) => {
+      if (entries[0].isIntersecting) loadMore()
+    })
+    observer.observe(sentinel)
+    return () => observer.disconnect()
+  }, [loadMore, nextCursor])
 
   const formatDate = (dateString: string) => {
     return new Date(dateString).toLocaleDateString("it-IT")
@@ -144,13 +211,27 @@ export default function SearchPage() {
                     onKeyDown={(e) => {
                       if (e.key === "Enter" && searchTerm.trim()) {
                         e.preventDefault();
-                        if (!keywords.includes(searchTerm.trim().toLowerCase())) {
-                          setKeywords([...keywords, searchTerm.trim().toLowerCase()]);
-                        }
-                        setSearchTerm("");
+                        addKeyword(searchTerm);
                       }
                     }}
                   />
+                  {/* Suggerimenti dei termini presenti nei CV */}
+                  {suggestions.length > 0 && (
+                    <div className="flex flex-wrap gap-2">
+                      {suggestions.map((s) => (
+                        <Button
+                          key={s.term}
+                          type="button"
+                          variant="ghost"
+                          size="sm"
+                          onClick={() => addKeyword(s.term)}
+                        >
+                          {s.term}
+                          <span className="ml-1 text-xs text-gray-500">{s.count}</span>
+                        </Button>
+                      ))}
+                    </div>
+                  )}
                   {/* Mostra i tag delle keyword */}
                   <div className="flex flex-wrap gap-2 mt-2">
                     {keywords.map((kw, idx) => (
@@ -179,7 +260,7 @@ export default function SearchPage() {
                 >
                   Cancella filtri
                 </Button>
-                <Badge variant="secondary">{isSearching ? "..." : filteredCvs.length + " CV trovati"}</Badge>
+                <Badge variant="secondary">{isSearching ? "..." : filteredCvs.length + (nextCursor ? "+" : "") + " CV trovati"}</Badge>
               </div>
             </CardContent>
           </Card>
@@ -226,6 +307,13 @@ export default function SearchPage() {
                   </CardHeader>
                   <CardContent>
                     <div className="space-y-4">
+                      {cv.snippets && cv.snippets.length > 0 && (
+                        <div className="space-y-1 text-sm text-gray-600">
+                          {cv.snippets.map((snippet: string, index: number) => (
+                            <p key={index}>{snippet}</p>
+                          ))}
+                        </div>
+                      )}
                       {cv.keywords && cv.keywords.length > 0 && (
                         <div>
                           <h4 className="font-medium mb-2">Parole chiave estratte:</h4>
@@ -261,6 +349,10 @@ export default function SearchPage() {
                 </Card>
               ))
             )}
+            {/* Sentinella per lo scroll infinito */}
+            <div ref={sentinelRef} className="h-8 flex justify-center">
+              {isLoadingMore && <Loader2 className="w-6 h-6 text-gray-400 animate-spin" />}
+            </div>
           </div>
         </div>
       </main>
@@ -46,5 +46,109 @@ def create_cv_table():
             print("Errore:", e)
 
 
+# Indice delle posting per cv_id: la Lambda lo usa per confrontare i termini
+# di un CV con quelli già presenti nell'indice
+TERMS_CV_INDEX = {
+    "IndexName": "CvIdIndex",
+    "KeySchema": [
+        {"AttributeName": "cv_id", "KeyType": "HASH"},
+        {"AttributeName": "term", "KeyType": "RANGE"},
+    ],
+    "Projection": {"ProjectionType": "KEYS_ONLY"},
+}
+
+
+def create_terms_table():
+    """Crea la tabella dell'indice invertito: una posting per (term, cv_id)."""
+    try:
+        table = dynamodb.create_table(
+            TableName="CVTerms",
+            KeySchema=[
+                {"AttributeName": "term", "KeyType": "HASH"},
+                {"AttributeName": "cv_id", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "term", "AttributeType": "S"},
+                {"AttributeName": "cv_id", "AttributeType": "S"},
+            ],
+            GlobalSecondaryIndexes=[TERMS_CV_INDEX],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        print("Creazione tabella CVTerms in corso...")
+        table.meta.client.get_waiter("table_exists").wait(TableName="CVTerms")
+        print("Tabella CVTerms creata con successo!")
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ResourceInUseException":
+            print("La tabella CVTerms esiste già.")
+            add_terms_cv_index()
+        else:
+            print("Errore:", e)
+
+
+def add_terms_cv_index():
+    """Aggiunge CvIdIndex a una tabella CVTerms creata prima dell'indice."""
+    table = dynamodb.Table("CVTerms")
+    indexes = table.global_secondary_indexes or []
+    if any(index["IndexName"] == TERMS_CV_INDEX["IndexName"] for index in indexes):
+        return
+    table.update(
+        AttributeDefinitions=[
+            {"AttributeName": "term", "AttributeType": "S"},
+            {"AttributeName": "cv_id", "AttributeType": "S"},
+        ],
+        GlobalSecondaryIndexUpdates=[{"Create": TERMS_CV_INDEX}],
+    )
+    print("Indice CvIdIndex in creazione su CVTerms.")
+
+
+def create_stats_table():
+    """Crea la tabella degli aggregati dell'indice (document frequency, ecc.)."""
+    try:
+        table = dynamodb.create_table(
+            TableName="CVStats",
+            KeySchema=[
+                {"AttributeName": "stat_id", "KeyType": "HASH"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "stat_id", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        print("Creazione tabella CVStats in corso...")
+        table.meta.client.get_waiter("table_exists").wait(TableName="CVStats")
+        print("Tabella CVStats creata con successo!")
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ResourceInUseException":
+            print("La tabella CVStats esiste già.")
+        else:
+            print("Errore:", e)
+
+
+def create_contents_table():
+    """Crea la tabella dei testi estratti, indicizzati per hash del contenuto."""
+    try:
+        table = dynamodb.create_table(
+            TableName="CVContents",
+            KeySchema=[
+                {"AttributeName": "content_hash", "KeyType": "HASH"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "content_hash", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        print("Creazione tabella CVContents in corso...")
+        table.meta.client.get_waiter("table_exists").wait(TableName="CVContents")
+        print("Tabella CVContents creata con successo!")
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ResourceInUseException":
+            print("La tabella CVContents esiste già.")
+        else:
+            print("Errore:", e)
+
+
 if __name__ == "__main__":
     create_cv_table()
+    create_terms_table()
+    create_stats_table()
+    create_contents_table()
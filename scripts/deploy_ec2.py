@@ -19,6 +19,8 @@ AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_REGION = os.getenv("REGION", "eu-west-2")
 SECURITY_GROUP_NAME = "cvgram-backend-sg"
 SECURITY_GROUP_DESC = "Security group per backend CVGram"
+SWARM_NETWORK = "cvgram-net"
+REDIS_MAXMEMORY = os.getenv("REDIS_MAXMEMORY", "256mb")
 
 ec2 = boto3.client("ec2", region_name=AWS_REGION)
 
@@ -175,12 +177,43 @@ def post_deploy_ec2(instances_ip, master_ip):
             ]
             subprocess.run(cmd_swarm_init, check=True)
             print(f"Swarm inizializzato su {ip}")
+            # Rete overlay condivisa tra backend e cache Redis
+            cmd_create_network = [
+                "ssh",
+                "-i",
+                key_path,
+                f"ubuntu@{master_ip}",
+                f"docker network create --driver overlay {SWARM_NETWORK}",
+            ]
+            subprocess.run(cmd_create_network, check=True)
+            # Cache condivisa tra le repliche del backend: solo in memoria,
+            # con evizione LRU al raggiungimento del limite
+            cmd_create_redis = [
+                "ssh",
+                "-i",
+                key_path,
+                f"ubuntu@{master_ip}",
+                "docker service create --name redis --replicas 1 "
+                f"--network {SWARM_NETWORK} "
+                "redis:7-alpine redis-server "
+                f"--maxmemory {REDIS_MAXMEMORY} --maxmemory-policy allkeys-lru "
+                "--save ''",
+            ]
+            subprocess.run(cmd_create_redis, check=True)
+            print("Servizio redis creato")
             cmd_create_service = [
                 "ssh",
                 "-i",
                 key_path,
                 f"ubuntu@{master_ip}",
                 "docker service create --name backend --replicas 2 -p 80:80 --with-registry-auth "
+                # Rolling update: avvia la nuova replica prima di fermare la
+                # vecchia, che ha 30s per completare le richieste in corso
+                "--update-order start-first --update-delay 10s "
+                "--update-failure-action rollback "
+                "--stop-grace-period 30s "
+                f"--network {SWARM_NETWORK} "
+                "--env REDIS_URL=redis://redis:6379/0 "
                 f"--env AWS_ACCESS_KEY_ID={AWS_ACCESS_KEY_ID} "
                 f"--env AWS_SECRET_ACCESS_KEY={AWS_SECRET_ACCESS_KEY} "
                 "177873418246.dkr.ecr.eu-west-2.amazonaws.com/cvgram-backend:latest",
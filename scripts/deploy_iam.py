@@ -12,6 +12,7 @@ S3_BUCKET = os.getenv("S3_BUCKET", "cvgram-cv-bucket")
 LAMBDA_ROLE_NAME = "lambda-cv-upload-role"
 BACKEND_ROLE_NAME = "backend-cv-access-role"
 COGNITO_AUTH_ROLE_NAME = "identity-pool-auth-role"
+TEXTRACT_ROLE_NAME = "textract-sns-publish-role"
 GITHUB_USER_NAME = "cvgram-github-actions"
 
 LAMBDA_POLICY = {
@@ -31,15 +32,79 @@ LAMBDA_POLICY = {
             "Action": ["s3:GetObject"],
             "Resource": "arn:aws:s3:::cvgram-cv-bucket/*",
         },
+        # Testi estratti troppo lunghi per l'item DynamoDB
+        {
+            "Effect": "Allow",
+            "Action": ["s3:PutObject"],
+            "Resource": "arn:aws:s3:::cvgram-cv-bucket/extracted/*",
+        },
         {"Effect": "Allow", "Action": ["textract:*"], "Resource": "*"},
         {
             "Effect": "Allow",
-            "Action": ["dynamodb:PutItem", "dynamodb:UpdateItem"],
-            "Resource": "arn:aws:dynamodb:*:*:table/CVs",
+            "Action": [
+                "dynamodb:GetItem",
+                "dynamodb:PutItem",
+                "dynamodb:UpdateItem",
+                "dynamodb:DeleteItem",
+                "dynamodb:BatchWriteItem",
+            ],
+            "Resource": [
+                "arn:aws:dynamodb:*:*:table/CVs",
+                "arn:aws:dynamodb:*:*:table/CVTerms",
+                "arn:aws:dynamodb:*:*:table/CVStats",
+                "arn:aws:dynamodb:*:*:table/CVContents",
+            ],
+        },
+        # Posting già presenti di un CV, confrontate con i nuovi termini
+        {
+            "Effect": "Allow",
+            "Action": ["dynamodb:Query"],
+            "Resource": "arn:aws:dynamodb:*:*:table/CVTerms/index/CvIdIndex",
+        },
+        # Coda di ingestione opzionale (INGEST_QUEUE=1 in deploy_lambda.py)
+        {
+            "Effect": "Allow",
+            "Action": [
+                "sqs:ReceiveMessage",
+                "sqs:DeleteMessage",
+                "sqs:GetQueueAttributes",
+                "sqs:ChangeMessageVisibility",
+            ],
+            "Resource": "arn:aws:sqs:*:*:cvgram-cv-ingest",
+        },
+        # Dead-letter queue: documenti con job Textract falliti e eventi
+        # asincroni falliti (DeadLetterConfig della funzione)
+        {
+            "Effect": "Allow",
+            "Action": ["sqs:SendMessage"],
+            "Resource": "arn:aws:sqs:*:*:cvgram-cv-ingest-dlq",
+        },
+        # Job Textract asincroni con notifica SNS (documenti multipagina)
+        {
+            "Effect": "Allow",
+            "Action": ["iam:PassRole"],
+            "Resource": "arn:aws:iam::*:role/textract-sns-publish-role",
+        },
+        # Rilancio asincrono dei soli record falliti
+        {
+            "Effect": "Allow",
+            "Action": ["lambda:InvokeFunction"],
+            "Resource": "arn:aws:lambda:*:*:function:cvgram-cv-processing",
         },
     ],
 }
 
+TEXTRACT_SNS_POLICY = {
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Effect": "Allow",
+            "Action": ["sns:Publish"],
+            "Resource": "arn:aws:sns:*:*:cvgram-textract-completion",
+        }
+    ],
+}
+
 BACKEND_POLICY = {
     "Version": "2012-10-17",
     "Statement": [
@@ -51,7 +116,11 @@ BACKEND_POLICY = {
         {
             "Effect": "Allow",
             "Action": ["dynamodb:*"],
-            "Resource": "arn:aws:dynamodb:*:*:table/CVs",
+            "Resource": [
+                "arn:aws:dynamodb:*:*:table/CVs",
+                "arn:aws:dynamodb:*:*:table/CVTerms",
+                "arn:aws:dynamodb:*:*:table/CVStats",
+            ],
         },
         {
             "Effect": "Allow",
@@ -183,6 +252,17 @@ def main():
         ],
     }
 
+    textract_assume_role_policy = {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Principal": {"Service": "textract.amazonaws.com"},
+                "Action": "sts:AssumeRole",
+            }
+        ],
+    }
+
     backend_assume_role_policy = {
         "Version": "2012-10-17",
         "Statement": [
@@ -201,6 +281,9 @@ def main():
     backend_arn = create_role_and_policy(
         BACKEND_ROLE_NAME, BACKEND_POLICY, backend_assume_role_policy
     )
+    textract_arn = create_role_and_policy(
+        TEXTRACT_ROLE_NAME, TEXTRACT_SNS_POLICY, textract_assume_role_policy
+    )
     ensure_instance_profile(BACKEND_ROLE_NAME)
 
     # Creazione dell'utente per GitHub Actions
@@ -284,6 +367,7 @@ def main():
     output = {
         "lambda_role_arn": lambda_arn,
         "backend_role_arn": backend_arn,
+        "textract_role_arn": textract_arn,
         "cognito_auth_role_arn": cognito_auth_role_arn,
     }
     if access_key:
@@ -2,6 +2,9 @@ import boto3
 import zipfile
 import os
 import json
+import subprocess
+import sys
+import tempfile
 import time
 from dotenv import load_dotenv
 
@@ -13,28 +16,113 @@ with open(os.path.join(os.path.dirname(__file__), "../iam_arns.json")) as f:
 REGION = os.getenv("REGION", "eu-west-2")
 BUCKET = os.getenv("S3_BUCKET", "cvgram-cv-bucket")
 LAMBDA_NAME = "cvgram-cv-processing"
-LAMBDA_FILE = "lambda_function.py"
+LAMBDA_FILES = ["lambda_function.py", "pdf_text.py"]
+# Moduli condivisi con il backend, inclusi nella radice dello zip
+SHARED_MODULES = [
+    os.path.join("..", "Backend", "text_processing.py"),
+    os.path.join("..", "Backend", "cv_text.py"),
+    os.path.join("..", "Backend", "cv_stats.py"),
+    os.path.join("..", "Backend", "aws_config.py"),
+]
+# Dipendenze pure Python installate nella radice dello zip
+LAMBDA_REQUIREMENTS = "requirements-lambda.txt"
 HANDLER = "lambda_function.lambda_handler"
 RUNTIME = "python3.12"
 ZIP_FILE = "lambda_cv_processing.zip"
 ROLE_ARN = arns["lambda_role_arn"]
+FUNCTION_TIMEOUT = 300
+
+# Coda SQS opzionale tra S3 e la Lambda (INGEST_QUEUE=1): assorbe i picchi di
+# upload limitando batch e concorrenza, quindi le chiamate a Textract
+USE_INGEST_QUEUE = os.getenv("INGEST_QUEUE", "0") == "1"
+QUEUE_NAME = "cvgram-cv-ingest"
+DLQ_NAME = "cvgram-cv-ingest-dlq"
+QUEUE_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 10))
+QUEUE_BATCHING_WINDOW = int(os.getenv("INGEST_BATCHING_WINDOW", 5))
+# Minimo 2, limite imposto da Lambda per le sorgenti SQS
+QUEUE_MAX_CONCURRENCY = max(int(os.getenv("INGEST_MAX_CONCURRENCY", 5)), 2)
+# Consegne di un messaggio prima di finire nella DLQ
+QUEUE_MAX_RECEIVES = int(os.getenv("INGEST_MAX_RECEIVES", 3))
+
+# Topic SNS su cui Textract notifica il completamento dei job asincroni
+# (CV multipagina); la stessa Lambda è iscritta al topic
+TEXTRACT_TOPIC_NAME = "cvgram-textract-completion"
+TEXTRACT_ROLE_ARN = arns.get("textract_role_arn")
 
 lambda_client = boto3.client("lambda", region_name=REGION)
+sqs = boto3.client("sqs", region_name=REGION)
+sns = boto3.client("sns", region_name=REGION)
 
 
 def create_lambda_zip():
-    """Crea un file zip contenente il codice della Lambda."""
-    with zipfile.ZipFile(ZIP_FILE, "w") as zf:
-        zf.write(LAMBDA_FILE)
+    """Crea un file zip contenente il codice della Lambda e le sue dipendenze."""
+    with tempfile.TemporaryDirectory() as vendor_dir:
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "pip",
+                "install",
+                "--quiet",
+                "--target",
+                vendor_dir,
+                "-r",
+                LAMBDA_REQUIREMENTS,
+            ],
+            check=True,
+        )
+        with zipfile.ZipFile(ZIP_FILE, "w", zipfile.ZIP_DEFLATED) as zf:
+            for lambda_file in LAMBDA_FILES:
+                zf.write(lambda_file)
+            for module in SHARED_MODULES:
+                zf.write(module, arcname=os.path.basename(module))
+            for root, _, files in os.walk(vendor_dir):
+                for name in files:
+                    path = os.path.join(root, name)
+                    if "__pycache__" not in path:
+                        zf.write(path, arcname=os.path.relpath(path, vendor_dir))
     print(f"Creato {ZIP_FILE}")
 
 
-def deploy_lambda():
+def create_textract_topic():
+    """Crea (o recupera) il topic SNS di completamento dei job Textract."""
+    topic_arn = sns.create_topic(Name=TEXTRACT_TOPIC_NAME)["TopicArn"]
+    print(f"Topic SNS pronto: {topic_arn}")
+    return topic_arn
+
+
+def lambda_environment(topic_arn, dlq_url):
+    return {
+        "Variables": {
+            "CVS_TABLE": "CVs",
+            "REGION": REGION,
+            "TEXTRACT_SNS_TOPIC_ARN": topic_arn,
+            "TEXTRACT_ROLE_ARN": TEXTRACT_ROLE_ARN or "",
+            "DEAD_LETTER_QUEUE_URL": dlq_url,
+            # Stessa normalizzazione del backend (vedi text_processing.py)
+            "TEXT_STEMMING": os.getenv("TEXT_STEMMING", ""),
+        }
+    }
+
+
+def deploy_lambda(topic_arn, dlq_url):
+    """
+    Crea o aggiorna la funzione. La dead-letter queue riceve sia i documenti
+    con job Textract falliti sia gli eventi asincroni (S3, SNS, rilanci) che
+    falliscono anche dopo i retry della Lambda.
+    """
     with open(ZIP_FILE, "rb") as f:
         code_bytes = f.read()
+    dead_letter_config = {"TargetArn": queue_arn(dlq_url)}
     try:
         lambda_client.get_function(FunctionName=LAMBDA_NAME)
         lambda_client.update_function_code(FunctionName=LAMBDA_NAME, ZipFile=code_bytes)
+        lambda_client.get_waiter("function_updated").wait(FunctionName=LAMBDA_NAME)
+        lambda_client.update_function_configuration(
+            FunctionName=LAMBDA_NAME,
+            Environment=lambda_environment(topic_arn, dlq_url),
+            DeadLetterConfig=dead_letter_config,
+        )
         print(f"Codice Lambda aggiornato: {LAMBDA_NAME}")
     except lambda_client.exceptions.ResourceNotFoundException:
         lambda_client.create_function(
@@ -43,12 +131,14 @@ def deploy_lambda():
             Role=ROLE_ARN,
             Handler=HANDLER,
             Code={"ZipFile": code_bytes},
-            Timeout=300,
+            Timeout=FUNCTION_TIMEOUT,
             MemorySize=512,
-            Environment={"Variables": {"CVS_TABLE": "CVs", "REGION": REGION}},
+            Environment=lambda_environment(topic_arn, dlq_url),
+            DeadLetterConfig=dead_letter_config,
         )
         print(f"Lambda creata: {LAMBDA_NAME}")
 
+
 def add_lambda_permission():
     statement_id = "AllowS3Invoke"
     bucket_arn = f"arn:aws:s3:::{BUCKET}"
@@ -86,10 +176,139 @@ def add_s3_trigger():
     print(f"Trigger S3 configurato su {BUCKET}")
 
 
+def subscribe_textract_topic(topic_arn):
+    """Iscrive la Lambda al topic di completamento dei job Textract."""
+    function_arn = lambda_client.get_function(FunctionName=LAMBDA_NAME)[
+        "Configuration"
+    ]["FunctionArn"]
+    try:
+        lambda_client.add_permission(
+            FunctionName=LAMBDA_NAME,
+            StatementId="AllowTextractSNSInvoke",
+            Action="lambda:InvokeFunction",
+            Principal="sns.amazonaws.com",
+            SourceArn=topic_arn,
+        )
+        print("Permission Lambda per SNS aggiunta.")
+    except lambda_client.exceptions.ResourceConflictException:
+        print("Permission Lambda per SNS già presente.")
+    # subscribe è idempotente per lo stesso endpoint
+    sns.subscribe(TopicArn=topic_arn, Protocol="lambda", Endpoint=function_arn)
+    print(f"Lambda iscritta a {TEXTRACT_TOPIC_NAME}")
+
+
+def queue_arn(queue_url):
+    return sqs.get_queue_attributes(QueueUrl=queue_url, AttributeNames=["QueueArn"])[
+        "Attributes"
+    ]["QueueArn"]
+
+
+def create_dead_letter_queue():
+    """
+    Crea (o recupera) la dead-letter queue dell'ingestione e ne restituisce
+    l'URL. Esiste anche senza coda di ingestione: vi finiscono i documenti
+    che la Lambda non riesce a elaborare.
+    """
+    dlq_url = sqs.create_queue(
+        QueueName=DLQ_NAME,
+        Attributes={"MessageRetentionPeriod": str(14 * 24 * 3600)},
+    )["QueueUrl"]
+    print(f"Dead-letter queue pronta: {DLQ_NAME}")
+    return dlq_url
+
+
+def create_ingest_queues(dlq_url):
+    """
+    Crea la coda di ingestione, con la dead-letter queue come destinazione
+    dei messaggi falliti. Restituisce l'ARN della coda.
+    """
+    bucket_arn = f"arn:aws:s3:::{BUCKET}"
+    queue_url = sqs.create_queue(QueueName=QUEUE_NAME)["QueueUrl"]
+    arn = queue_arn(queue_url)
+    sqs.set_queue_attributes(
+        QueueUrl=queue_url,
+        Attributes={
+            # Almeno 6 volte il timeout della funzione, come raccomandato da AWS
+            "VisibilityTimeout": str(6 * FUNCTION_TIMEOUT),
+            "RedrivePolicy": json.dumps(
+                {
+                    "deadLetterTargetArn": queue_arn(dlq_url),
+                    "maxReceiveCount": str(QUEUE_MAX_RECEIVES),
+                }
+            ),
+            "Policy": json.dumps(
+                {
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Principal": {"Service": "s3.amazonaws.com"},
+                            "Action": "sqs:SendMessage",
+                            "Resource": arn,
+                            "Condition": {"ArnEquals": {"aws:SourceArn": bucket_arn}},
+                        }
+                    ],
+                }
+            ),
+        },
+    )
+    print(f"Code SQS pronte: {QUEUE_NAME} (DLQ {DLQ_NAME})")
+    return arn
+
+
+def add_queue_trigger(arn):
+    """Collega la coda alla Lambda con batch, finestra e concorrenza massima."""
+    settings = {
+        "BatchSize": QUEUE_BATCH_SIZE,
+        "MaximumBatchingWindowInSeconds": QUEUE_BATCHING_WINDOW,
+        "ScalingConfig": {"MaximumConcurrency": QUEUE_MAX_CONCURRENCY},
+        "FunctionResponseTypes": ["ReportBatchItemFailures"],
+    }
+    mappings = lambda_client.list_event_source_mappings(
+        EventSourceArn=arn, FunctionName=LAMBDA_NAME
+    )["EventSourceMappings"]
+    if mappings:
+        lambda_client.update_event_source_mapping(UUID=mappings[0]["UUID"], **settings)
+        print("Trigger SQS aggiornato.")
+    else:
+        lambda_client.create_event_source_mapping(
+            EventSourceArn=arn, FunctionName=LAMBDA_NAME, **settings
+        )
+        print("Trigger SQS creato.")
+
+
+def add_s3_queue_notification(arn):
+    """Invia le notifiche ObjectCreated del bucket alla coda invece che alla Lambda."""
+    s3 = boto3.client("s3", region_name=REGION)
+    notification = {
+        "QueueConfigurations": [
+            {
+                "QueueArn": arn,
+                "Events": ["s3:ObjectCreated:*"],
+                "Filter": {
+                    "Key": {"FilterRules": [{"Name": "suffix", "Value": ".pdf"}]}
+                },
+            }
+        ]
+    }
+    s3.put_bucket_notification_configuration(
+        Bucket=BUCKET, NotificationConfiguration=notification
+    )
+    print(f"Notifiche S3 di {BUCKET} inviate a {QUEUE_NAME}")
+
+
 if __name__ == "__main__":
     create_lambda_zip()
-    deploy_lambda()
+    topic_arn = create_textract_topic()
+    dlq_url = create_dead_letter_queue()
+    deploy_lambda(topic_arn, dlq_url)
     print("Attendo propagazione IAM...")
     time.sleep(10)
-    add_lambda_permission()
-    add_s3_trigger()
+    subscribe_textract_topic(topic_arn)
+    if USE_INGEST_QUEUE:
+        arn = create_ingest_queues(dlq_url)
+        add_queue_trigger(arn)
+        add_s3_queue_notification(arn)
+    else:
+        add_lambda_permission()
+        add_s3_trigger()
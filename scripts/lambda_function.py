@@ -1,65 +1,842 @@
 import boto3
+import hashlib
+import json
+import os
+import random
+import threading
 import time
 import logging
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
+from botocore.exceptions import ClientError
+
+import pdf_text
+from cv_stats import CORPUS_STAT_ID, shard_stat_id, stat_shard, term_stat_id
+from cv_text import (
+    TEXT_ATTRIBUTES,
+    TEXT_INLINE_LIMIT,
+    compress_text,
+    decompress_text,
+    text_attributes,
+)
+from text_processing import stem_surfaces, token_positions, token_set
+
+CVS_TABLE = os.environ.get("CVS_TABLE", "CVs")
+TERMS_TABLE = "CVTerms"
+STATS_TABLE = "CVStats"
+# Testi già estratti, per hash del contenuto: lo stesso PDF non passa due
+# volte dall'estrazione
+CONTENTS_TABLE = "CVContents"
+
+# Indice globale di CVTerms per cv_id: le posting presenti di un CV
+TERMS_CV_INDEX = "CvIdIndex"
+
+# Thread usati per aggiornare posting e document frequency dei termini, e
+# termini per transazione (due azioni ciascuno, al massimo 100 per transazione)
+STATS_WORKERS = 8
+TRANSACT_TERMS = 50
+
+# Backoff esponenziale con jitter per gli errori transitori di S3 e Textract
+# (oggetto non ancora leggibile, throttling)
+RETRY_ATTEMPTS = int(os.environ.get("RETRY_ATTEMPTS", 6))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", 0.25))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", 8))
+NOT_READY_ERRORS = {"404", "NoSuchKey", "InvalidS3ObjectException"}
+THROTTLING_ERRORS = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "LimitExceededException",
+    "InternalServerError",
+}
+
+# Percorso asincrono di Textract per i documenti multipagina: topic SNS di
+# completamento e ruolo con cui Textract vi pubblica (vedi deploy_lambda.py)
+TEXTRACT_SNS_TOPIC_ARN = os.environ.get("TEXTRACT_SNS_TOPIC_ARN")
+TEXTRACT_ROLE_ARN = os.environ.get("TEXTRACT_ROLE_ARN")
+
+# Coda in cui finiscono i documenti che non è stato possibile elaborare
+# (job Textract falliti), per l'analisi o il rilancio (vedi deploy_lambda.py)
+DEAD_LETTER_QUEUE_URL = os.environ.get("DEAD_LETTER_QUEUE_URL")
+
+# Oltre questo numero di pagine scansionate il documento va all'OCR
+# asincrono invece che a una chiamata sincrona per pagina
+OCR_PAGE_LIMIT = int(os.environ.get("OCR_PAGE_LIMIT", 3))
+
+# Record di un evento elaborati in parallelo, e quante volte i record falliti
+# vengono ritentati con una nuova invocazione asincrona
+RECORD_WORKERS = int(os.environ.get("RECORD_WORKERS", 4))
+MAX_REDRIVES = int(os.environ.get("MAX_REDRIVES", 2))
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Client creati una sola volta per container e riusati dalle invocazioni
+# successive (i client sono thread-safe)
+s3 = boto3.client("s3")
+textract = boto3.client("textract")
+lambda_client = boto3.client("lambda")
+sqs = boto3.client("sqs")
+
+# Pool dei record, anch'esso riusato tra le invocazioni. I resource DynamoDB
+# non sono thread-safe: ogni thread del pool ne crea uno proprio, una volta
+record_pool = ThreadPoolExecutor(max_workers=RECORD_WORKERS)
+thread_resources = threading.local()
+
+
+def local_dynamodb():
+    """Resource DynamoDB del thread corrente."""
+    if not hasattr(thread_resources, "dynamodb"):
+        thread_resources.dynamodb = boto3.session.Session().resource("dynamodb")
+    return thread_resources.dynamodb
+
+
+def df_update(term, delta, shard, surface=None):
+    """
+    Azione di transazione che aggiorna uno shard della document frequency del
+    termine (vedi cv_stats.py). Per un termine ridotto dallo stemming salva
+    anche la prima forma intera vista (`surface`), mostrata nei suggerimenti.
+    """
+    expression = "ADD df :d"
+    values = {":d": delta}
+    if surface:
+        expression += " SET surface = if_not_exists(surface, :s)"
+        values[":s"] = surface
+    return {
+        "Update": {
+            "TableName": STATS_TABLE,
+            "Key": {"stat_id": term_stat_id(term, shard)},
+            "UpdateExpression": expression,
+            "ExpressionAttributeValues": values,
+        }
+    }
+
+
+def stats_update(stat_id, expression, values):
+    """Azione di transazione su un aggregato di CVStats."""
+    return {
+        "Update": {
+            "TableName": STATS_TABLE,
+            "Key": {"stat_id": stat_id},
+            "UpdateExpression": expression,
+            "ExpressionAttributeValues": values,
+        }
+    }
+
+
+def transact(client, actions):
+    """
+    Esegue una transazione. Restituisce False se è stata annullata perché una
+    condizione non è verificata; i conflitti con altre transazioni sugli
+    stessi item (resi rari dagli shard dei contatori, vedi cv_stats.py) e il
+    throttling vengono ritentati con backoff.
+    """
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            with_backoff(client.transact_write_items, TransactItems=actions)
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+            reasons = {r.get("Code") for r in e.response.get("CancellationReasons", [])}
+            if "ConditionalCheckFailed" in reasons:
+                return False
+            if attempt == RETRY_ATTEMPTS - 1:
+                raise
+            time.sleep(
+                random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
+            )
+
+
+def indexed_terms(client, cv_id):
+    """Termini che hanno una posting del CV in CVTerms (indice per cv_id)."""
+    kwargs = {
+        "TableName": TERMS_TABLE,
+        "IndexName": TERMS_CV_INDEX,
+        "KeyConditionExpression": "cv_id = :c",
+        "ExpressionAttributeValues": {":c": cv_id},
+        "ProjectionExpression": "term",
+    }
+    while True:
+        response = client.query(**kwargs)
+        yield from (item["term"] for item in response["Items"])
+        if "LastEvaluatedKey" not in response:
+            return
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def posting_actions(cv_id, term, posting, exists, surface=None):
+    """
+    Azioni che portano la posting del termine allo stato voluto (`posting`, o
+    None per rimuoverla), supponendo che esista già o meno; `surface` è la
+    forma intera del termine (vedi df_update). La condizione
+    sull'esistenza lega l'aggiornamento della document frequency alla
+    creazione o rimozione effettiva della posting, quindi ripetere
+    l'indicizzazione non altera i contatori. La df aggiornata è lo shard del
+    CV: le ingestioni concorrenti di CV diversi raramente toccano lo stesso
+    item.
+    """
+    shard = stat_shard(cv_id)
+    if posting is None:
+        return [
+            {
+                "Delete": {
+                    "TableName": TERMS_TABLE,
+                    "Key": {"term": term, "cv_id": cv_id},
+                    "ConditionExpression": "attribute_exists(cv_id)",
+                }
+            },
+            df_update(term, -1, shard),
+        ]
+    if exists:
+        return [
+            {
+                "Put": {
+                    "TableName": TERMS_TABLE,
+                    "Item": posting,
+                    "ConditionExpression": "attribute_exists(cv_id)",
+                }
+            }
+        ]
+    return [
+        {
+            "Put": {
+                "TableName": TERMS_TABLE,
+                "Item": posting,
+                "ConditionExpression": "attribute_not_exists(cv_id)",
+            }
+        },
+        df_update(term, 1, shard, surface),
+    ]
+
+
+def sync_postings(client, cv_id, changes, surfaces=None):
+    """
+    Applica le modifiche [(term, posting o None, esiste)] alle posting del CV,
+    TRANSACT_TERMS termini per transazione; `surfaces` sono le forme intere
+    dei termini ridotti dallo stemming (text_processing.stem_surfaces). Se
+    una condizione fallisce (una posting scritta da un tentativo precedente e
+    non ancora visibile nell'indice, o un evento concorrente) i termini del
+    blocco vengono applicati uno alla volta, correggendo lo stato supposto.
+    """
+    surfaces = surfaces or {}
+
+    def actions_for(term, posting, exists):
+        return posting_actions(cv_id, term, posting, exists, surfaces.get(term))
+
+    def sync_chunk(chunk):
+        actions = [
+            action
+            for term, posting, exists in chunk
+            for action in actions_for(term, posting, exists)
+        ]
+        if transact(client, actions):
+            return
+        for term, posting, exists in chunk:
+            if transact(client, actions_for(term, posting, exists)):
+                continue
+            # Posting già rimossa: niente da fare
+            if posting is None:
+                continue
+            if not transact(client, actions_for(term, posting, not exists)):
+                raise RuntimeError(
+                    f"Posting {term} di {cv_id} modificata durante l'indice"
+                )
+
+    chunks = [
+        changes[i : i + TRANSACT_TERMS] for i in range(0, len(changes), TRANSACT_TERMS)
+    ]
+    with ThreadPoolExecutor(max_workers=STATS_WORKERS) as pool:
+        list(pool.map(sync_chunk, chunks))
+
+
+def index_cv(dynamodb, cv_id, text):
+    """
+    Aggiorna l'indice invertito per un CV: scrive le posting con term
+    frequency, posizioni (per le ricerche di frasi) e lunghezza del
+    documento, e rimuove quelle dei token non più presenti. La differenza è
+    calcolata rispetto alle posting effettivamente presenti in CVTerms, così
+    un evento ripetuto dopo un errore completa l'indice invece di saltarlo.
+    Restituisce la lunghezza del documento.
+    """
+    client = dynamodb.meta.client
+    positions = token_positions(text)
+    doc_len = sum(len(p) for p in positions.values())
+    existing = set(indexed_terms(client, cv_id))
+
+    # Con la lunghezza del documento cambiano anche le posting già esistenti
+    changes = [
+        (
+            term,
+            {
+                "term": term,
+                "cv_id": cv_id,
+                "tf": len(term_positions),
+                "doc_len": doc_len,
+                "pos": term_positions,
+            },
+            term in existing,
+        )
+        for term, term_positions in positions.items()
+    ]
+    changes += [(term, None, True) for term in existing - positions.keys()]
+    sync_postings(client, cv_id, changes, stem_surfaces(text))
+    return doc_len
+
+
+def complete_indexing(client, item, previous, doc_len):
+    """
+    Ultimo passo dell'indice di un CV: in un'unica transazione segna il CV
+    come indicizzato (indexed_hash, controllato da is_duplicate) e aggiorna
+    lo shard del CV degli aggregati del corpus per la differenza rispetto
+    alla lunghezza già contata (indexed_len). Restituisce False se nel
+    frattempo un altro evento ha riscritto o completato il CV.
+    """
+    previous_len = previous.get("indexed_len")
+    condition = (
+        "content_hash = :h AND email = :e AND uploaded_at = :u"
+        " AND attribute_not_exists(indexed_hash) AND "
+    )
+    values = {
+        ":h": item["content_hash"],
+        ":e": item["email"],
+        ":u": item["uploaded_at"],
+        ":n": doc_len,
+    }
+    if previous_len is None:
+        condition += "attribute_not_exists(indexed_len)"
+    else:
+        condition += "indexed_len = :l"
+        values[":l"] = previous_len
+
+    return transact(
+        client,
+        [
+            {
+                "Update": {
+                    "TableName": CVS_TABLE,
+                    "Key": {"cv_id": item["cv_id"]},
+                    "UpdateExpression": "SET indexed_hash = :h, indexed_len = :n",
+                    "ConditionExpression": condition,
+                    "ExpressionAttributeValues": values,
+                }
+            },
+            # Aggregati del corpus usati dal ranking BM25
+            stats_update(
+                shard_stat_id(CORPUS_STAT_ID, stat_shard(item["cv_id"])),
+                "ADD doc_count :d, total_len :l",
+                {
+                    ":d": 0 if previous_len is not None else 1,
+                    ":l": doc_len - (previous_len or 0),
+                },
+            ),
+        ],
+    )
+
+
+def bump_data_versions(client, item, previous):
+    """
+    Incrementa la versione dei dati, che il backend controlla per invalidare
+    le risposte in cache, e quelle degli elenchi dei proprietari del CV,
+    nuovo e precedente, usate come ETag. Sono contatori unici condivisi da
+    tutte le ingestioni: vengono aggiornati una volta per CV, a indice
+    completato e fuori dalle transazioni, con cui entrerebbero in conflitto.
+    """
+    owners = {item["email"], previous.get("email")} - {None}
+    for stat_id in ["version"] + [f"user#{owner}" for owner in sorted(owners)]:
+        with_backoff(
+            client.update_item,
+            TableName=STATS_TABLE,
+            Key={"stat_id": stat_id},
+            UpdateExpression="ADD data_version :one",
+            ExpressionAttributeValues={":one": 1},
+        )
+
+
+@contextmanager
+def timed(stage, key):
+    """Logga la durata di una fase dell'elaborazione di un CV."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        logger.info(f"[{key}] {stage}: {elapsed:.0f} ms")
+
+
+def with_backoff(operation, *args, **kwargs):
+    """
+    Esegue una chiamata AWS ripetendola con backoff esponenziale (full
+    jitter) sugli errori transitori: oggetto S3 non ancora disponibile per
+    Textract o throttling. Gli altri errori vengono propagati subito.
+    """
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            return operation(*args, **kwargs)
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code not in NOT_READY_ERRORS | THROTTLING_ERRORS:
+                raise
+            if attempt == RETRY_ATTEMPTS - 1:
+                raise
+            delay = random.uniform(
+                0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt)
+            )
+            logger.warning(f"{code}, nuovo tentativo tra {delay:.2f} s")
+            time.sleep(delay)
+
+
+def block_page(block):
+    """Pagina del blocco (assente nelle risposte dell'API sincrona)."""
+    return block.get("Page", 1)
+
+
+def extract_text(blocks):
+    """
+    Testo delle righe rilevate da Textract (o delle parole, se non ci sono
+    righe). Textract restituisce le righe di una pagina già in ordine di
+    lettura, colonna per colonna: le righe vengono solo raggruppate per
+    pagina (l'ordinamento è stabile), perché riordinarle per posizione
+    mescolerebbe le colonne dei CV impaginati su due colonne.
+    """
+    lines = [item for item in blocks if item["BlockType"] == "LINE"]
+    if lines:
+        lines.sort(key=block_page)
+        return " ".join(item.get("Text", "") for item in lines)
+    words = [item.get("Text", "") for item in blocks if item["BlockType"] == "WORD"]
+    return " ".join(words)
+
+
+def start_text_detection(bucket, key, etag):
+    """
+    Avvia l'OCR asincrono di Textract, che supporta i documenti multipagina.
+    Il completamento viene notificato sul topic SNS, a cui è iscritta questa
+    stessa funzione. Il token (oggetto + ETag) evita job duplicati se il
+    record viene riconsegnato.
+    """
+    token = hashlib.sha1(f"{bucket}/{key}/{etag}".encode()).hexdigest()
+    response = with_backoff(
+        textract.start_document_text_detection,
+        DocumentLocation={"S3Object": {"Bucket": bucket, "Name": key}},
+        NotificationChannel={
+            "SNSTopicArn": TEXTRACT_SNS_TOPIC_ARN,
+            "RoleArn": TEXTRACT_ROLE_ARN,
+        },
+        ClientRequestToken=token,
+    )
+    return response["JobId"]
 
-def lambda_handler(event, context):
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
 
-    textract = boto3.client("textract")
-    dynamodb = boto3.resource("dynamodb")
-    table = dynamodb.Table("CVs")
+def detect_text(bucket, key, head, multipage=False):
+    """
+    Testo del documento con l'API sincrona di Textract. Per i documenti che
+    l'API sincrona non supporta (PDF multipagina) avvia il job asincrono e
+    restituisce None: il CV verrà scritto alla notifica di completamento.
+    """
+    if multipage and TEXTRACT_SNS_TOPIC_ARN and TEXTRACT_ROLE_ARN:
+        job_id = start_text_detection(bucket, key, head["ETag"])
+        logger.info(f"[{key}] Documento multipagina, job Textract asincrono {job_id}")
+        return None
+    try:
+        with timed("textract", key):
+            response = with_backoff(
+                textract.detect_document_text,
+                Document={"S3Object": {"Bucket": bucket, "Name": key}},
+            )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "UnsupportedDocumentException":
+            raise
+        if not (TEXTRACT_SNS_TOPIC_ARN and TEXTRACT_ROLE_ARN):
+            raise
+        job_id = start_text_detection(bucket, key, head["ETag"])
+        logger.info(f"[{key}] Documento multipagina, job Textract asincrono {job_id}")
+        return None
+    return extract_text(response["Blocks"])
 
-    record = event["Records"][0]
+
+def ocr_page(page_pdf):
+    """OCR sincrono di un PDF di una sola pagina, inviato come byte."""
+    response = with_backoff(textract.detect_document_text, Document={"Bytes": page_pdf})
+    return extract_text(response["Blocks"])
+
+
+def extract_document_text(bucket, key, head):
+    """
+    Testo del documento: per i PDF il layer testuale letto con pypdf, con
+    l'OCR sincrono delle sole pagine scansionate. Se pypdf non è disponibile,
+    il PDF non è leggibile o le pagine scansionate sono più di
+    OCR_PAGE_LIMIT, il documento passa interamente da Textract.
+    """
+    if pdf_text.pypdf is None:
+        return detect_text(bucket, key, head)
+    with timed("get_object", key):
+        data = with_backoff(s3.get_object, Bucket=bucket, Key=key)["Body"].read()
+    if not pdf_text.is_pdf(data):
+        return detect_text(bucket, key, head)
+    try:
+        with timed("pdf_text", key):
+            pages = pdf_text.page_texts(data)
+    except Exception as e:
+        logger.warning(f"[{key}] PDF non leggibile con pypdf, uso Textract: {e}")
+        return detect_text(bucket, key, head)
+
+    scanned = [i for i, text in enumerate(pages) if not pdf_text.has_text_layer(text)]
+    logger.info(f"[{key}] {len(pages)} pagine, {len(scanned)} senza layer testuale")
+    if len(scanned) > OCR_PAGE_LIMIT:
+        return detect_text(bucket, key, head, multipage=len(pages) > 1)
+    if scanned:
+        with timed("textract", key):
+            for i in scanned:
+                pages[i] = ocr_page(pdf_text.single_page_pdf(data, i))
+    return " ".join(text for text in pages if text)
+
+
+def job_blocks(job_id):
+    """Blocchi del risultato di un job asincrono, pagina di risultati dopo pagina."""
+    kwargs = {"JobId": job_id, "MaxResults": 1000}
+    while True:
+        response = with_backoff(textract.get_document_text_detection, **kwargs)
+        yield from response["Blocks"]
+        if "NextToken" not in response:
+            return
+        kwargs["NextToken"] = response["NextToken"]
+
+
+def content_hash(head):
+    """
+    Hash del contenuto dell'oggetto: l'ETag di S3 (MD5 del contenuto, o delle
+    parti per gli upload multipart), quindi nessuna lettura aggiuntiva.
+    """
+    return "etag:" + head["ETag"].strip('"')
+
+
+def cv_item(bucket, key, head, text):
+    """Item del CV, con il testo compresso (o su S3 se molto lungo)."""
+    return {
+        "cv_id": key,
+        "email": head["Metadata"].get("email"),
+        "original_filename": head["Metadata"].get("originalname", key),
+        "uploaded_at": head["Metadata"].get("uploaddate"),
+        "s3_key": key,
+        "content_hash": content_hash(head),
+        # Token normalizzati, ordinati e distinti
+        "tokens": token_set(text),
+        **text_attributes(bucket, key, text.lower(), s3),
+    }
+
+
+def read_previous(cv_table, key):
+    """
+    Stato già salvato del CV (marcatore di indicizzazione, proprietario), se
+    esiste.
+    """
+    return cv_table.get_item(
+        Key={"cv_id": key},
+        ProjectionExpression="indexed_hash, email, uploaded_at",
+    ).get("Item")
+
+
+def is_duplicate(previous, head):
+    """
+    Evento già elaborato: CV indicizzato completamente con lo stesso
+    contenuto e gli stessi metadati. Un CV scritto ma non indicizzato (errore
+    dopo la scrittura) non ha il marcatore e viene rielaborato.
+    """
+    if previous is None:
+        return False
+    return (
+        previous.get("indexed_hash") == content_hash(head)
+        and previous.get("email") == head["Metadata"].get("email")
+        and previous.get("uploaded_at") == head["Metadata"].get("uploaddate")
+    )
+
+
+def known_text(head):
+    """Testo già estratto per lo stesso contenuto, o None."""
+    item = (
+        local_dynamodb()
+        .Table(CONTENTS_TABLE)
+        .get_item(Key={"content_hash": content_hash(head)})
+        .get("Item")
+    )
+    return decompress_text(item["text_z"]) if item else None
+
+
+def remember_text(head, text):
+    """Salva il testo estratto (compresso) per hash; la prima scrittura vince."""
+    data = compress_text(text)
+    if len(data) > TEXT_INLINE_LIMIT:
+        return
+    try:
+        local_dynamodb().Table(CONTENTS_TABLE).put_item(
+            Item={"content_hash": content_hash(head), "text_z": data},
+            ConditionExpression="attribute_not_exists(content_hash)",
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+
+def write_cv(client, item):
+    """
+    Scrive l'item del CV togliendo il marcatore di indicizzazione completata,
+    che complete_indexing rimette a indice e statistiche aggiornati; gli
+    attributi di testo non più usati vengono rimossi e indexed_len (la
+    lunghezza contata negli aggregati del corpus) resta quella precedente.
+    La scrittura è condizionata: se lo stesso contenuto con gli stessi
+    metadati è già stato indicizzato, restituisce None. Altrimenti
+    restituisce gli attributi precedenti del CV.
+    """
+    attributes = [name for name in item if name != "cv_id"]
+    names = {f"#a{i}": name for i, name in enumerate(attributes)}
+    values = {f":a{i}": item[name] for i, name in enumerate(attributes)}
+    stale = [name for name in TEXT_ATTRIBUTES if name not in item]
+    names.update({f"#r{i}": name for i, name in enumerate(stale)})
+    assignments = ", ".join(f"#a{i} = :a{i}" for i in range(len(attributes)))
+    removals = ", ".join(["indexed_hash"] + [f"#r{i}" for i in range(len(stale))])
+    try:
+        response = client.update_item(
+            TableName=CVS_TABLE,
+            Key={"cv_id": item["cv_id"]},
+            UpdateExpression=f"SET {assignments} REMOVE {removals}",
+            ConditionExpression=(
+                "attribute_not_exists(indexed_hash) OR indexed_hash <> :h"
+                " OR email <> :e OR uploaded_at <> :u"
+            ),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={
+                **values,
+                ":h": item["content_hash"],
+                ":e": item["email"],
+                ":u": item["uploaded_at"],
+            },
+            ReturnValues="ALL_OLD",
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        return None
+    return response.get("Attributes", {})
+
+
+def store_cv(bucket, key, head, text):
+    """
+    Scrive il CV su DynamoDB e aggiorna indice e versioni. Il CV risulta
+    elaborato (is_duplicate) solo dopo l'aggiornamento di indice e
+    statistiche: se un passo fallisce, la riconsegna dell'evento li completa.
+    Se nel frattempo un altro evento ha già elaborato lo stesso contenuto con
+    gli stessi metadati, questo evento non fa nulla. Le versioni dei dati
+    vengono incrementate per ultime, a CV completo: un errore proprio prima
+    le lascia indietro fino al CV successivo.
+    """
+    dynamodb = local_dynamodb()
+    client = dynamodb.meta.client
+    logger.info(f"Testo estratto: {text[:200]}...")
+    logger.info(f"User Email: {head['Metadata']}")
+
+    item = cv_item(bucket, key, head, text)
+    with timed("dynamodb", key):
+        previous = write_cv(client, item)
+    if previous is None:
+        logger.info(f"[{key}] Evento duplicato, CV già scritto")
+        return
+
+    with timed("index", key):
+        # L'indice cambia solo se cambia il contenuto (e non per un nuovo
+        # upload dello stesso PDF con altri metadati)
+        if (
+            previous.get("indexed_hash") == item["content_hash"]
+            and "indexed_len" in previous
+        ):
+            doc_len = int(previous["indexed_len"])
+        else:
+            doc_len = index_cv(dynamodb, key, text)
+        if not complete_indexing(client, item, previous, doc_len):
+            logger.info(f"[{key}] CV riscritto da un altro evento durante l'indice")
+            return
+    bump_data_versions(client, item, previous)
+
+
+def process_record(record):
+    """Elabora un oggetto S3: metadati, Textract, scrittura del CV e indice."""
     bucket = record["s3"]["bucket"]["name"]
     key = urllib.parse.unquote_plus(record["s3"]["object"]["key"])
 
     # Logga info file
-    s3 = boto3.client("s3")
-    head = s3.head_object(Bucket=bucket, Key=key)
+    with timed("head_object", key):
+        head = with_backoff(s3.head_object, Bucket=bucket, Key=key)
     logger.info(
         f"Bucket: {bucket}, Key: {key}, Size: {head['ContentLength']} bytes, Content-Type: {head['ContentType']}"
     )
 
-    time.sleep(2)
+    # Riconsegne dello stesso evento: nessun lavoro
+    previous = read_previous(local_dynamodb().Table(CVS_TABLE), key)
+    if is_duplicate(previous, head):
+        logger.info(f"[{key}] Contenuto già elaborato, evento ignorato")
+        return key
 
-    # Textract
-    response = textract.detect_document_text(
-        Document={"S3Object": {"Bucket": bucket, "Name": key}}
+    # Contenuto già visto (stesso PDF caricato di nuovo): niente estrazione
+    text = known_text(head)
+    if text is not None:
+        logger.info(f"[{key}] Testo riusato da {content_hash(head)}")
+    else:
+        # Layer testuale del PDF, Textract solo dove serve
+        text = extract_document_text(bucket, key, head)
+        if text is None:
+            return key
+        remember_text(head, text)
+    store_cv(bucket, key, head, text)
+    return key
+
+
+def send_to_dead_letter_queue(bucket, key, job):
+    """
+    Invia alla dead-letter queue un documento il cui job Textract è fallito.
+    Il corpo del messaggio è una notifica S3 dell'oggetto, come quelle della
+    coda di ingestione, così il messaggio può esservi rispostato (redrive)
+    per rielaborare il documento; stato e job sono negli attributi.
+    """
+    if not DEAD_LETTER_QUEUE_URL:
+        # Senza la coda il fallimento dell'invocazione lo rende visibile
+        # (retry e destinazione di errore della Lambda)
+        raise RuntimeError(f"Job Textract {job['JobId']} fallito per {key}")
+    record = {
+        "eventSource": "aws:s3",
+        "s3": {
+            "bucket": {"name": bucket},
+            "object": {"key": urllib.parse.quote_plus(key)},
+        },
+    }
+    sqs.send_message(
+        QueueUrl=DEAD_LETTER_QUEUE_URL,
+        MessageBody=json.dumps({"Records": [record]}),
+        MessageAttributes={
+            "TextractJobId": {"DataType": "String", "StringValue": job["JobId"]},
+            "TextractStatus": {"DataType": "String", "StringValue": job["Status"]},
+        },
     )
+    logger.info(f"[{key}] Documento inviato alla dead-letter queue")
 
-    logger.info(f"Risposta Textract: {response}")
 
-    # Estrazione testo
-    lines = [
-        item.get("Text", "")
-        for item in response["Blocks"]
-        if item["BlockType"] == "LINE"
-    ]
-    if lines:
-        text = " ".join(lines)
-    else:
-        words = [
-            item.get("Text", "")
-            for item in response["Blocks"]
-            if item["BlockType"] == "WORD"
-        ]
-        text = " ".join(words)
-    logger.info(f"Testo estratto: {text[:200]}...")
-    logger.info(f"User Email: {head['Metadata']}")
+def process_textract_completion(message):
+    """
+    Secondo stadio del percorso asincrono: legge il risultato del job
+    notificato da SNS, ricompone le righe in ordine di lettura e scrive il CV.
+    """
+    job = json.loads(message)
+    bucket = job["DocumentLocation"]["S3Bucket"]
+    key = job["DocumentLocation"]["S3ObjectName"]
+    if job["Status"] != "SUCCEEDED":
+        # Un job fallito non migliora ritentando subito: il documento va
+        # nella dead-letter queue
+        logger.error(f"[{key}] Job Textract {job['JobId']} terminato: {job['Status']}")
+        send_to_dead_letter_queue(bucket, key, job)
+        return None
 
-    # Carica i dati su DynamoDB
-    table.put_item(
-        Item={
-            "cv_id": key,
-            "email": head["Metadata"].get("email"),
-            "original_filename": head["Metadata"].get("originalname", key),
-            "uploaded_at": head["Metadata"].get("uploaddate"),
-            "s3_key": key,
-            "text": text.lower(),
-        }
+    with timed("textract_results", key):
+        text = extract_text(list(job_blocks(job["JobId"])))
+    with timed("head_object", key):
+        head = with_backoff(s3.head_object, Bucket=bucket, Key=key)
+    remember_text(head, text)
+    store_cv(bucket, key, head, text)
+    return key
+
+
+def process_records(records):
+    """
+    Elabora i record in parallelo sul pool. Restituisce le chiavi elaborate
+    e i record falliti: un errore su un oggetto non blocca gli altri.
+    """
+
+    def safe_process(record):
+        try:
+            return process_record(record), None
+        except Exception:
+            logger.exception(f"Errore nell'elaborazione del record {record}")
+            return None, record
+
+    outcomes = list(record_pool.map(safe_process, records))
+    processed = [key for key, _ in outcomes if key is not None]
+    failed = [record for _, record in outcomes if record is not None]
+    return processed, failed
+
+
+def redrive_failed(records, attempt, context):
+    """Rilancia la funzione in modo asincrono con i soli record falliti."""
+    lambda_client.invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType="Event",
+        Payload=json.dumps({"Records": records, "redrive_attempt": attempt}),
     )
+    logger.info(f"{len(records)} record rilanciati (tentativo {attempt})")
+
+
+def message_records(message):
+    """Record S3 contenuti nel corpo di un messaggio SQS (nessuno per s3:TestEvent)."""
+    return json.loads(message["body"]).get("Records", [])
+
+
+def handle_sqs_event(messages):
+    """
+    Elabora un batch di messaggi SQS, ognuno con una notifica S3. Restituisce
+    in batchItemFailures i soli messaggi con almeno un record fallito: SQS li
+    riconsegna e, dopo maxReceiveCount tentativi, li sposta nella DLQ.
+    """
+    batch = []
+    failures = []
+    for message in messages:
+        try:
+            batch.append((message["messageId"], message_records(message)))
+        except (ValueError, AttributeError):
+            logger.exception(f"Messaggio non valido: {message['messageId']}")
+            failures.append(message["messageId"])
+
+    records = [record for _, s3_records in batch for record in s3_records]
+    with timed("batch", f"{len(messages)} messaggi, {len(records)} record"):
+        _, failed = process_records(records)
+
+    failed_ids = {id(record) for record in failed}
+    for message_id, s3_records in batch:
+        if any(id(record) in failed_ids for record in s3_records):
+            failures.append(message_id)
+    return {"batchItemFailures": [{"itemIdentifier": f} for f in failures]}
+
+
+def handle_sns_event(records):
+    """Notifiche di completamento dei job Textract asincroni."""
+    processed = [process_textract_completion(r["Sns"]["Message"]) for r in records]
+    return {"status": "ok", "processed": [key for key in processed if key]}
+
+
+def lambda_handler(event, context):
+    """
+    Elabora tutti i record dell'evento S3. I record falliti vengono ritentati
+    da soli con una nuova invocazione asincrona, fino a MAX_REDRIVES volte;
+    poi l'invocazione fallisce e subentrano i retry (e la destinazione di
+    errore) della Lambda, con i soli record falliti.
+
+    Con la coda SQS tra S3 e la Lambda (vedi deploy_lambda.py) l'evento è un
+    batch di messaggi: i retry sono gestiti da SQS tramite batchItemFailures.
+    Le notifiche SNS sono i completamenti dei job Textract multipagina.
+    """
+    records = event.get("Records", [])
+    if records and records[0].get("eventSource") == "aws:sqs":
+        return handle_sqs_event(records)
+    if records and records[0].get("EventSource") == "aws:sns":
+        return handle_sns_event(records)
+
+    with timed("event", f"{len(records)} record"):
+        processed, failed = process_records(records)
+
+    if failed:
+        attempt = event.get("redrive_attempt", 0) + 1
+        if attempt > MAX_REDRIVES:
+            raise RuntimeError(f"{len(failed)} record non elaborati: {failed}")
+        redrive_failed(failed, attempt, context)
 
-    return {"status": "ok", "text": text}
+    return {
+        "status": "ok" if not failed else "partial",
+        "processed": processed,
+        "failed": [record["s3"]["object"]["key"] for record in failed],
+    }
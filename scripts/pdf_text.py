@@ -0,0 +1,55 @@
+"""
+Estrazione del testo dal layer testuale dei PDF, prima di ricorrere a Textract.
+
+La maggior parte dei CV è un PDF generato digitalmente, con il testo già
+presente: leggerlo con pypdf non costa chiamate OCR. Le pagine senza testo
+utile (scansioni, immagini) vengono riconosciute con un'euristica sulla
+densità del testo e rimandate all'OCR una per una.
+"""
+
+import io
+import os
+
+try:
+    import pypdf
+except ImportError:  # senza pypdf tutto il documento passa da Textract
+    pypdf = None
+
+# Una pagina con meno caratteri alfanumerici di così è trattata come scansione
+MIN_PAGE_CHARS = int(os.environ.get("PDF_MIN_PAGE_CHARS", 40))
+# Quota minima di caratteri leggibili: font senza mappa Unicode producono
+# testo illeggibile ((cid:..), caratteri di sostituzione, simboli)
+MIN_READABLE_RATIO = 0.8
+
+
+def is_pdf(data):
+    return data[:5] == b"%PDF-"
+
+
+def page_texts(data):
+    """Testo di ogni pagina del PDF, con gli spazi normalizzati."""
+    reader = pypdf.PdfReader(io.BytesIO(data))
+    return [" ".join((page.extract_text() or "").split()) for page in reader.pages]
+
+
+def has_text_layer(text):
+    """
+    Euristica di densità: la pagina ha un layer testuale utilizzabile se
+    contiene abbastanza caratteri alfanumerici e quasi tutti leggibili.
+    """
+    chars = text.replace(" ", "")
+    if not chars:
+        return False
+    alnum = sum(c.isalnum() for c in chars)
+    readable = sum(c.isprintable() and c != "�" for c in chars)
+    return alnum >= MIN_PAGE_CHARS and readable / len(chars) >= MIN_READABLE_RATIO
+
+
+def single_page_pdf(data, index):
+    """PDF con la sola pagina `index`, da inviare all'OCR sincrono."""
+    reader = pypdf.PdfReader(io.BytesIO(data))
+    writer = pypdf.PdfWriter()
+    writer.add_page(reader.pages[index])
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
@@ -0,0 +1,133 @@
+"""
+Ricostruisce l'indice invertito (CVTerms, CVStats) a partire dai CV già
+presenti nella tabella CVs. Va eseguito una volta dopo deploy_dynamodb.py per
+indicizzare i CV caricati prima dell'introduzione dell'indice; da quel momento
+l'indice è mantenuto dalla Lambda di ingestione.
+
+Le document frequency vengono scritte come valori assoluti, quindi lo script
+si può rieseguire senza gonfiare i contatori. Va rieseguito anche quando
+cambia la normalizzazione del testo (text_processing.py, TEXT_STEMMING): le
+posting e le statistiche dei termini precedenti vengono rimosse e ogni CV
+riceve il nuovo insieme di token. Rieseguirlo aggiunge anche le posizioni dei
+token alle posting scritte prima delle ricerche per frase, e ai CV indicizzati
+prima del marcatore di indicizzazione completata (indexed_hash) la lunghezza
+già contata negli aggregati (indexed_len), usata dalla Lambda per aggiornare
+le statistiche del corpus senza contare due volte lo stesso CV.
+"""
+
+import os
+import sys
+from collections import Counter
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Backend"))
+from cv_stats import CORPUS_STAT_ID, TERM_PREFIX, term_stat_id  # noqa: E402
+from cv_text import expand_text  # noqa: E402
+from text_processing import stem_surfaces, token_positions  # noqa: E402
+
+load_dotenv()
+
+AWS_REGION = os.getenv("REGION", "eu-west-2")
+
+dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
+
+
+def scan_items(table, **scan_args):
+    response = table.scan(**scan_args)
+    yield from response["Items"]
+    while "LastEvaluatedKey" in response:
+        response = table.scan(
+            ExclusiveStartKey=response["LastEvaluatedKey"], **scan_args
+        )
+        yield from response["Items"]
+
+
+def clear_index():
+    """
+    Rimuove posting, document frequency e aggregati del corpus (tutti gli
+    shard, vedi cv_stats.py) scritti con la tokenizzazione precedente.
+    """
+    terms = dynamodb.Table("CVTerms")
+    with terms.batch_writer() as batch:
+        for item in scan_items(terms, ProjectionExpression="term, cv_id"):
+            batch.delete_item(Key={"term": item["term"], "cv_id": item["cv_id"]})
+    stats = dynamodb.Table("CVStats")
+    with stats.batch_writer() as batch:
+        for item in scan_items(
+            stats,
+            ProjectionExpression="stat_id",
+            FilterExpression=Attr("stat_id").begins_with(TERM_PREFIX)
+            | Attr("stat_id").begins_with(CORPUS_STAT_ID),
+        ):
+            batch.delete_item(Key={"stat_id": item["stat_id"]})
+
+
+def rebuild_index():
+    clear_index()
+    cv_table = dynamodb.Table("CVs")
+    document_frequencies = Counter()
+    # Forma intera dei termini ridotti dallo stemming, come la scrive la Lambda
+    surfaces = {}
+    indexed = 0
+    total_len = 0
+    with dynamodb.Table("CVTerms").batch_writer() as postings:
+        for cv in scan_items(cv_table):
+            text = expand_text(cv).get("text", "")
+            positions = token_positions(text)
+            doc_len = sum(len(p) for p in positions.values())
+            # Lunghezza contata negli aggregati e marcatore di indicizzazione
+            # completata, come li scrive la Lambda
+            update = "SET tokens = :t, indexed_len = :n"
+            if "content_hash" in cv:
+                update += ", indexed_hash = content_hash"
+            cv_table.update_item(
+                Key={"cv_id": cv["cv_id"]},
+                UpdateExpression=update,
+                ExpressionAttributeValues={":t": sorted(positions), ":n": doc_len},
+            )
+            for term, term_positions in positions.items():
+                postings.put_item(
+                    Item={
+                        "term": term,
+                        "cv_id": cv["cv_id"],
+                        "tf": len(term_positions),
+                        "doc_len": doc_len,
+                        "pos": term_positions,
+                    }
+                )
+            document_frequencies.update(positions.keys())
+            for term, surface in stem_surfaces(text).items():
+                surfaces.setdefault(term, surface)
+            indexed += 1
+            total_len += doc_len
+
+    with dynamodb.Table("CVStats").batch_writer() as stats:
+        # Valori assoluti nello shard 0; gli altri shard sono stati rimossi
+        for term, df in document_frequencies.items():
+            item = {"stat_id": term_stat_id(term), "df": df}
+            if term in surfaces:
+                item["surface"] = surfaces[term]
+            stats.put_item(Item=item)
+        stats.put_item(
+            Item={
+                "stat_id": CORPUS_STAT_ID,
+                "doc_count": indexed,
+                "total_len": total_len,
+            }
+        )
+
+    # Invalida le cache del backend
+    dynamodb.Table("CVStats").update_item(
+        Key={"stat_id": "version"},
+        UpdateExpression="ADD data_version :one",
+        ExpressionAttributeValues={":one": 1},
+    )
+
+    print(f"Indicizzati {indexed} CV, {len(document_frequencies)} termini distinti")
+
+
+if __name__ == "__main__":
+    rebuild_index()
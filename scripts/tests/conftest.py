@@ -0,0 +1,110 @@
+"""
+Configurazione comune dei test della Lambda di ingestione.
+
+AWS è sostituito dai mock in-process di moto: tabelle, bucket e code sono
+creati con gli stessi script del deploy. Le variabili d'ambiente vanno
+impostate prima di importare i moduli, che creano i client all'import.
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), "Backend")
+# Come nello zip della Lambda, i moduli condivisi con il backend sono importabili
+sys.path[:0] = [SCRIPTS_DIR, BACKEND_DIR]
+
+os.environ.update(
+    AWS_ACCESS_KEY_ID="testing",
+    AWS_SECRET_ACCESS_KEY="testing",
+    AWS_DEFAULT_REGION="eu-west-2",
+    AWS_REGION="eu-west-2",
+    REGION="eu-west-2",
+    S3_BUCKET="cv-bucket",
+    # Nessuna attesa tra i tentativi
+    RETRY_BASE_DELAY="0",
+)
+os.environ.pop("AWS_ENDPOINT_URL", None)
+os.environ.pop("TEXT_STEMMING", None)
+
+from moto import mock_aws  # noqa: E402  (prima dei client creati all'import)
+
+BUCKET = "cv-bucket"
+FUNCTION_NAME = "cvgram-cv-processing"
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """Tabelle, bucket, code e funzione Lambda vuoti per ogni test."""
+    with mock_aws(config={"lambda": {"use_docker": False}}):
+        import boto3
+        import deploy_dynamodb
+        import deploy_lambda
+        import lambda_function
+
+        deploy_dynamodb.create_cv_table()
+        deploy_dynamodb.create_terms_table()
+        deploy_dynamodb.create_stats_table()
+        deploy_dynamodb.create_contents_table()
+        boto3.client("s3").create_bucket(
+            Bucket=BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        dlq_url = deploy_lambda.create_dead_letter_queue()
+        deploy_lambda.create_ingest_queues(dlq_url)
+        monkeypatch.setattr(lambda_function, "DEAD_LETTER_QUEUE_URL", dlq_url)
+        yield SimpleNamespace(
+            dlq_url=dlq_url,
+            queue_url=boto3.client("sqs").get_queue_url(
+                QueueName=deploy_lambda.QUEUE_NAME
+            )["QueueUrl"],
+            context=SimpleNamespace(invoked_function_arn=create_function()),
+        )
+
+
+def create_function():
+    """Funzione registrata su moto, destinataria dei rilanci asincroni."""
+    import io
+    import zipfile
+
+    import boto3
+
+    role = boto3.client("iam").create_role(
+        RoleName="cvgram-lambda-role",
+        AssumeRolePolicyDocument="{}",
+    )["Role"]["Arn"]
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("lambda_function.py", "def lambda_handler(event, context): pass")
+    return boto3.client("lambda").create_function(
+        FunctionName=FUNCTION_NAME,
+        Runtime="python3.12",
+        Role=role,
+        Handler="lambda_function.lambda_handler",
+        Code={"ZipFile": archive.getvalue()},
+    )["FunctionArn"]
+
+
+def upload(key, body, email="anna@example.com", uploaded_at="2025-01-01"):
+    """Carica un CV con i metadati scritti dal frontend."""
+    import boto3
+
+    boto3.client("s3").put_object(
+        Bucket=BUCKET,
+        Key=key,
+        Body=body,
+        ContentType="application/pdf",
+        Metadata={"email": email, "uploaddate": uploaded_at, "originalname": key},
+    )
+
+
+def s3_record(key):
+    """Record di una notifica S3 ObjectCreated."""
+    return {
+        "eventSource": "aws:s3",
+        "eventName": "ObjectCreated:Put",
+        "s3": {"bucket": {"name": BUCKET}, "object": {"key": key}},
+    }
@@ -0,0 +1,246 @@
+"""
+Ingestione tramite la coda SQS e rilanci dei record falliti: la Lambda deve
+segnalare in batchItemFailures solo i messaggi con record falliti, SQS li
+riconsegna fino a maxReceiveCount e poi li sposta nella DLQ; gli eventi S3
+diretti sono rilanciati con i soli record falliti fino a MAX_REDRIVES volte.
+"""
+
+import json
+
+import boto3
+import pytest
+
+import deploy_lambda
+import lambda_function
+from conftest import BUCKET, s3_record, upload
+
+TEXTS = {
+    "anna.pdf": "Python developer AWS",
+    "bruno.pdf": "Java engineer Kubernetes",
+    "carla.pdf": "Data scientist Python",
+}
+
+
+@pytest.fixture
+def extraction(monkeypatch):
+    """Testo dei CV senza PDF né Textract; i CV in `broken` falliscono."""
+    broken = set()
+    calls = []
+
+    def extract_document_text(bucket, key, head):
+        calls.append(key)
+        if key in broken:
+            raise RuntimeError(f"Textract non disponibile per {key}")
+        return TEXTS[key]
+
+    monkeypatch.setattr(lambda_function, "extract_document_text", extract_document_text)
+    return {"broken": broken, "calls": calls}
+
+
+def cv_ids():
+    table = boto3.resource("dynamodb").Table("CVs")
+    return sorted(item["cv_id"] for item in table.scan()["Items"])
+
+
+def sqs_message(message_id, body):
+    """Messaggio SQS nel formato dell'evento Lambda."""
+    return {
+        "messageId": message_id,
+        "receiptHandle": f"handle-{message_id}",
+        "body": body,
+        "eventSource": "aws:sqs",
+    }
+
+
+def notification(*keys):
+    return json.dumps({"Records": [s3_record(key) for key in keys]})
+
+
+def poll(queue_url):
+    """
+    Un'invocazione della sorgente SQS della Lambda: riceve un batch, lo passa
+    al handler, elimina i messaggi riusciti e rende subito visibili i falliti.
+    """
+    sqs = boto3.client("sqs")
+    messages = sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10).get(
+        "Messages", []
+    )
+    if not messages:
+        return None
+    event = {
+        "Records": [
+            dict(
+                sqs_message(m["MessageId"], m["Body"]), receiptHandle=m["ReceiptHandle"]
+            )
+            for m in messages
+        ]
+    }
+    response = lambda_function.lambda_handler(event, None)
+    failed = {failure["itemIdentifier"] for failure in response["batchItemFailures"]}
+    for message in messages:
+        if message["MessageId"] in failed:
+            sqs.change_message_visibility(
+                QueueUrl=queue_url,
+                ReceiptHandle=message["ReceiptHandle"],
+                VisibilityTimeout=0,
+            )
+        else:
+            sqs.delete_message(
+                QueueUrl=queue_url, ReceiptHandle=message["ReceiptHandle"]
+            )
+    return response
+
+
+def queue_messages(queue_url):
+    messages = boto3.client("sqs").receive_message(
+        QueueUrl=queue_url, MaxNumberOfMessages=10
+    )
+    return messages.get("Messages", [])
+
+
+def test_batch_item_failures_list_only_failed_messages(aws, extraction):
+    for key in TEXTS:
+        upload(key, key.encode())
+    extraction["broken"].add("bruno.pdf")
+    event = {
+        "Records": [
+            sqs_message("m1", notification("anna.pdf")),
+            sqs_message("m2", notification("bruno.pdf", "carla.pdf")),
+            sqs_message("m3", "non json"),
+            sqs_message("m4", json.dumps({"Event": "s3:TestEvent"})),
+        ]
+    }
+
+    response = lambda_function.lambda_handler(event, aws.context)
+
+    assert response == {
+        "batchItemFailures": [{"itemIdentifier": "m3"}, {"itemIdentifier": "m2"}]
+    }
+    # I record riusciti dei messaggi falliti sono già scritti: la
+    # riconsegna li riconosce come duplicati
+    assert cv_ids() == ["anna.pdf", "carla.pdf"]
+
+
+def test_missing_object_fails_its_message(aws, extraction, monkeypatch):
+    monkeypatch.setattr(lambda_function, "RETRY_ATTEMPTS", 2)
+    upload("anna.pdf", b"anna")
+    event = {
+        "Records": [
+            sqs_message("m1", notification("anna.pdf")),
+            sqs_message("m2", notification("deleted.pdf")),
+        ]
+    }
+
+    response = lambda_function.lambda_handler(event, aws.context)
+
+    assert response["batchItemFailures"] == [{"itemIdentifier": "m2"}]
+    assert cv_ids() == ["anna.pdf"]
+
+
+def test_failed_messages_are_redelivered_then_moved_to_the_dlq(aws, extraction):
+    for key in TEXTS:
+        upload(key, key.encode())
+    extraction["broken"].add("bruno.pdf")
+    sqs = boto3.client("sqs")
+    for key in TEXTS:
+        sqs.send_message(QueueUrl=aws.queue_url, MessageBody=notification(key))
+
+    deliveries = 0
+    while poll(aws.queue_url) is not None:
+        deliveries += 1
+
+    assert cv_ids() == ["anna.pdf", "carla.pdf"]
+    # Un CV elaborato non viene estratto di nuovo nelle riconsegne
+    assert extraction["calls"].count("anna.pdf") == 1
+    assert extraction["calls"].count("bruno.pdf") == deploy_lambda.QUEUE_MAX_RECEIVES
+    assert deliveries == deploy_lambda.QUEUE_MAX_RECEIVES
+
+    dead = queue_messages(aws.dlq_url)
+    assert [json.loads(m["Body"]) for m in dead] == [
+        json.loads(notification("bruno.pdf"))
+    ]
+
+
+def test_dlq_message_of_a_failed_textract_job_can_be_redriven(aws, extraction):
+    upload("bruno.pdf", b"bruno")
+    job = {
+        "JobId": "job-1",
+        "Status": "FAILED",
+        "DocumentLocation": {"S3Bucket": BUCKET, "S3ObjectName": "bruno.pdf"},
+    }
+    event = {
+        "Records": [
+            {"EventSource": "aws:sns", "Sns": {"Message": json.dumps(job)}},
+        ]
+    }
+
+    assert lambda_function.lambda_handler(event, aws.context)["processed"] == []
+
+    (dead,) = boto3.client("sqs").receive_message(
+        QueueUrl=aws.dlq_url, MessageAttributeNames=["All"]
+    )["Messages"]
+    assert dead["MessageAttributes"]["TextractStatus"]["StringValue"] == "FAILED"
+
+    # Redrive verso la coda di ingestione: il corpo è una notifica S3
+    response = lambda_function.lambda_handler(
+        {"Records": [sqs_message(dead["MessageId"], dead["Body"])]}, aws.context
+    )
+    assert response == {"batchItemFailures": []}
+    assert cv_ids() == ["bruno.pdf"]
+
+
+@pytest.fixture
+def invocations(monkeypatch):
+    """Registra i rilanci asincroni della funzione, eseguiti su moto."""
+    calls = []
+    invoke = lambda_function.lambda_client.invoke
+
+    def record(**kwargs):
+        calls.append(kwargs)
+        return invoke(**kwargs)
+
+    monkeypatch.setattr(lambda_function.lambda_client, "invoke", record)
+    return calls
+
+
+def test_failed_s3_records_are_redriven(aws, extraction, invocations):
+    for key in TEXTS:
+        upload(key, key.encode())
+    extraction["broken"].add("bruno.pdf")
+    records = [s3_record(key) for key in TEXTS]
+
+    response = lambda_function.lambda_handler({"Records": records}, aws.context)
+
+    assert response == {
+        "status": "partial",
+        "processed": ["anna.pdf", "carla.pdf"],
+        "failed": ["bruno.pdf"],
+    }
+    (call,) = invocations
+    assert call["FunctionName"] == aws.context.invoked_function_arn
+    assert call["InvocationType"] == "Event"
+    payload = json.loads(call["Payload"])
+    assert payload == {"Records": [s3_record("bruno.pdf")], "redrive_attempt": 1}
+
+    # Il rilancio elabora solo il record fallito
+    extraction["broken"].clear()
+    response = lambda_function.lambda_handler(payload, aws.context)
+    assert response["processed"] == ["bruno.pdf"]
+    assert len(invocations) == 1
+    assert extraction["calls"].count("anna.pdf") == 1
+
+
+def test_redrives_stop_after_max_redrives(aws, extraction, invocations):
+    upload("bruno.pdf", b"bruno")
+    extraction["broken"].add("bruno.pdf")
+    event = {"Records": [s3_record("bruno.pdf")]}
+
+    for attempt in range(1, lambda_function.MAX_REDRIVES + 1):
+        lambda_function.lambda_handler(event, aws.context)
+        event = json.loads(invocations[-1]["Payload"])
+        assert event["redrive_attempt"] == attempt
+
+    # Esauriti i rilanci l'invocazione fallisce: subentrano i retry di Lambda
+    with pytest.raises(RuntimeError):
+        lambda_function.lambda_handler(event, aws.context)
+    assert len(invocations) == lambda_function.MAX_REDRIVES
@@ -0,0 +1,292 @@
+"""
+Indicizzazione idempotente della Lambda: dopo ogni sequenza di eventi,
+riconsegne ed errori le statistiche di CVStats (sommate sugli shard) devono
+corrispondere alle posting di CVTerms, e il marcatore indexed_hash deve
+indicare solo i CV indicizzati completamente.
+"""
+
+import hashlib
+from collections import Counter
+
+import boto3
+import pytest
+
+import cv_text
+import lambda_function
+import text_processing
+from conftest import BUCKET
+from cv_stats import CORPUS_STAT_ID, stat_term, unsharded_stat_id
+
+PYTHON_CV = "Python developer with Django and AWS experience"
+JAVA_CV = "Java engineer Spring Kubernetes Python Docker Terraform"
+ANNA = {"email": "anna@example.com", "uploaded_at": "2025-01-01"}
+
+
+def scan(table_name):
+    table = boto3.resource("dynamodb").Table(table_name)
+    response = table.scan()
+    items = response["Items"]
+    while "LastEvaluatedKey" in response:
+        response = table.scan(ExclusiveStartKey=response["LastEvaluatedKey"])
+        items.extend(response["Items"])
+    return items
+
+
+def stats():
+    return {item["stat_id"]: item for item in scan("CVStats")}
+
+
+def dfs():
+    """Document frequency dei termini, sommate sugli shard."""
+    counts = Counter()
+    for stat_id, item in stats().items():
+        if stat_id.startswith("term#"):
+            counts[stat_term(stat_id)] += int(item["df"])
+    return +counts
+
+
+def corpus():
+    """Aggregati del corpus, sommati sugli shard."""
+    totals = Counter()
+    for stat_id, item in stats().items():
+        if unsharded_stat_id(stat_id) == CORPUS_STAT_ID:
+            totals.update(doc_count=int(item["doc_count"]))
+            totals.update(total_len=int(item["total_len"]))
+    return totals
+
+
+def cv(key):
+    table = boto3.resource("dynamodb").Table("CVs")
+    return table.get_item(Key={"cv_id": key})["Item"]
+
+
+def terms_of(key):
+    return {posting["term"] for posting in scan("CVTerms") if posting["cv_id"] == key}
+
+
+def assert_index_consistent():
+    """Document frequency e aggregati del corpus ricalcolati dalle posting."""
+    postings = scan("CVTerms")
+    assert dfs() == Counter(posting["term"] for posting in postings)
+
+    indexed = [item for item in scan("CVs") if "indexed_len" in item]
+    totals = corpus()
+    assert totals["doc_count"] == len(indexed)
+    assert totals["total_len"] == sum(int(item["indexed_len"]) for item in indexed)
+    assert totals["total_len"] == sum(len(posting["pos"]) for posting in postings)
+
+
+def object_head(key, text, email, uploaded_at):
+    """
+    Risposta di HeadObject di un CV caricato dal frontend; l'ETag, come in S3,
+    dipende solo dal contenuto.
+    """
+    etag = hashlib.md5(text.encode()).hexdigest()
+    return {
+        "ETag": f'"{etag}"',
+        "Metadata": {"email": email, "uploaddate": uploaded_at, "originalname": key},
+    }
+
+
+def is_processed(key, head):
+    table = lambda_function.local_dynamodb().Table(lambda_function.CVS_TABLE)
+    return lambda_function.is_duplicate(lambda_function.read_previous(table, key), head)
+
+
+def store(key, text, email, uploaded_at):
+    head = object_head(key, text, email, uploaded_at)
+    lambda_function.store_cv(BUCKET, key, head, text)
+    return head
+
+
+def fail_after(monkeypatch, name, calls):
+    """Fa fallire la funzione della Lambda dopo `calls` chiamate riuscite."""
+    original = getattr(lambda_function, name)
+    made = []
+
+    def flaky(*args, **kwargs):
+        made.append(name)
+        if len(made) > calls:
+            raise RuntimeError(f"{name} non disponibile")
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(lambda_function, name, flaky)
+
+
+def test_new_cv_is_indexed_and_marked(aws):
+    head = object_head("a.pdf", PYTHON_CV, **ANNA)
+    assert not is_processed("a.pdf", head)
+
+    store("a.pdf", PYTHON_CV, **ANNA)
+
+    assert is_processed("a.pdf", head)
+    item = cv("a.pdf")
+    assert item["indexed_hash"] == item["content_hash"]
+    assert terms_of("a.pdf") == {"python", "developer", "django", "aws", "experience"}
+    assert_index_consistent()
+    assert stats()["version"]["data_version"] == 1
+    assert stats()["user#anna@example.com"]["data_version"] == 1
+
+
+def test_redelivered_event_changes_nothing(aws):
+    store("a.pdf", PYTHON_CV, **ANNA)
+    before = stats()
+
+    store("a.pdf", PYTHON_CV, **ANNA)
+
+    assert stats() == before
+    assert_index_consistent()
+
+
+def test_failure_before_the_marker_is_completed_on_redelivery(aws, monkeypatch):
+    fail_after(monkeypatch, "complete_indexing", 0)
+    with pytest.raises(RuntimeError):
+        store("b.pdf", JAVA_CV, **ANNA)
+
+    # CV scritto e indicizzato, ma non segnato come elaborato
+    head = object_head("b.pdf", JAVA_CV, **ANNA)
+    assert not is_processed("b.pdf", head)
+    assert terms_of("b.pdf")
+    assert not corpus()
+    assert "version" not in stats()
+
+    monkeypatch.undo()
+    store("b.pdf", JAVA_CV, **ANNA)
+
+    assert is_processed("b.pdf", head)
+    assert_index_consistent()
+    assert stats()["version"]["data_version"] == 1
+
+
+def test_partial_postings_are_completed_on_redelivery(aws, monkeypatch):
+    store("a.pdf", PYTHON_CV, **ANNA)
+    # Due termini per transazione: l'errore lascia l'indice a metà
+    monkeypatch.setattr(lambda_function, "TRANSACT_TERMS", 2)
+    fail_after(monkeypatch, "transact", 2)
+    with pytest.raises(RuntimeError):
+        store("b.pdf", JAVA_CV, **ANNA)
+    assert not is_processed("b.pdf", object_head("b.pdf", JAVA_CV, **ANNA))
+
+    monkeypatch.undo()
+    store("b.pdf", JAVA_CV, **ANNA)
+
+    assert len(terms_of("b.pdf")) == 7
+    assert_index_consistent()
+
+
+def test_redelivery_with_postings_missing_from_the_cv_index(aws, monkeypatch):
+    # Posting scritte ma non ancora visibili nel GSI CvIdIndex, che è
+    # eventualmente consistente: le condizioni evitano di contarle due volte
+    monkeypatch.setattr(lambda_function, "TRANSACT_TERMS", 2)
+    fail_after(monkeypatch, "complete_indexing", 0)
+    with pytest.raises(RuntimeError):
+        store("b.pdf", JAVA_CV, **ANNA)
+    monkeypatch.undo()
+
+    monkeypatch.setattr(lambda_function, "indexed_terms", lambda client, cv_id: [])
+    store("b.pdf", JAVA_CV, **ANNA)
+
+    assert is_processed("b.pdf", object_head("b.pdf", JAVA_CV, **ANNA))
+    assert_index_consistent()
+
+
+def test_changed_text_replaces_the_postings(aws):
+    store("a.pdf", PYTHON_CV, **ANNA)
+    store("b.pdf", JAVA_CV, **ANNA)
+
+    store("a.pdf", "Rust developer", email="anna@example.com", uploaded_at="2025-02-01")
+
+    assert terms_of("a.pdf") == {"rust", "developer"}
+    assert "django" not in dfs()
+    assert dfs()["python"] == 1
+    assert corpus()["doc_count"] == 2
+    assert_index_consistent()
+
+
+def test_new_owner_keeps_the_index(aws):
+    store("a.pdf", PYTHON_CV, **ANNA)
+    before = scan("CVTerms")
+
+    store("a.pdf", PYTHON_CV, email="bruno@example.com", uploaded_at="2025-01-01")
+
+    assert scan("CVTerms") == before
+    assert cv("a.pdf")["email"] == "bruno@example.com"
+    assert is_processed(
+        "a.pdf", object_head("a.pdf", PYTHON_CV, "bruno@example.com", "2025-01-01")
+    )
+    # Cambiano gli elenchi di entrambi i proprietari
+    assert stats()["user#anna@example.com"]["data_version"] == 2
+    assert stats()["user#bruno@example.com"]["data_version"] == 1
+    assert_index_consistent()
+
+
+def test_counters_are_split_across_shards_by_cv_id(aws):
+    keys = [f"cv{i}.pdf" for i in range(16)]
+    for key in keys:
+        store(key, PYTHON_CV, **ANNA)
+
+    # Ogni CV aggiorna lo shard scelto dal suo cv_id: i contatori dei
+    # termini comuni e del corpus sono divisi su più item
+    python_shards = [s for s in stats() if unsharded_stat_id(s) == "term#python"]
+    corpus_shards = [s for s in stats() if unsharded_stat_id(s) == CORPUS_STAT_ID]
+    assert len(python_shards) > 1
+    assert len(corpus_shards) > 1
+    assert dfs()["python"] == len(keys)
+    assert_index_consistent()
+
+
+def test_transactions_leave_out_the_version_counters(aws, monkeypatch):
+    written = []
+    original = lambda_function.transact
+
+    def record(client, actions):
+        written.extend(
+            action["Update"]["Key"]["stat_id"]
+            for action in actions
+            if action.get("Update", {}).get("TableName") == "CVStats"
+        )
+        return original(client, actions)
+
+    monkeypatch.setattr(lambda_function, "transact", record)
+    store("a.pdf", PYTHON_CV, **ANNA)
+    store("b.pdf", JAVA_CV, **ANNA)
+
+    # Solo document frequency e aggregati del corpus
+    assert {unsharded_stat_id(stat_id) for stat_id in written} - {CORPUS_STAT_ID} == {
+        f"term#{term}" for term in dfs()
+    }
+    # Versioni incrementate una volta per CV, a indice completato
+    assert stats()["version"]["data_version"] == 2
+    assert stats()["user#anna@example.com"]["data_version"] == 2
+
+
+def test_long_texts_are_uploaded_with_the_lambda_client(aws, monkeypatch):
+    """Il testo che va su S3 usa il client della Lambda, non quello del backend."""
+    monkeypatch.setattr(cv_text, "TEXT_INLINE_LIMIT", 16)
+
+    def backend_client():
+        raise AssertionError("client S3 del backend usato dalla Lambda")
+
+    monkeypatch.setattr(cv_text, "s3_client", backend_client)
+    store("anna.pdf", PYTHON_CV, **ANNA)
+
+    item = cv("anna.pdf")
+    assert "text_z" not in item
+    bucket, key = cv_text.split_s3_uri(item["text_s3_uri"])
+    body = boto3.client("s3").get_object(Bucket=bucket, Key=key)["Body"].read()
+    assert cv_text.decompress_text(body) == PYTHON_CV.lower()
+
+
+def test_stemmed_terms_keep_a_surface_form(aws, monkeypatch):
+    snowballstemmer = pytest.importorskip("snowballstemmer")
+    monkeypatch.setattr(text_processing, "stemmer", snowballstemmer.stemmer("english"))
+    store("anna.pdf", "Engineering Python engines", **ANNA)
+
+    surfaces = {
+        stat_term(stat_id): item.get("surface")
+        for stat_id, item in stats().items()
+        if stat_id.startswith("term#")
+    }
+    # "python" è già una parola intera: nessuna forma da salvare
+    assert surfaces == {"engin": "engines", "python": None}
+    assert_index_consistent()
@@ -0,0 +1,182 @@
+"""
+Estrazione del testo dei CV: layer testuale dei PDF letto con pypdf e OCR di
+Textract (su moto) solo per le pagine scansionate, o per tutto il documento
+se il PDF non è leggibile.
+"""
+
+import io
+
+import pypdf
+import pytest
+from moto.textract.models import TextractBackend
+from reportlab.pdfgen import canvas
+
+import deploy_lambda
+import lambda_function
+import pdf_text
+from conftest import BUCKET, upload
+
+PROFILE = "Python developer with ten years of experience in AWS and Django"
+SKILLS = "Skills: Kubernetes, Terraform, PostgreSQL, Redis and GitHub Actions"
+EDUCATION = "Education: Master degree in Computer Engineering, Politecnico"
+OCR_TEXT = "Scanned reference letter"
+
+
+def make_pdf(*pages):
+    """PDF con una pagina per testo; None produce una pagina scansionata."""
+    output = io.BytesIO()
+    pdf = canvas.Canvas(output)
+    for text in pages:
+        if text is None:
+            # Solo grafica, nessun testo: come l'immagine di una scansione
+            pdf.rect(72, 400, 400, 300, fill=1)
+        else:
+            pdf.drawString(72, 750, text)
+        pdf.showPage()
+    pdf.save()
+    return output.getvalue()
+
+
+def page_count(data):
+    return len(pypdf.PdfReader(io.BytesIO(data)).pages)
+
+
+def test_is_pdf():
+    assert pdf_text.is_pdf(make_pdf(PROFILE))
+    assert not pdf_text.is_pdf(b"")
+    assert not pdf_text.is_pdf(b"\x89PNG\r\n\x1a\n")
+
+
+def test_page_texts():
+    data = make_pdf(PROFILE, None, SKILLS)
+    assert pdf_text.page_texts(data) == [PROFILE, "", SKILLS]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        (PROFILE, True),
+        ("", False),
+        # Poco testo: intestazione di una pagina scansionata
+        ("Curriculum Vitae", False),
+        # Font senza mappa Unicode: caratteri di sostituzione
+        ("�" * 30 + "a" * 45, False),
+    ],
+)
+def test_has_text_layer(text, expected):
+    assert pdf_text.has_text_layer(text) is expected
+
+
+def test_single_page_pdf():
+    data = make_pdf(PROFILE, SKILLS, EDUCATION)
+    page = pdf_text.single_page_pdf(data, 1)
+    assert pdf_text.is_pdf(page)
+    assert pdf_text.page_texts(page) == [SKILLS]
+
+
+@pytest.fixture
+def textract(monkeypatch):
+    """Risposte di Textract su moto e chiamate fatte dalla Lambda."""
+    monkeypatch.setattr(
+        TextractBackend,
+        "BLOCKS",
+        [
+            {"BlockType": "PAGE"},
+            {"BlockType": "LINE", "Text": OCR_TEXT},
+            {"BlockType": "WORD", "Text": "Scanned"},
+        ],
+    )
+    calls = {"ocr_page": [], "detect_text": []}
+
+    def spy(name):
+        original = getattr(lambda_function, name)
+
+        def record(*args, **kwargs):
+            calls[name].append((args, kwargs))
+            return original(*args, **kwargs)
+
+        monkeypatch.setattr(lambda_function, name, record)
+
+    spy("ocr_page")
+    spy("detect_text")
+    return calls
+
+
+def extract(key, body):
+    upload(key, body)
+    head = lambda_function.s3.head_object(Bucket=BUCKET, Key=key)
+    return lambda_function.extract_document_text(BUCKET, key, head)
+
+
+def test_text_layer_needs_no_ocr(aws, textract):
+    text = extract("cv.pdf", make_pdf(PROFILE, SKILLS))
+
+    assert text == f"{PROFILE} {SKILLS}"
+    assert textract == {"ocr_page": [], "detect_text": []}
+
+
+def test_scanned_page_is_sent_to_textract_alone(aws, textract):
+    text = extract("cv.pdf", make_pdf(PROFILE, None, SKILLS))
+
+    # Il testo dell'OCR resta nella posizione della pagina
+    assert text == f"{PROFILE} {OCR_TEXT} {SKILLS}"
+    (page_pdf,), _ = textract["ocr_page"][0]
+    assert len(textract["ocr_page"]) == 1
+    assert page_count(page_pdf) == 1
+    assert pdf_text.page_texts(page_pdf) == [""]
+    assert textract["detect_text"] == []
+
+
+def test_empty_page_pdf_is_read_by_ocr(aws, textract):
+    assert extract("scan.pdf", make_pdf(None)) == OCR_TEXT
+    assert len(textract["ocr_page"]) == 1
+
+
+def test_mostly_scanned_document_goes_to_textract(aws, textract, monkeypatch):
+    monkeypatch.setattr(lambda_function, "OCR_PAGE_LIMIT", 1)
+
+    text = extract("scan.pdf", make_pdf(None, PROFILE, None))
+
+    assert text == OCR_TEXT
+    assert textract["ocr_page"] == []
+    (_, _, _), kwargs = textract["detect_text"][0]
+    assert kwargs == {"multipage": True}
+
+
+def test_mostly_scanned_document_starts_an_async_job(aws, textract, monkeypatch):
+    monkeypatch.setattr(lambda_function, "OCR_PAGE_LIMIT", 1)
+    monkeypatch.setattr(
+        lambda_function, "TEXTRACT_SNS_TOPIC_ARN", deploy_lambda.create_textract_topic()
+    )
+    monkeypatch.setattr(
+        lambda_function,
+        "TEXTRACT_ROLE_ARN",
+        "arn:aws:iam::123456789012:role/cvgram-textract-role",
+    )
+
+    # Il CV verrà scritto alla notifica di completamento del job
+    assert extract("scan.pdf", make_pdf(None, None)) is None
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"",
+        b"\x89PNG\r\n\x1a\n" + bytes(64),
+        # Intestazione PDF ma struttura illeggibile per pypdf
+        b"%PDF-1.7\n" + bytes(range(256)),
+        make_pdf(PROFILE)[:200],
+    ],
+    ids=["empty", "image", "corrupt", "truncated"],
+)
+def test_unreadable_documents_go_to_textract(aws, textract, body):
+    assert extract("cv.pdf", body) == OCR_TEXT
+    assert len(textract["detect_text"]) == 1
+    assert textract["ocr_page"] == []
+
+
+def test_without_pypdf_everything_goes_to_textract(aws, textract, monkeypatch):
+    monkeypatch.setattr(pdf_text, "pypdf", None)
+
+    assert extract("cv.pdf", make_pdf(PROFILE)) == OCR_TEXT
+    assert len(textract["detect_text"]) == 1